@@ -1,14 +1,32 @@
-
 import os
+import tempfile
 import time
 import pandas as pd
 import streamlit as st
-from sqlalchemy import create_engine, text
 from sqlalchemy.engine import Engine
-from contextlib import contextmanager
-import matplotlib.pyplot as plt
-
-st.set_page_config(page_title="Postgres Viewer • Ads Metrics", layout="wide")
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from viewer.adhoc import AdhocQuery
+from viewer.api import ApiContext, main as api_main, start_in_thread
+from viewer.breakdown import BREAKDOWN_COLUMNS, breakdown_sql, drill, ranked, split_levels
+from viewer.buckets import BUCKET_CHOICES, MAX_BUCKETS, pop_change, resolve_bucket
+from viewer.browse import COLUMNS_SQL, FILTER_OPS, SAMPLE_RELKINDS, TABLE_STATS_SQL, ColumnFilter, is_wide, projection, sample_percent, sample_sql
+from viewer.cache import ResultCache, Watermarks, cached_query, engine_ident
+from viewer.charts import downsample, render_line_png
+from viewer.dimensions import OPTION_LIMIT, options_sql
+from viewer.export import EXPORT_FORMATS, export_query
+from viewer.fetch import FETCH_ENGINES, read_df as fetch_df
+from viewer.incremental import IncrementalSeries
+from viewer.instrumentation import QueryMetrics
+from viewer.memory import MemoryBudget
+from viewer.metadata import TABLES_SQL, boot_queries, run_parallel
+from viewer.pagination import KeysetPager
+from viewer.pool import EngineRegistry, PoolSettings, build_url
+from viewer.queries import DETAIL_KEY, DETAIL_NULLABLE, DIMENSION_COLUMNS, METRIC_COLUMNS, AdsFilters, series_sql, detail_sql
+from viewer.rollups import RollupRefresher, route
+from viewer.snapshot import DEFAULT_SOURCES, SnapshotExporter, SnapshotQuery, SnapshotStore, duckdb_available, parse_sources
+from viewer.sql import PRIMARY_KEY_SQL, qualified, quote_ident
+from viewer.warmup import CacheWarmer
 
 # -------------------------------
 # Helpers
@@ -17,30 +35,145 @@ def get_env_default(key: str, fallback: str = "") -> str:
     return os.getenv(key, fallback)
 
 @st.cache_resource(show_spinner=False)
-def make_engine_cached(host, port, db, user, password) -> Engine:
+def get_engine_registry() -> EngineRegistry:
     """
-    Keep a single Engine instance per distinct connection string.
+    One pool per distinct DSN, shared by all sessions (VIEWER_POOL_* and
+    VIEWER_PGBOUNCER configure it).
     """
-    if host and password is None:
-        # small guard for accidental None password in some envs
-        password = ""
-    url = f"postgresql+psycopg2://{user}:{password}@{host}:{port}/{db}"
-    return create_engine(url, pool_pre_ping=True)
+    return EngineRegistry(PoolSettings.from_env())
 
-@contextmanager
-def db_conn(engine: Engine):
-    conn = engine.connect()
-    try:
-        yield conn
-    finally:
-        conn.close()
+def default_fetch_engine() -> str:
+    how = get_env_default("VIEWER_FETCH_ENGINE", FETCH_ENGINES[0])
+    return how if how in FETCH_ENGINES else FETCH_ENGINES[0]
+
+def fetch_engine() -> str:
+    return st.session_state.get("fetch_engine", FETCH_ENGINES[0])
+
+def read_df(engine: Engine, sql: str, params: dict | None = None) -> pd.DataFrame:
+    return fetch_df(engine, sql, params, how=fetch_engine())
+
+def make_fetch(engine: Engine):
+    """
+    Uncached fetch callable that is safe to run on worker threads (the
+    session's fetch engine is resolved here, on the script thread).
+    """
+    how = fetch_engine()
+    return lambda sql, params=None: fetch_df(engine, sql, params, how=how)
+
+@st.cache_resource(show_spinner=False)
+def get_memory_budget() -> MemoryBudget:
+    """
+    VIEWER_MEMORY_MB bounds cached results plus session data for the whole
+    process; VIEWER_SESSION_MB bounds what one session keeps.
+    """
+    return MemoryBudget(
+        max_bytes=int(get_env_default("VIEWER_MEMORY_MB", "1024")) << 20,
+        session_max_bytes=int(get_env_default("VIEWER_SESSION_MB", "128")) << 20,
+    )
+
+@st.cache_resource(show_spinner=False)
+def get_result_cache() -> ResultCache:
+    """
+    One cache per process, shared by all sessions. Set VIEWER_CACHE_DIR to
+    add a Parquet tier shared by every worker process.
+    """
+    cache = ResultCache(
+        max_bytes=int(get_env_default("VIEWER_CACHE_MB", "512")) << 20,
+        disk_dir=get_env_default("VIEWER_CACHE_DIR") or None,
+        disk_max_bytes=int(get_env_default("VIEWER_CACHE_DISK_MB", "2048")) << 20,
+    )
+    get_memory_budget().register("resultados", cache)
+    return cache
+
+@st.cache_resource(show_spinner=False)
+def get_watermarks() -> Watermarks:
+    return Watermarks(interval=float(get_env_default("VIEWER_WATERMARK_S", "10")))
+
+@st.cache_resource(show_spinner=False)
+def get_incremental_series() -> IncrementalSeries:
+    store = IncrementalSeries()
+    get_memory_budget().register("séries", store)
+    return store
+
+@st.cache_resource(show_spinner=False)
+def get_rollup_refresher(ident: str, _engine: Engine) -> RollupRefresher:
+    """
+    One refresher thread per database, shared by all sessions.
+    """
+    return RollupRefresher(_engine, interval=float(get_env_default("VIEWER_ROLLUP_REFRESH_MIN", "15")) * 60)
+
+@st.cache_resource(show_spinner=False)
+def get_cache_warmer(ident: str, _engine: Engine) -> CacheWarmer:
+    """
+    One warming thread per database, shared by all sessions. It warms the
+    fetch engine and series store sessions start with (VIEWER_FETCH_ENGINE,
+    VIEWER_INCREMENTAL) every VIEWER_WARM_S seconds.
+    """
+    incremental = get_env_default("VIEWER_INCREMENTAL", "1") == "1"
+    return CacheWarmer(
+        _engine, get_result_cache(), get_watermarks(),
+        how=default_fetch_engine(),
+        interval=float(get_env_default("VIEWER_WARM_S", "15")),
+        series=get_incremental_series() if incremental else None,
+        restate_days=int(get_env_default("VIEWER_RESTATE_DAYS", "3")),
+        top=int(get_env_default("VIEWER_WARM_TOP", "5")),
+        metrics=get_query_metrics(),
+    )
+
+@st.cache_resource(show_spinner=False)
+def get_snapshot_store(ident: str) -> SnapshotStore:
+    """
+    Parquet snapshot of one database, under VIEWER_SNAPSHOT_DIR.
+    """
+    root = get_env_default("VIEWER_SNAPSHOT_DIR") or os.path.join(tempfile.gettempdir(), "pgviewer-snapshot")
+    return SnapshotStore(os.path.join(root, ResultCache.make_key(ident)[:16]))
+
+@st.cache_resource(show_spinner=False)
+def get_snapshot_exporter(ident: str, _engine: Engine) -> SnapshotExporter:
+    """
+    One export thread per database, every VIEWER_SNAPSHOT_MIN minutes.
+    VIEWER_SNAPSHOT_TABLES adds "schema.table[:date_column]" entries to the
+    Ads view and mv_unified_sales_daily.
+    """
+    return SnapshotExporter(
+        _engine, get_snapshot_store(ident), get_watermarks(),
+        interval=float(get_env_default("VIEWER_SNAPSHOT_MIN", "15")) * 60,
+        sources=DEFAULT_SOURCES + tuple(parse_sources(get_env_default("VIEWER_SNAPSHOT_TABLES"))),
+        restate_days=int(get_env_default("VIEWER_RESTATE_DAYS", "3")),
+    )
+
+@st.cache_resource(show_spinner=False)
+def get_query_metrics() -> QueryMetrics:
+    """
+    Per-fingerprint query statistics for the whole process. VIEWER_METRICS_JSONL
+    and VIEWER_METRICS_PROM opt into a JSON-lines log / Prometheus text file.
+    """
+    return QueryMetrics(
+        jsonl_path=get_env_default("VIEWER_METRICS_JSONL") or None,
+        prom_path=get_env_default("VIEWER_METRICS_PROM") or None,
+    )
+
+def run_query_df(engine: Engine, sql: str, params: dict | None = None,
+                 scope: tuple[str, ...] | None = None) -> pd.DataFrame:
+    """
+    Cached query. `scope` lists the relations the result depends on; without
+    it any write in the database invalidates the entry.
+    """
+    return cached_query(get_result_cache(), get_watermarks(), engine, sql, params, fetch_engine(), scope,
+                        metrics=get_query_metrics())
+
+def query_task(engine: Engine, sql: str, params: dict | None = None,
+               scope: tuple[str, ...] | None = None):
+    """
+    run_query_df as a zero-argument callable for run_parallel.
+    """
+    cache, marks, how, metrics = get_result_cache(), get_watermarks(), fetch_engine(), get_query_metrics()
+    return lambda: cached_query(cache, marks, engine, sql, params, how, scope, metrics=metrics)
 
-# IMPORTANT: ignore the Engine when hashing cache inputs
-@st.cache_data(show_spinner=False, ttl=60)
-def run_query_df(_engine: Engine, sql: str, params: dict | None = None) -> pd.DataFrame:
-    with db_conn(_engine) as conn:
-        df = pd.read_sql(text(sql), conn, params=params)
-    return df
+# Rendered PNGs are keyed by the (downsampled) data, so unchanged series are not redrawn
+@st.cache_data(show_spinner=False, max_entries=256)
+def chart_png(x, y, title: str, xlabel: str, ylabel: str) -> bytes:
+    return render_line_png(x, y, title, xlabel, ylabel)
 
 def success(msg: str):
     st.toast(msg, icon="✅")
@@ -54,11 +187,123 @@ def fmt_num(x):
     except Exception:
         return x
 
-def df_to_csv_download(df: pd.DataFrame, label: str, filename: str):
-    if df.empty:
-        return
-    csv = df.to_csv(index=False).encode("utf-8")
-    st.download_button(label=label, data=csv, file_name=filename, mime="text/csv")
+def account_session() -> dict[str, int]:
+    """
+    Bytes per session_state key, after holding this session to
+    VIEWER_SESSION_MB; the total is reported to the process budget.
+    """
+    ctx = get_script_run_ctx()
+    return get_memory_budget().account(ctx.session_id if ctx else "local", st.session_state)
+
+def get_pager(name: str, **kwargs) -> KeysetPager:
+    """
+    One pager per session and query shape; a new filter set starts a new pager.
+    """
+    pagers = st.session_state.setdefault("pagers", {})
+    ident = repr(sorted(kwargs.items(), key=lambda kv: kv[0]))
+    if name not in pagers or pagers[name][0] != ident:
+        pagers[name] = (ident, KeysetPager(**kwargs))
+        st.session_state[f"{name}_page"] = 1
+    return pagers[name][1]
+
+def paged_table(name: str, pager: KeysetPager, engine: Engine) -> pd.DataFrame:
+    """
+    Render the current page of `pager` with previous/next controls.
+    """
+    page_key = f"{name}_page"
+    st.session_state.setdefault(page_key, 1)
+    page = pager.page(st.session_state[page_key] - 1, make_fetch(engine))
+    is_last = len(page) < pager.page_size
+
+    def _move(step: int):
+        st.session_state[page_key] = max(1, st.session_state[page_key] + step)
+
+    st.dataframe(page, use_container_width=True)
+    b1, b2, b3 = st.columns([1, 1, 4])
+    b1.button("◀ Anterior", key=f"{name}_prev", on_click=_move, args=(-1,),
+              disabled=st.session_state[page_key] <= 1, use_container_width=True)
+    b2.button("Próxima ▶", key=f"{name}_next", on_click=_move, args=(1,),
+              disabled=is_last, use_container_width=True)
+    b3.caption(f"Página {st.session_state[page_key]} • {len(page)} linhas")
+    return page
+
+def export_controls(engine: Engine, sql: str, params: dict | None, basename: str, key: str,
+                    timeout_s: float | None = None, snapshot: SnapshotStore | None = None):
+    """
+    Export the full result of `sql` via COPY into a temp file (from the
+    local `snapshot` instead, when given), then offer it for download. The
+    file is only produced when the user asks for it.
+    """
+    c1, c2, c3 = st.columns([1, 1, 2])
+    fmt = c1.selectbox("Formato", list(EXPORT_FORMATS), key=f"{key}_fmt", label_visibility="collapsed")
+    if c2.button("📦 Exportar", key=f"{key}_export", use_container_width=True):
+        try:
+            with st.spinner("Exportando..."):
+                path = snapshot.export(sql, fmt) if snapshot else export_query(engine, sql, params, fmt, timeout_s)
+                st.session_state[key] = (path, fmt)
+        except Exception as e:
+            st.session_state.pop(key, None)
+            st.error(f"Erro na exportação: {e}")
+    exported = st.session_state.get(key)
+    if exported and os.path.exists(exported[0]):
+        path, fmt = exported
+        mime, ext = EXPORT_FORMATS[fmt]
+        with open(path, "rb") as f:
+            c3.download_button(label=f"⬇️ Baixar {ext} ({os.path.getsize(path) / 1e6:.1f} MB)", data=f,
+                               file_name=f"{basename}{ext}", mime=mime, key=f"{key}_download")
+
+# -------------------------------
+# Headless API (viewer.api)
+# -------------------------------
+def api_dsn() -> str | None:
+    """
+    DSN the API serves: DATABASE_URL, else the DB_* variables.
+    """
+    if get_env_default("DATABASE_URL"):
+        return get_env_default("DATABASE_URL")
+    if get_env_default("DB_NAME"):
+        return build_url(get_env_default("DB_HOST", "localhost"), get_env_default("DB_PORT", "5432"),
+                         get_env_default("DB_NAME"), get_env_default("DB_USER"),
+                         get_env_default("DB_PASSWORD")).render_as_string(hide_password=False)
+    return None
+
+def api_context(dsn: str) -> ApiContext:
+    """
+    The process-wide pool, caches and budget, as the API sees them. The
+    cache warmer starts for the API's database as it would for a session.
+    """
+    engine = get_engine_registry().get(dsn)
+    get_query_metrics().instrument(engine)
+    if get_env_default("VIEWER_WARM", "1") == "1":
+        get_cache_warmer(engine_ident(engine), engine)
+    incremental = get_env_default("VIEWER_INCREMENTAL", "1") == "1"
+    return ApiContext(
+        engine, get_result_cache(), get_watermarks(),
+        how=default_fetch_engine(),
+        series=get_incremental_series() if incremental else None,
+        restate_days=int(get_env_default("VIEWER_RESTATE_DAYS", "3")),
+        metrics=get_query_metrics(),
+        budget=get_memory_budget(),
+        cors_origin=get_env_default("VIEWER_API_CORS") or None,
+    )
+
+@st.cache_resource(show_spinner=False)
+def get_api_server(dsn: str, host: str, port: int):
+    """
+    VIEWER_API_PORT also serves the API from the Streamlit process, over
+    the same pool and caches as the dashboard.
+    """
+    return start_in_thread(api_context(dsn), host, port)
+
+if __name__ == "__main__" and get_script_run_ctx(suppress_warning=True) is None:
+    # `python app.py [--host H] [--port P]`: the API alone, without the Streamlit UI
+    api_main(api_context, api_dsn())
+    raise SystemExit(0)
+
+st.set_page_config(page_title="Postgres Viewer • Ads Metrics", layout="wide")
+
+if get_env_default("VIEWER_API_PORT") and api_dsn():
+    get_api_server(api_dsn(), get_env_default("VIEWER_API_HOST", "127.0.0.1"), int(get_env_default("VIEWER_API_PORT")))
 
 # -------------------------------
 # Sidebar • Connection
@@ -80,16 +325,38 @@ with st.sidebar:
         pwd  = st.text_input("Senha", type="password", value=get_env_default("DB_PASSWORD", ""))
         connect_btn = st.button("Conectar", type="primary", use_container_width=True)
 
+    st.radio("Motor de leitura", FETCH_ENGINES, horizontal=True, key="fetch_engine",
+             index=FETCH_ENGINES.index(default_fetch_engine()),
+             help="arrow: cursor no servidor em lotes, DataFrame com tipos Arrow. pandas: pd.read_sql.")
+
+    st.checkbox("Atualização incremental (Ads)", key="incremental",
+                value=get_env_default("VIEWER_INCREMENTAL", "1") == "1",
+                help="Mantém a série já carregada e consulta apenas os dias mais recentes quando os dados mudam.")
+    st.number_input("Janela de reprocessamento (dias)", min_value=0, max_value=60, key="restate_days",
+                    value=int(get_env_default("VIEWER_RESTATE_DAYS", "3")),
+                    help="Dias finais reconsultados a cada atualização (atribuição tardia).")
+
+    with st.expander("Cache de resultados"):
+        cache_info = get_result_cache().summary()
+        lookups = cache_info["hits"] + cache_info["disk_hits"] + cache_info["misses"]
+        st.caption(f"{cache_info['entries']} entradas • {cache_info['bytes'] / 1e6:.1f} / "
+                   f"{cache_info['max_bytes'] / 1e6:.0f} MB • hit rate "
+                   f"{(cache_info['hits'] + cache_info['disk_hits']) / lookups * 100 if lookups else 0:.0f}%")
+        st.json({k: cache_info[k] for k in ("hits", "disk_hits", "misses", "stale", "evictions", "stores")})
+        if st.button("Limpar cache", use_container_width=True):
+            get_result_cache().clear()
+            get_incremental_series().clear()
+
 if "engine" not in st.session_state:
     st.session_state.engine = None
 
 if connect_btn:
     try:
-        if 'use_dburl' in locals() and use_dburl:
-            # Parse DATABASE_URL minimally (Streamlit keeps the engine cached by URL)
-            st.session_state.engine = create_engine(dburl, pool_pre_ping=True)
+        if use_dburl:
+            st.session_state.engine = get_engine_registry().get(dburl)
         else:
-            st.session_state.engine = make_engine_cached(host, port, db, user, pwd)
+            st.session_state.engine = get_engine_registry().get(build_url(host, port, db, user, pwd))
+        get_query_metrics().instrument(st.session_state.engine)
         # simple ping (no cache to avoid masking connection issues)
         with st.session_state.engine.connect() as conn:
             conn.exec_driver_sql("SELECT 1;")
@@ -104,30 +371,273 @@ if engine is None:
             "Você também pode definir `DATABASE_URL` ou as variáveis: DB_HOST, DB_PORT, DB_NAME, DB_USER, DB_PASSWORD.")
     st.stop()
 
+with st.sidebar.expander("Rollups materializados (Ads)"):
+    st.caption("Agregados por dia×campanha×ASIN, dia×campanha e dia. As consultas da aba de Ads "
+               "usam o rollup mais agregado que atende aos filtros.")
+    if st.button("Criar/atualizar rollups", use_container_width=True):
+        get_rollup_refresher(engine_ident(engine), engine).refresh_now()
+        st.session_state.rollups_started = True
+    if get_env_default("VIEWER_ROLLUPS", "0") == "1" or st.session_state.get("rollups_started"):
+        refresher = get_rollup_refresher(engine_ident(engine), engine)
+        if refresher.last_error:
+            st.error(refresher.last_error)
+        elif refresher.last_refresh:
+            st.caption(f"Última atualização: {time.strftime('%H:%M:%S', time.localtime(refresher.last_refresh))} "
+                       f"({refresher.last_duration:.1f}s)")
+
+if get_env_default("VIEWER_WARM", "1") == "1":
+    with st.sidebar.expander("Pré-aquecimento do cache"):
+        st.caption("Recalcula em segundo plano as consultas da aba de Ads para o período completo, os últimos "
+                   "7/30/90 dias e as campanhas com maior spend, antes que alguém as peça.")
+        warmer = get_cache_warmer(engine_ident(engine), engine)
+        if st.button("Aquecer agora", use_container_width=True):
+            warmer.warm_now()
+        if warmer.last_error:
+            st.error(warmer.last_error)
+        elif warmer.last_pass:
+            st.caption(f"Última passada: {time.strftime('%H:%M:%S', time.localtime(warmer.last_pass))} "
+                       f"({warmer.last_duration:.1f}s) • {warmer.targets} combinações • "
+                       f"{warmer.last_recomputed} recalculadas")
+
+with st.sidebar.expander("Snapshot local (DuckDB)"):
+    st.caption("Cópia em Parquet, por mês, da view de Ads, de mv_unified_sales_daily e das tabelas em "
+               "VIEWER_SNAPSHOT_TABLES. Só os meses recentes são relidos; a aba de SQL pode consultá-la com "
+               "DuckDB sem carregar o Postgres.")
+    s1, s2 = st.columns(2)
+    if s1.button("Exportar agora", use_container_width=True):
+        get_snapshot_exporter(engine_ident(engine), engine).export_now()
+        st.session_state.snapshot_started = True
+    if s2.button("Reexportar tudo", use_container_width=True):
+        get_snapshot_exporter(engine_ident(engine), engine).export_now(full=True)
+        st.session_state.snapshot_started = True
+    if get_env_default("VIEWER_SNAPSHOT", "0") == "1" or st.session_state.get("snapshot_started"):
+        exporter = get_snapshot_exporter(engine_ident(engine), engine)
+        if exporter.last_error:
+            st.error(exporter.last_error)
+        elif exporter.last_export:
+            st.caption(f"Última exportação: {time.strftime('%H:%M:%S', time.localtime(exporter.last_export))} "
+                       f"({exporter.last_duration:.1f}s) • "
+                       + (f"{fmt_num(exporter.last_rows)} linhas gravadas" if exporter.last_rows else "sem mudanças"))
+    snapshot_info = get_snapshot_store(engine_ident(engine)).summary()
+    if not snapshot_info.empty:
+        st.dataframe(snapshot_info, use_container_width=True, hide_index=True)
+
+def diagnostics_panel():
+    metrics = get_query_metrics()
+    pool = metrics.pool_summary()
+    for pool_info in get_engine_registry().summary():
+        st.caption(f"Pool `{pool_info['dsn']}`: {pool_info['pool']}")
+        if pool_info["liveness_error"]:
+            st.caption(f"⚠️ Verificação de conexões: {pool_info['liveness_error']}")
+    st.caption(f"Checkouts: {pool['checkouts']} • espera p50 {pool['wait_p50_ms']} ms • "
+               f"p95 {pool['wait_p95_ms']} ms • máx {pool['wait_max_ms']} ms")
+    st.dataframe(metrics.snapshot(), use_container_width=True, hide_index=True)
+    col_a, col_b = st.columns(2)
+    col_a.button("Atualizar", key="diag_refresh", use_container_width=True)
+    if col_b.button("Zerar", key="diag_reset", use_container_width=True):
+        metrics.reset()
+    st.download_button("Exportar (Prometheus)", metrics.prometheus_text(), file_name="pgviewer_metrics.prom",
+                       mime="text/plain", use_container_width=True)
+
+def memory_panel():
+    budget = get_memory_budget().summary()
+    st.caption(f"Orçamento: {budget['used'] / 1e6:.1f} / {budget['max_bytes'] / 1e6:.0f} MB • "
+               f"{budget['sessions']} sessões ({budget['session_bytes'] / 1e6:.1f} MB) • "
+               f"{budget['evictions']} remoções ({budget['evicted_bytes'] / 1e6:.1f} MB)")
+    st.caption(" • ".join(f"{name}: {nbytes / 1e6:.1f} MB" for name, nbytes in budget["stores"].items()))
+    usage = account_session()
+    st.caption(f"Esta sessão: {sum(usage.values()) / 1e6:.1f} / {budget['session_max_bytes'] / 1e6:.0f} MB")
+    if usage:
+        st.dataframe(pd.DataFrame({"chave": list(usage), "mb": [round(b / 1e6, 3) for b in usage.values()]}),
+                     use_container_width=True, hide_index=True)
+    st.caption("Maiores entradas do cache")
+    st.dataframe(get_result_cache().entries().head(20), use_container_width=True, hide_index=True)
+    st.button("Atualizar", key="memory_refresh", use_container_width=True)
+
+with st.sidebar.expander("Memória"):
+    st.caption("Resultados compactados após a leitura (categorias, inteiros/decimais menores quando sem perda). "
+               "Acima do orçamento, os resultados usados há mais tempo são descartados.")
+    st.experimental_fragment(memory_panel)()
+
+with st.sidebar.expander("Diagnóstico de consultas"):
+    st.caption("Latência por consulta normalizada (exec: driver; fetch: leitura completa em cache miss), "
+               "linhas, tamanho e acertos de cache.")
+    st.experimental_fragment(diagnostics_panel)()
+
+# -------------------------------
+# Bootstrap • independent lookups issued concurrently
+# -------------------------------
+boot_schema = st.session_state.get("browse_schema", "public")
+boot = run_parallel({name: query_task(engine, *query) for name, query in boot_queries(boot_schema).items()})
+available_rollups = set() if isinstance(boot["rollups"], Exception) else set(boot["rollups"]["name"])
+has_trigram = not isinstance(boot["trgm"], Exception) and bool(boot["trgm"].iloc[0]["trgm"])
+
 # -------------------------------
 # Tabs
+# Each tab is a fragment: its widgets rerun only that tab. Inside Tab 1 the
+# series, breakdown and detail sections are fragments of their own, fed by
+# the frames the tab fetched, so sorting, drilling, re-bucketing or paging
+# does not re-run the filter lookups or the other sections.
 # -------------------------------
 tab1, tab2, tab3 = st.tabs(["📊 Métricas de Ads (SP)", "🧭 Navegar Tabelas", "🧪 SQL Livre"])
 
 # -------------------------------
 # Tab 1 • Ads Metrics (vw_sp_campaign_metrics_per_product)
 # -------------------------------
-with tab1:
+BUCKET_LABELS = {"auto": "Automático", "day": "Dia", "week": "Semana", "month": "Mês"}
+PER_UNIT = {"day": "dia", "week": "semana", "month": "mês"}
+METRIC_CONFIG = {
+    "impressions": st.column_config.NumberColumn("Impressions", format="%d"),
+    "clicks": st.column_config.NumberColumn("Clicks", format="%d"),
+    "conv_14d": st.column_config.NumberColumn("Conv 14d", format="%d"),
+    "spend": st.column_config.NumberColumn("Spend", format="$%.2f"),
+    "sales_14d": st.column_config.NumberColumn("Sales 14d", format="$%.2f"),
+    "ctr": st.column_config.NumberColumn("CTR", format="%.2f%%"),
+    "cpc": st.column_config.NumberColumn("CPC", format="$%.2f"),
+    "acos": st.column_config.NumberColumn("ACOS", format="%.2f%%"),
+    "roas": st.column_config.NumberColumn("ROAS", format="%.2fx"),
+    "cvr": st.column_config.NumberColumn("CVR", format="%.2f%%"),
+}
+
+def ads_series(engine: Engine, filters: AdsFilters, relation: str, unit: str):
+    """
+    Zero-argument callable for the filtered series in `unit` buckets, from
+    the incremental store when enabled. Safe to run on worker threads.
+    """
+    if st.session_state.incremental:
+        store, marks, restate, fetch = (get_incremental_series(), get_watermarks(),
+                                        int(st.session_state.restate_days), make_fetch(engine))
+        return lambda: store.get(engine_ident(engine), filters, fetch, marks.get(engine, (relation,)), restate,
+                                 relation, unit)
+    task = query_task(engine, *series_sql(filters, relation, unit), scope=(relation,))
+
+    def run():
+        df = task()
+        df["date"] = pd.to_datetime(df["date"])
+        return df
+    return run
+
+def ads_pager(filters: AdsFilters, relation: str) -> KeysetPager:
+    where_sql, where_params = filters.where()
+    return get_pager(
+        "ads_detail",
+        relation=relation,
+        key=DETAIL_KEY,
+        nullable=DETAIL_NULLABLE,
+        columns=", ".join(DIMENSION_COLUMNS + METRIC_COLUMNS),
+        where=where_sql,
+        params=where_params,
+        page_size=st.session_state.get("ads_page_size", 500),
+    )
+
+def ads_kpis(total: pd.Series, breakdown_rel: str, series_rel: str):
+    k1, k2, k3, k4, k5, k6 = st.columns(6)
+    k1.metric("Impressions", fmt_num(total["impressions"]))
+    k2.metric("Clicks", fmt_num(total["clicks"]), f"{total['ctr']:.2f}% CTR")
+    k3.metric("Spend", f"${total['spend']:,.2f}", f"CPC ${total['cpc']:,.2f}", delta_color="off")
+    k4.metric("Sales 14d", f"${total['sales_14d']:,.2f}")
+    k5.metric("Conv 14d", fmt_num(total["conv_14d"]), f"{total['cvr']:.2f}% CVR")
+    k6.metric("ROAS", f"{total['roas']:.2f}x", f"ACOS {total['acos']:.2f}%")
+    st.caption(f"Fonte: `{breakdown_rel}` (totais e detalhamento) • `{series_rel}` (séries)")
+
+def ads_series_section(engine: Engine, filters: AdsFilters, relation: str, bounds: tuple, prefetched: dict):
+    """
+    Charts, period-over-period and the series export. Changing the bucket
+    reruns only this section; `prefetched` maps unit -> series already
+    fetched with the tab's queries.
+    """
+    st.divider()
+    st.subheader("Séries temporais")
+    bucket_choice = st.selectbox("Agrupamento", BUCKET_CHOICES, key="ads_bucket", format_func=BUCKET_LABELS.get,
+                                 help=f"Automático: a menor unidade com até {MAX_BUCKETS} pontos no período.")
+    # An open-ended period spans the data's own bounds
+    unit, coarsened = resolve_bucket(filters.dstart or bounds[0], filters.dend or bounds[1], bucket_choice)
+    agg = prefetched[unit] if unit in prefetched else ads_series(engine, filters, relation, unit)()
+    per = PER_UNIT[unit]
+    st.caption(f"{len(agg)} pontos por {per}" + (f" • {BUCKET_LABELS[bucket_choice]} excederia {MAX_BUCKETS} "
+                                                f"pontos neste período" if coarsened else ""))
+
+    # Period over period: last bucket against the one before, per-day averages (edge buckets can be partial)
+    if len(agg) >= 2:
+        p1, p2, p3 = st.columns(3)
+        last = agg.iloc[-1]
+        for col, column, label, money in ((p1, "spend", "Spend", True), (p2, "sales_14d", "Sales 14d", True),
+                                          (p3, "clicks", "Clicks", False)):
+            change = pop_change(agg.iloc[[-1]], column).iloc[0]
+            value = f"${last[column]:,.2f}" if money else fmt_num(last[column])
+            col.metric(f"{label} • {per} de {pd.Timestamp(last['date']):%d/%m/%Y}", value,
+                       None if pd.isna(change) else f"{change:+.1f}% vs {per} anterior")
+        with st.expander(f"Variação por {per}"):
+            pop = agg[["date", "days"]].copy()
+            for column in ("spend", "sales_14d", "clicks"):
+                pop[column] = agg[column]
+                pop[f"{column} Δ%"] = pop_change(agg, column)
+            st.dataframe(pop, use_container_width=True, hide_index=True)
+
+    for column, label in (("spend", "Spend"), ("sales_14d", "Sales 14d"), ("clicks", "Clicks")):
+        x, y = downsample(agg["date"], agg[column])
+        st.image(chart_png(x, y, f"{label} por {per}", BUCKET_LABELS[unit], label), use_column_width=True)
+
+    st.caption(f"Exportar série por {per}")
+    export_q, export_params = series_sql(filters, relation, unit)
+    export_controls(engine, export_q, export_params, f"ads_metrics_by_{unit}", f"ads_export_{unit}")
+
+def ads_breakdown_section(levels: dict):
+    """
+    Campaign / ASIN tables. Levels, sort order and drill-down all come from
+    the breakdown frame: no queries.
+    """
+    st.divider()
+    st.subheader("Detalhamento por campanha / ASIN")
+    d1, d2, d3, d4 = st.columns([1, 1, 0.7, 1])
+    level = d1.radio("Nível", ["campaign", "asin"], horizontal=True, key="ads_level",
+                     format_func={"campaign": "Campanhas", "asin": "ASINs"}.get)
+    sort_labels = {"roas": "ROAS", "acos": "ACOS", "spend": "Spend", "sales_14d": "Sales 14d", "ctr": "CTR",
+                   "cvr": "CVR", "cpc": "CPC", "clicks": "Clicks", "impressions": "Impressions",
+                   "conv_14d": "Conv 14d"}
+    sort_by = d2.selectbox("Ordenar por", list(sort_labels), key="ads_sort_by", format_func=sort_labels.get)
+    ascending = d3.toggle("Crescente", key="ads_sort_asc")
+    min_spend = d4.number_input("Spend mínimo ($)", min_value=0.0, value=0.0, step=10.0, key="ads_min_spend",
+                                help="Ignora linhas com spend abaixo do valor ao ordenar por razões.")
+    dim = "campaign_name" if level == "campaign" else "advertised_asin"
+    table = ranked(levels[level], sort_by, ascending, min_spend)
+    st.dataframe(table.drop(columns="n_rows"), use_container_width=True, hide_index=True,
+                 column_config=METRIC_CONFIG)
+    st.caption(f"{len(table)} de {len(levels[level])} {'campanhas' if level == 'campaign' else 'ASINs'}")
+
+    if not table.empty:
+        parent = st.selectbox(f"Abrir {'campanha' if level == 'campaign' else 'ASIN'}", table[dim].tolist(),
+                              key=f"ads_drill_{level}")
+        children = ranked(drill(levels, level, parent), sort_by, ascending)
+        st.dataframe(children.drop(columns="n_rows"), use_container_width=True, hide_index=True,
+                     column_config=METRIC_CONFIG)
+
+def ads_detail_section(engine: Engine, filters: AdsFilters, relation: str):
+    """
+    Product-level rows, only fetched when the table is requested, and the
+    detail export. Paging reruns only this section.
+    """
+    st.divider()
+    st.subheader("Tabela detalhada")
+    if st.toggle("Mostrar tabela detalhada", value=False, key="ads_show_detail"):
+        st.selectbox("Linhas por página", [100, 500, 1000], index=1, key="ads_page_size")
+        paged_table("ads_detail", ads_pager(filters, relation), engine)
+    detail_q, detail_params = detail_sql(filters, relation)
+    export_controls(engine, detail_q, detail_params, "ads_metrics_filtered", "ads_export")
+
+def ads_tab(engine: Engine, boot: dict, available_rollups: set[str], has_trigram: bool):
+    """
+    Filters, the Tab 1 queries and the KPI cards; reruns whenever a filter
+    changes. Nothing is rendered here after the first section fragment.
+    """
     st.subheader("Sponsored Products • Campaign Metrics per Product")
 
     # Detecta view
-    exists_sql = """
-    SELECT EXISTS (
-        SELECT 1 FROM information_schema.views
-        WHERE table_schema = 'public' AND table_name = 'vw_sp_campaign_metrics_per_product'
-    ) AS exists_view;
-    """
-    try:
-        ex_df = run_query_df(engine, exists_sql)
-        has_view = bool(ex_df.iloc[0]["exists_view"])
-    except Exception as e:
+    if isinstance(boot["exists"], Exception):
         has_view = False
-        st.error(f"Erro verificando a view: {e}")
+        st.error(f"Erro verificando a view: {boot['exists']}")
+    else:
+        has_view = bool(boot["exists"].iloc[0]["exists_view"])
 
     if not has_view:
         st.warning("View `public.vw_sp_campaign_metrics_per_product` não encontrada. "
@@ -148,168 +658,304 @@ SELECT
 FROM ads_sp_advertised_product_daily
 GROUP BY 1,2,3,4,5;
         """, language="sql")
-        st.stop()
+        return
 
     # Filtros dinâmicos
-    meta_sql = """
-    SELECT
-      MIN(date) AS min_date,
-      MAX(date) AS max_date
-    FROM public.vw_sp_campaign_metrics_per_product;
-    """
-    md = run_query_df(engine, meta_sql)
+    if isinstance(boot["ads_meta"], Exception):
+        raise boot["ads_meta"]
+    md = boot["ads_meta"]
     min_d = pd.to_datetime(md.iloc[0]["min_date"]) if not md.empty else None
     max_d = pd.to_datetime(md.iloc[0]["max_date"]) if not md.empty else None
 
-    # Listas
-    campaigns = run_query_df(engine, "SELECT DISTINCT campaign_name FROM public.vw_sp_campaign_metrics_per_product ORDER BY 1;")["campaign_name"].tolist()
-    asins = run_query_df(engine, "SELECT DISTINCT advertised_asin FROM public.vw_sp_campaign_metrics_per_product ORDER BY 1;")["advertised_asin"].tolist()
-
     c1, c2, c3 = st.columns([1.2, 1, 1])
     with c1:
         if min_d is not None and max_d is not None:
             date_range = st.date_input("Período", value=(min_d.date(), max_d.date()))
         else:
             date_range = st.date_input("Período")
-    with c2:
-        sel_campaigns = st.multiselect("Campaign(s)", campaigns, default=[])
-    with c3:
-        sel_asins = st.multiselect("ASIN(s)", asins, default=[])
 
-    params = {}
-    where = ["1=1"]
     if isinstance(date_range, tuple) and len(date_range) == 2 and date_range[0] and date_range[1]:
-        where.append("date BETWEEN :dstart AND :dend")
-        params["dstart"] = str(date_range[0])
-        params["dend"] = str(date_range[1])
-    if sel_campaigns:
-        where.append("campaign_name = ANY(:camps)")
-        params["camps"] = sel_campaigns
-    if sel_asins:
-        where.append("advertised_asin = ANY(:asins)")
-        params["asins"] = sel_asins
-
-    base_sql = f"""
-    SELECT date, campaign_id, campaign_name, advertised_asin, advertised_sku,
-           impressions, clicks, spend, sales_14d, conv_14d
-    FROM public.vw_sp_campaign_metrics_per_product
-    WHERE {' AND '.join(where)}
-    ORDER BY date ASC;
-    """
-    data = run_query_df(engine, base_sql, params)
-
-    if data.empty:
-        st.info("Sem dados para os filtros selecionados.")
+        dstart, dend = str(date_range[0]), str(date_range[1])
     else:
-        # KPIs
-        k1, k2, k3, k4, k5, k6 = st.columns(6)
-        impressions = int(data["impressions"].sum())
-        clicks = int(data["clicks"].sum())
-        spend = float(data["spend"].sum())
-        sales = float(data["sales_14d"].sum())
-        conv = float(data["conv_14d"].sum())
-        ctr = (clicks / impressions * 100) if impressions else 0.0
-        cpc = (spend / clicks) if clicks else 0.0
-        acos = (spend / sales * 100) if sales else 0.0
-        roas = (sales / spend) if spend else 0.0
-
-        k1.metric("Impressions", fmt_num(impressions))
-        k2.metric("Clicks", fmt_num(clicks), f"{ctr:.2f}% CTR")
-        k3.metric("Spend", f"${spend:,.2f}")
-        k4.metric("Sales 14d", f"${sales:,.2f}")
-        k5.metric("Conv 14d", fmt_num(conv))
-        k6.metric("ROAS", f"{roas:.2f}x", f"ACOS {acos:.2f}%")
-
-        st.divider()
-        st.subheader("Séries temporais")
-
-        data["date"] = pd.to_datetime(data["date"])
-        agg = data.groupby("date", as_index=False).agg({
-            "impressions": "sum",
-            "clicks": "sum",
-            "spend": "sum",
-            "sales_14d": "sum",
-            "conv_14d": "sum"
-        })
-
-        # Plot: Spend
-        fig1 = plt.figure()
-        plt.plot(agg["date"], agg["spend"])
-        plt.title("Spend por dia")
-        plt.xlabel("Data")
-        plt.ylabel("Spend")
-        st.pyplot(fig1, clear_figure=True)
-
-        # Plot: Sales
-        fig2 = plt.figure()
-        plt.plot(agg["date"], agg["sales_14d"])
-        plt.title("Sales 14d por dia")
-        plt.xlabel("Data")
-        plt.ylabel("Sales 14d")
-        st.pyplot(fig2, clear_figure=True)
-
-        # Plot: Clicks
-        fig3 = plt.figure()
-        plt.plot(agg["date"], agg["clicks"])
-        plt.title("Clicks por dia")
-        plt.xlabel("Data")
-        plt.ylabel("Clicks")
-        st.pyplot(fig3, clear_figure=True)
-
-        st.divider()
-        st.subheader("Tabela detalhada")
-        st.dataframe(data, use_container_width=True)
-        df_to_csv_download(data, "⬇️ Baixar CSV (filtros atuais)", "ads_metrics_filtered.csv")
+        dstart = dend = None
+
+    # Filter options are searched, scoped by the period and by the other filter's selection
+    picked_campaigns = tuple(st.session_state.get("sel_campaigns", ()))
+    picked_asins = tuple(st.session_state.get("sel_asins", ()))
+    option_queries = {
+        "campaign_name": options_sql("campaign_name", AdsFilters(dstart, dend, (), picked_asins),
+                                     st.session_state.get("campaign_q", ""), available_rollups, has_trigram),
+        "advertised_asin": options_sql("advertised_asin", AdsFilters(dstart, dend, picked_campaigns, ()),
+                                       st.session_state.get("asin_q", ""), available_rollups, has_trigram),
+    }
+    options = run_parallel({col: query_task(engine, sql, params, scope=(source,))
+                            for col, (sql, params, source) in option_queries.items()})
+    for r in options.values():
+        if isinstance(r, Exception):
+            raise r
+
+    def option_list(picked: tuple, found: pd.DataFrame) -> list:
+        return list(dict.fromkeys([*picked, *found["value"].tolist()]))
+
+    match_help = f"Até {OPTION_LIMIT} opções por {'trecho' if has_trigram else 'prefixo'}, ordenadas por spend."
+    with c2:
+        st.text_input("Buscar campanha", key="campaign_q", placeholder="digite para buscar", help=match_help)
+        sel_campaigns = st.multiselect("Campaign(s)", option_list(picked_campaigns, options["campaign_name"]),
+                                       key="sel_campaigns")
+    with c3:
+        st.text_input("Buscar ASIN", key="asin_q", placeholder="digite para buscar", help=match_help)
+        sel_asins = st.multiselect("ASIN(s)", option_list(picked_asins, options["advertised_asin"]),
+                                   key="sel_asins")
+
+    filters = AdsFilters(dstart, dend, tuple(sel_campaigns), tuple(sel_asins))
+    bounds = (min_d, max_d)
+    # The bucket widget renders in the series section; its last value picks the series prefetched here
+    unit, _ = resolve_bucket(dstart or min_d, dend or max_d, st.session_state.get("ads_bucket", "auto"))
+
+    # Each query reads the coarsest rollup that can answer it
+    breakdown_rel = route(filters, BREAKDOWN_COLUMNS, available_rollups)
+    series_rel = route(filters, {"date"}, available_rollups)
+    detail_rel = route(filters, set(DIMENSION_COLUMNS), available_rollups)
+
+    # KPIs, series and the visible detail page are independent: fetch them together.
+    # Totals and every drill-down level come from one GROUPING SETS scan.
+    tasks = {
+        "breakdown": query_task(engine, *breakdown_sql(filters, breakdown_rel), scope=(breakdown_rel,)),
+        "series": ads_series(engine, filters, series_rel, unit),
+    }
+    if st.session_state.get("ads_show_detail", False):
+        pager, fetch = ads_pager(filters, detail_rel), make_fetch(engine)
+        page_n = st.session_state["ads_detail_page"] - 1
+        tasks["detail"] = lambda: pager.page(page_n, fetch)
+
+    results = run_parallel(tasks)
+    for r in results.values():
+        if isinstance(r, Exception):
+            raise r
+
+    levels = split_levels(results["breakdown"])
+    if levels["total"].empty or int(levels["total"].iloc[0]["n_rows"]) == 0:
+        st.info("Sem dados para os filtros selecionados.")
+        return
+
+    ads_kpis(levels["total"].iloc[0], breakdown_rel, series_rel)
+    st.experimental_fragment(ads_series_section)(engine, filters, series_rel, bounds, {unit: results["series"]})
+    st.experimental_fragment(ads_breakdown_section)(levels)
+    st.experimental_fragment(ads_detail_section)(engine, filters, detail_rel)
+
+with tab1:
+    st.experimental_fragment(ads_tab)(engine, boot, available_rollups, has_trigram)
 
 # -------------------------------
 # Tab 2 • Browser
 # -------------------------------
-with tab2:
+def browse_tab(engine: Engine, boot: dict, boot_schema: str):
     st.subheader("Explorar tabelas")
 
-    schemas = run_query_df(engine, """
-        SELECT nspname AS schema_name
-        FROM pg_namespace
-        WHERE nspname NOT IN ('pg_catalog','information_schema')
-        ORDER BY 1;
-    """)["schema_name"].tolist()
+    if isinstance(boot["schemas"], Exception):
+        raise boot["schemas"]
+    schemas = boot["schemas"]["schema_name"].tolist()
 
     col1, col2 = st.columns(2)
     with col1:
-        schema = st.selectbox("Schema", schemas, index=schemas.index("public") if "public" in schemas else 0)
-        tables = run_query_df(engine, """
-            SELECT tablename FROM pg_tables WHERE schemaname = :s ORDER BY 1;
-        """, {"s": schema})["tablename"].tolist()
+        schema = st.selectbox("Schema", schemas, index=schemas.index("public") if "public" in schemas else 0,
+                              key="browse_schema")
+        prefetched = boot["tables"]
+        if schema != boot_schema or isinstance(prefetched, Exception):
+            prefetched = run_query_df(engine, TABLES_SQL, {"s": schema})
+        tables = prefetched["tablename"].tolist()
     with col2:
         table = st.selectbox("Tabela", tables if tables else ["(nenhuma)"])
 
-    limit = st.number_input("Limite", min_value=10, max_value=100000, value=1000, step=50)
+    page_size = st.selectbox("Linhas por página", [100, 500, 1000, 5000], index=2, key="browse_page_size")
 
     if tables and table and table != "(nenhuma)":
         try:
-            preview_sql = f'SELECT * FROM "{schema}"."{table}" LIMIT :lim;'
-            preview = run_query_df(engine, preview_sql, {"lim": int(limit)})
-            st.dataframe(preview, use_container_width=True)
-            df_to_csv_download(preview, "⬇️ Baixar CSV", f"{schema}.{table}.csv")
+            rel = qualified(schema, table)
+            meta = run_parallel({
+                "stats": query_task(engine, TABLE_STATS_SQL, {"rel": rel}),
+                "columns": query_task(engine, COLUMNS_SQL, {"rel": rel}),
+                "pk": query_task(engine, PRIMARY_KEY_SQL, {"rel": rel}),
+            })
+            for result in meta.values():
+                if isinstance(result, Exception):
+                    raise result
+            stats = meta["stats"].iloc[0]
+            columns = {c["column_name"]: c for c in meta["columns"].to_dict("records")}
+            pk = meta["pk"]["column_name"].tolist()
+            row_estimate = None if pd.isna(stats["row_estimate"]) else int(stats["row_estimate"])
+
+            # Catalog statistics only: no COUNT(*)
+            m1, m2, m3, m4 = st.columns(4)
+            m1.metric("Linhas (estimativa)", fmt_num(row_estimate) if row_estimate is not None else "—")
+            m2.metric("Tabela", f"{stats['table_bytes'] / 1e6:,.1f} MB")
+            m3.metric("Índices", f"{stats['index_bytes'] / 1e6:,.1f} MB")
+            m4.metric("Total", f"{stats['total_bytes'] / 1e6:,.1f} MB")
+            st.caption(f"Estimativa de pg_class.reltuples • último ANALYZE: {stats['last_analyzed'] or 'nunca'}")
+
+            def col_label(name: str) -> str:
+                return f"{name} 🔑" if columns[name]["indexed"] else name
+
+            wide = [n for n, c in columns.items() if is_wide(c)]
+            sel_cols = st.multiselect("Colunas", list(columns), default=[n for n in columns if n not in wide],
+                                      format_func=col_label, key=f"browse_cols_{rel}")
+            if wide:
+                st.caption("Fora da projeção padrão (colunas largas): " + ", ".join(f"`{n}`" for n in wide)
+                           + " • 🔑 = coluna indexada")
+
+            can_sample = stats["relkind"] in SAMPLE_RELKINDS
+            mode = st.radio("Modo", ["Paginação", "Amostra aleatória"] if can_sample else ["Paginação"],
+                            horizontal=True, key="browse_mode")
+
+            f1, f2, f3, f4 = st.columns([1.2, 0.6, 1.2, 1.2])
+            filter_col = f1.selectbox("Filtrar por", ["(nenhum)", *columns], key=f"browse_filter_col_{rel}",
+                                      format_func=lambda n: n if n == "(nenhum)" else col_label(n))
+            filter_op = f2.selectbox("Operador", FILTER_OPS, key="browse_filter_op")
+            filter_value = f3.text_input("Valor", key=f"browse_filter_value_{rel}")
+            sort_col = f4.selectbox("Ordenar por", ["(chave)", *columns], key=f"browse_sort_{rel}",
+                                    format_func=lambda n: n if n == "(chave)" else col_label(n),
+                                    disabled=mode != "Paginação")
+
+            where, params = "1=1", {}
+            if filter_col != "(nenhum)" and filter_value:
+                where, params = ColumnFilter(filter_col, filter_op, filter_value,
+                                             columns[filter_col]["data_type"]).where()
+                if not columns[filter_col]["indexed"]:
+                    st.caption(f"⚠️ `{filter_col}` não é indexada: o filtro percorre a tabela inteira.")
+
+            key = tuple(pk) if pk else ("ctid",)
+            ready = True
+            if mode == "Paginação" and sort_col != "(chave)":
+                if sort_col not in key:
+                    key = (sort_col, *key)
+                if not columns[sort_col]["not_null"]:
+                    where = f"({where}) AND {quote_ident(sort_col)} IS NOT NULL"
+                    st.caption(f"Linhas com `{sort_col}` nulo ficam fora da ordenação.")
+                if not columns[sort_col]["indexed"]:
+                    st.warning(f"`{sort_col}` não tem índice: cada página exige ler e ordenar "
+                               f"~{fmt_num(row_estimate) if row_estimate is not None else '?'} linhas.")
+                    ready = st.checkbox("Ordenar mesmo assim", key=f"browse_sort_confirm_{rel}_{sort_col}")
+
+            select_list = projection(sel_cols, key)
+            if mode == "Amostra aleatória":
+                pct = sample_percent(page_size, row_estimate)
+                seed = st.session_state.setdefault("browse_seed", 1)
+                if st.button("🎲 Nova amostra", key="browse_resample"):
+                    seed = st.session_state.browse_seed = seed + 1
+                st.dataframe(run_query_df(engine, sample_sql(rel, select_list, where, pct, seed, page_size), params),
+                             use_container_width=True, hide_index=True)
+                st.caption(f"TABLESAMPLE SYSTEM ({pct:.3g}%) • até {page_size} linhas")
+            elif ready:
+                pager = get_pager(
+                    "browse",
+                    relation=rel,
+                    key=key,
+                    columns=select_list,
+                    where=where,
+                    params=params,
+                    page_size=page_size,
+                )
+                paged_table("browse", pager, engine)
+            export_controls(engine, f"SELECT {select_list} FROM {rel} WHERE {where}", params,
+                            f"{schema}.{table}", "browse_export")
         except Exception as e:
             st.error(f"Erro ao carregar a tabela: {e}")
 
+with tab2:
+    st.experimental_fragment(browse_tab)(engine, boot, boot_schema)
+
 # -------------------------------
 # Tab 3 • SQL livre
 # -------------------------------
-with tab3:
+def adhoc_result(polling: bool):
+    """
+    Status/result of the session's ad-hoc query. While it runs this is a
+    fragment polled every second; a full rerun stops the polling once done.
+    """
+    job = st.session_state.adhoc_job
+    if job.state == "running":
+        c1, c2 = st.columns([4, 1])
+        c1.info(f"⏳ Executando há {job.elapsed:.0f}s" + (f" (pid {job.pid})" if job.pid else "") + "...")
+        c2.button("⛔ Cancelar", on_click=job.cancel, use_container_width=True)
+        preview = job.preview
+        if preview is not None:
+            # the first rows arrive before the rest is counted
+            st.caption(f"Prévia: {len(preview)} linhas • contando o total...")
+            st.dataframe(preview, use_container_width=True)
+        return
+    if polling:
+        st.rerun()
+    if job.state == "cancelled":
+        st.warning(f"Consulta cancelada após {job.elapsed:.1f}s.")
+    elif job.state == "error":
+        st.error(f"Erro na consulta: {job.error}")
+    elif job.plan is not None:
+        st.caption(f"Planejamento: {job.plan_summary.get('Planning Time', 0):.1f} ms • "
+                   f"Execução: {job.plan_summary.get('Execution Time', 0):.1f} ms • Linhas: {job.rows}")
+        st.dataframe(job.plan, use_container_width=True, hide_index=True)
+    else:
+        shown = len(job.preview) if job.preview is not None else 0
+        st.caption(f"Tempo: {job.elapsed * 1000:.0f} ms • Linhas: {job.rows}"
+                   + (f" (prévia: {shown})" if job.rows is not None and shown < job.rows else ""))
+        if job.preview is not None:
+            st.dataframe(job.preview, use_container_width=True)
+
+SQL_SOURCES = {"postgres": "Postgres (ao vivo)", "snapshot": "Snapshot local (DuckDB)"}
+
+def sql_tab(engine: Engine):
     st.subheader("Editor SQL")
     default_sql = "SELECT NOW() as now;"
     sql = st.text_area("SQL", height=200, value=default_sql)
-    run_btn = st.button("Executar consulta")
+    source = st.radio("Origem", list(SQL_SOURCES), horizontal=True, key="sql_source", format_func=SQL_SOURCES.get,
+                      disabled=not duckdb_available(),
+                      help="Snapshot local: DuckDB sobre os arquivos Parquet exportados (ver barra lateral), "
+                           "sem carga no Postgres." + ("" if duckdb_available() else " Requer o pacote duckdb."))
+    snapshot = get_snapshot_store(engine_ident(engine)) if source == "snapshot" else None
+    if snapshot is not None:
+        exported = snapshot.summary()
+        st.caption("Relações no snapshot: " + (", ".join(f"`{r}` (até {d})" for r, d in
+                                                           zip(exported["relação"], exported["até"]))
+                                                 if not exported.empty else "nenhuma — exporte pela barra lateral."))
+    o1, o2, o3 = st.columns(3)
+    timeout_s = o1.number_input("Timeout (s)", min_value=1, max_value=3600,
+                                value=int(get_env_default("VIEWER_SQL_TIMEOUT_S", "30")))
+    preview_rows = o2.number_input("Linhas de prévia", min_value=10, max_value=100000, value=1000, step=100)
+    explain = o3.checkbox("EXPLAIN (ANALYZE, BUFFERS)", help="Executa a consulta e mostra o plano com tempos por nó.")
+    b1, b2 = st.columns([1, 3])
+    run_btn = b1.button("Executar consulta")
+    compare = b2.checkbox("Comparar motores de leitura", help="Executa a consulta (sem cache) com cada motor e compara.",
+                          disabled=snapshot is not None)
+
+    if run_btn and sql.strip() and compare and snapshot is None:
+        rows = []
+        for how in FETCH_ENGINES:
+            t0 = time.time()
+            try:
+                out = fetch_df(engine, sql, how=how)
+                rows.append({"motor": how, "tempo_ms": round((time.time() - t0) * 1000),
+                             "linhas": len(out), "memoria_mb": round(out.memory_usage(deep=True).sum() / 1e6, 2)})
+            except Exception as e:
+                rows.append({"motor": how, "erro": str(e)})
+        st.dataframe(pd.DataFrame(rows), use_container_width=True)
+    elif run_btn and sql.strip():
+        previous = st.session_state.get("adhoc_job")
+        if previous is not None:
+            previous.cancel()
+        query = SnapshotQuery(snapshot, sql, timeout_s, int(preview_rows), explain) if snapshot is not None \
+            else AdhocQuery(engine, sql, timeout_s, int(preview_rows), explain)
+        st.session_state.adhoc_job = query.start()
+
+    # Export first: nothing is rendered here after the polled result fragment
+    if sql.strip():
+        export_controls(engine, sql, None, "resultado_sql", "sql_export", timeout_s, snapshot)
+
+    job = st.session_state.get("adhoc_job")
+    if job is not None:
+        running = job.state == "running"
+        st.experimental_fragment(adhoc_result, run_every=1.0 if running else None)(running)
 
-    if run_btn and sql.strip():
-        t0 = time.time()
-        try:
-            out = run_query_df(engine, sql)
-            dur = (time.time() - t0) * 1000
-            st.caption(f"Tempo: {dur:.0f} ms • Linhas: {len(out)}")
-            st.dataframe(out, use_container_width=True)
-            df_to_csv_download(out, "⬇️ Baixar CSV", "resultado_sql.csv")
-        except Exception as e:
-            st.error(f"Erro na consulta: {e}")
+with tab3:
+    st.experimental_fragment(sql_tab)(engine)
+
+# Per-session memory accounting, once this run has loaded everything it keeps
+account_session()
@@ -0,0 +1,9 @@
+"""
+Benchmarks for the Postgres viewer (app.py).
+
+    python -m bench.generate --scale 100k          # fill a local database
+    python -m bench.run --out before.json          # measure every query path
+    python -m bench.run --out after.json --compare before.json
+
+Both read the DSN from --dsn or DATABASE_URL.
+"""
@@ -0,0 +1,212 @@
+"""
+Synthetic data for the viewer benchmarks.
+
+Fills ads_sp_advertised_product_daily, products and unified_sales_lines
+with skewed but plausible data (a few campaigns and ASINs carry most of
+the spend, CTR/CPC/CVR in realistic ranges) and creates the Ads view.
+Rows are generated server-side with generate_series in day-sized chunks,
+so 100M rows never pass through Python and each chunk commits on its own.
+
+    python -m bench.generate --scale 10m
+    python -m bench.generate --ads-rows 2000000 --sales-rows 500000 --products 5000
+"""
+import argparse
+import datetime as dt
+import math
+import os
+import sys
+import time
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+
+from viewer.queries import ADS_VIEW
+
+# ads rows, sales lines, products
+SCALES = {
+    "100k": (100_000, 100_000, 2_000),
+    "1m": (1_000_000, 1_000_000, 10_000),
+    "10m": (10_000_000, 10_000_000, 50_000),
+    "100m": (100_000_000, 100_000_000, 200_000),
+}
+DAYS = 730
+DAY0 = dt.date(2024, 1, 1)
+ASINS_PER_CAMPAIGN = 25
+CHUNK_ROWS = 1_000_000
+
+DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS ads_sp_advertised_product_daily (
+        date date NOT NULL,
+        campaign_id bigint NOT NULL,
+        campaign_name text,
+        advertised_asin text,
+        advertised_sku text,
+        impressions bigint,
+        clicks bigint,
+        cost numeric(12,2),
+        attributed_sales_14d numeric(12,2),
+        attributed_conversions_14d bigint
+    )""",
+    """
+    CREATE TABLE IF NOT EXISTS products (
+        id bigserial PRIMARY KEY,
+        asin text,
+        sku text,
+        title text,
+        brand text,
+        category text,
+        price numeric(10,2),
+        currency_code text,
+        in_stock boolean,
+        image_url text
+    )""",
+    """
+    CREATE TABLE IF NOT EXISTS unified_sales_lines (
+        id bigserial PRIMARY KEY,
+        order_id text,
+        purchase_date timestamptz,
+        product_key text,
+        sku text,
+        title text,
+        channel text,
+        units integer,
+        revenue numeric(12,2)
+    )""",
+    f"""
+    CREATE OR REPLACE VIEW {ADS_VIEW} AS
+    SELECT date, campaign_id, campaign_name, advertised_asin, advertised_sku,
+           SUM(impressions) AS impressions, SUM(clicks) AS clicks, SUM(cost) AS spend,
+           SUM(attributed_sales_14d) AS sales_14d, SUM(attributed_conversions_14d) AS conv_14d
+    FROM ads_sp_advertised_product_daily
+    GROUP BY 1, 2, 3, 4, 5""",
+]
+
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS ads_sp_apd_date_idx ON ads_sp_advertised_product_daily (date)",
+    "CREATE INDEX IF NOT EXISTS ads_sp_apd_campaign_date_idx ON ads_sp_advertised_product_daily (campaign_name, date)",
+    "CREATE INDEX IF NOT EXISTS ads_sp_apd_asin_date_idx ON ads_sp_advertised_product_daily (advertised_asin, date)",
+    "CREATE INDEX IF NOT EXISTS products_asin_idx ON products (asin)",
+    "CREATE INDEX IF NOT EXISTS idx_unified_sales_lines_purchase_date ON unified_sales_lines (purchase_date)",
+    "CREATE INDEX IF NOT EXISTS idx_unified_sales_lines_product_key ON unified_sales_lines (product_key)",
+]
+
+# One row per (day, campaign x ASIN pair). Pair weights follow 1/rank so a
+# few pairs dominate; ASINs are shared between campaigns.
+ADS_INSERT = """
+INSERT INTO ads_sp_advertised_product_daily
+SELECT d::date, p.campaign_id, 'Campaign ' || p.campaign_id, p.asin, 'SKU-' || p.asin_n,
+       m.impressions, m.clicks, round((m.clicks * (0.2 + random() * 1.8))::numeric, 2),
+       round((m.conv * (10 + (p.asin_n % 70)))::numeric, 2), m.conv
+FROM generate_series(CAST(:d0 AS date), CAST(:d1 AS date), interval '1 day') AS d
+CROSS JOIN (
+    SELECT i AS pair, 1 + i % :campaigns AS campaign_id, (i * 7919) % :asins AS asin_n,
+           'B' || lpad(((i * 7919) % :asins)::text, 9, '0') AS asin,
+           1.0 / (1 + i) ^ 0.7 AS weight
+    FROM generate_series(0, :pairs - 1) AS i
+) AS p
+CROSS JOIN LATERAL (
+    SELECT imp AS impressions, clk AS clicks, floor(clk * random() * 0.2)::bigint AS conv
+    FROM (SELECT imp, floor(imp * (0.003 + random() * 0.02))::bigint AS clk
+          FROM (SELECT floor(random() * 20000 * p.weight + random() * 50)::bigint AS imp) AS i0) AS c0
+) AS m
+"""
+
+PRODUCTS_INSERT = """
+INSERT INTO products (asin, sku, title, brand, category, price, currency_code, in_stock, image_url)
+SELECT 'B' || lpad(n::text, 9, '0'), 'SKU-' || n, 'Product ' || n || ' ' || md5(n::text),
+       'Brand ' || (n % 50), 'Category ' || (n % 20), round((10 + (n % 70) + random())::numeric, 2),
+       'USD', random() > 0.1, 'https://images.example.com/' || md5(n::text) || '.jpg'
+FROM generate_series(CAST(:n0 AS bigint), CAST(:n1 AS bigint)) AS n
+"""
+
+SALES_INSERT = """
+INSERT INTO unified_sales_lines (order_id, purchase_date, product_key, sku, title, channel, units, revenue)
+SELECT 'O' || n, CAST(:d0 AS timestamptz) + random() * (CAST(:days AS int) * interval '1 day'),
+       'B' || lpad(k::text, 9, '0'), 'SKU-' || k, 'Product ' || k,
+       CASE WHEN random() < 0.8 THEN 'amazon' ELSE 'ml' END, u, round((u * (10 + k % 70))::numeric, 2)
+FROM generate_series(CAST(:n0 AS bigint), CAST(:n1 AS bigint)) AS n
+CROSS JOIN LATERAL (SELECT floor(:products * random() ^ 3)::bigint AS k, 1 + floor(random() * 3)::int AS u) AS r
+"""
+
+
+def _chunks(total: int, size: int):
+    for start in range(0, total, size):
+        yield start, min(total, start + size) - 1
+
+
+def generate(engine, ads_rows: int, sales_rows: int, products: int, seed: float = 0.42,
+             replace: bool = False, indexes: bool = True, log=print):
+    with engine.begin() as conn:
+        for stmt in DDL:
+            conn.execute(text(stmt))
+        if replace:
+            conn.execute(text("TRUNCATE ads_sp_advertised_product_daily, products, unified_sales_lines "
+                              "RESTART IDENTITY"))
+        else:
+            busy = conn.execute(text(
+                "SELECT EXISTS (SELECT 1 FROM ads_sp_advertised_product_daily) "
+                "OR EXISTS (SELECT 1 FROM products) OR EXISTS (SELECT 1 FROM unified_sales_lines)")).scalar()
+            if busy:
+                raise SystemExit("Tables already have data; use --replace to truncate them first.")
+
+    pairs = max(1, math.ceil(ads_rows / DAYS))
+    campaigns = max(1, math.ceil(pairs / ASINS_PER_CAMPAIGN))
+    asins = max(1, min(products, math.ceil(pairs * 0.6)))
+    days_per_chunk = max(1, CHUNK_ROWS // pairs)
+    start = time.perf_counter()
+
+    steps = iter(range(1, 1 << 30))
+
+    def step(sql, params, label):
+        # A distinct, reproducible seed per chunk so chunks do not repeat each other
+        with engine.begin() as conn:
+            conn.execute(text("SELECT setseed(:s)"), {"s": (seed + next(steps) * 1e-4) % 1})
+            conn.execute(text(sql), params)
+        log(f"{label} ({time.perf_counter() - start:.0f}s)")
+
+    step(PRODUCTS_INSERT, {"n0": 0, "n1": products - 1}, f"products: {products}")
+    for d_first, d_last in _chunks(DAYS, days_per_chunk):
+        step(ADS_INSERT, {"d0": str(DAY0 + dt.timedelta(days=d_first)), "d1": str(DAY0 + dt.timedelta(days=d_last)),
+                          "pairs": pairs, "campaigns": campaigns, "asins": asins},
+             f"ads: days {d_first}-{d_last} of {DAYS} ({pairs} pairs, {campaigns} campaigns)")
+    for n0, n1 in _chunks(sales_rows, CHUNK_ROWS):
+        step(SALES_INSERT, {"n0": n0, "n1": n1, "d0": str(DAY0), "days": DAYS, "products": products},
+             f"sales: {n1 + 1}/{sales_rows}")
+
+    if indexes:
+        with engine.begin() as conn:
+            for stmt in INDEXES:
+                conn.execute(text(stmt))
+        log(f"indexes ({time.perf_counter() - start:.0f}s)")
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("ANALYZE ads_sp_advertised_product_daily, products, unified_sales_lines"))
+    log(f"done ({time.perf_counter() - start:.0f}s)")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--dsn", default=os.getenv("DATABASE_URL"), help="default: $DATABASE_URL")
+    ap.add_argument("--scale", choices=SCALES, default="100k")
+    ap.add_argument("--ads-rows", type=int)
+    ap.add_argument("--sales-rows", type=int)
+    ap.add_argument("--products", type=int)
+    ap.add_argument("--seed", type=float, default=0.42, help="setseed() value, for reproducible data")
+    ap.add_argument("--replace", action="store_true", help="truncate the tables first")
+    ap.add_argument("--no-indexes", action="store_true", help="skip secondary indexes (to measure their effect)")
+    ap.add_argument("--force", action="store_true", help="allow a non-local database host")
+    args = ap.parse_args(argv)
+    if not args.dsn:
+        ap.error("--dsn or DATABASE_URL is required")
+    url = make_url(args.dsn)
+    if url.host not in (None, "", "localhost", "127.0.0.1", "::1") and not args.force:
+        ap.error(f"refusing to write synthetic data to {url.host}; pass --force if that is intended")
+
+    ads, sales, products = SCALES[args.scale]
+    generate(create_engine(url), args.ads_rows or ads, args.sales_rows or sales, args.products or products,
+             seed=args.seed, replace=args.replace, indexes=not args.no_indexes,
+             log=lambda msg: print(msg, file=sys.stderr))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+"""
+Benchmark runner for the viewer's query paths.
+
+Each case runs in a fresh process (so peak RSS belongs to that case alone)
+`--repeat` times per fetch engine, and the results are written as JSON:
+
+    {"meta": {...}, "results": [{"path", "case", "fetch", "relation",
+      "latency_ms": {"min", "median", "max"}, "rows", "bytes",
+      "peak_rss_mb", "rss_delta_mb"}, ...]}
+
+`--compare baseline.json` prints the median ratio per case and exits with
+status 1 when any case got slower than `--threshold`.
+
+Paths: Tab 1 bootstrap/metadata lookups, the Ads breakdown (which also carries the
+KPI totals), series and detail queries under several filter combinations (routed to rollups when populated), the
+Tab 2 preview (catalog stats, first and deep keyset pages, TABLESAMPLE)
+and the CSV export.
+"""
+import argparse
+import datetime as dt
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+
+from viewer.breakdown import BREAKDOWN_COLUMNS, breakdown_sql
+from viewer.buckets import resolve_bucket
+from viewer.browse import COLUMNS_SQL, TABLE_STATS_SQL, is_wide, projection, sample_percent, sample_sql
+from viewer.dimensions import options_sql
+from viewer.metadata import ADS_META_SQL, ADS_VIEW_EXISTS_SQL, SCHEMAS_SQL, TABLES_SQL, boot_queries
+from viewer.pagination import KeysetPager
+from viewer.queries import ADS_VIEW, DETAIL_KEY, DETAIL_NULLABLE, DIMENSION_COLUMNS, METRIC_COLUMNS, AdsFilters, detail_sql, series_sql
+from viewer.rollups import AVAILABLE_ROLLUPS_SQL, DIMENSION_LIST, ROLLUPS, TRIGRAM_AVAILABLE_SQL, refresh_rollups, route
+from viewer.sql import PRIMARY_KEY_SQL, qualified
+
+BENCH_TABLES = ("ads_sp_advertised_product_daily", "products", "unified_sales_lines")
+PREVIEW_ROWS = 1000
+DEEP_PAGE = 100
+NOISE_FLOOR_MS = 5.0
+
+
+# -- case specs (plain data, so they can be shipped to the worker process) -----
+def _query(path, case, sql, params=None, relation=None) -> dict:
+    return {"path": path, "case": case, "kind": "query", "sql": sql, "params": params or {}, "relation": relation}
+
+
+def build_cases(engine, schema: str = "public") -> list[dict]:
+    with engine.connect() as conn:
+        available = set(conn.execute(text(AVAILABLE_ROLLUPS_SQL),
+                                     {"names": [r.name for r in ROLLUPS] + [DIMENSION_LIST]}).scalars())
+        trigram = conn.execute(text(TRIGRAM_AVAILABLE_SQL)).scalar()
+        bounds = conn.execute(text(f"SELECT MIN(date), MAX(date) FROM {ADS_VIEW}")).one()
+        top = conn.execute(text(
+            f"SELECT campaign_name, advertised_asin FROM {ADS_VIEW} "
+            f"GROUP BY 1, 2 ORDER BY SUM(spend) DESC NULLS LAST LIMIT 1")).one()
+
+    cases = [
+        _query("tab1.metadata", "view_exists", ADS_VIEW_EXISTS_SQL),
+        _query("tab1.metadata", "ads_meta", ADS_META_SQL, relation=ADS_VIEW),
+        _query("tab1.metadata", "schemas", SCHEMAS_SQL),
+        _query("tab1.metadata", "tables", TABLES_SQL, {"s": schema}),
+        # the dashboard's lookup, dimension list included
+        _query("tab1.metadata", "rollups", *boot_queries(schema)["rollups"][:2]),
+        _query("tab1.metadata", "trgm", TRIGRAM_AVAILABLE_SQL),
+    ]
+    dmin, dmax = str(bounds[0]), str(bounds[1])
+    last30 = str(bounds[1] - dt.timedelta(days=29))
+    for column, query in (("campaign_name", ""), ("advertised_asin", top[1][:4])):
+        sql, params, source = options_sql(column, AdsFilters(dmin, dmax, (), ()), query, available, trigram)
+        cases.append(_query("tab1.options", f"{column}:{query or 'top'}", sql, params, source))
+
+    combos = {
+        "all": AdsFilters(dmin, dmax, (), ()),
+        "last30": AdsFilters(last30, dmax, (), ()),
+        "campaign": AdsFilters(dmin, dmax, (top[0],), ()),
+        "asin": AdsFilters(dmin, dmax, (), (top[1],)),
+        "campaign+asin": AdsFilters(dmin, dmax, (top[0],), (top[1],)),
+        "last30+campaign": AdsFilters(last30, dmax, (top[0],), ()),
+    }
+    for name, filters in combos.items():
+        rel = route(filters, BREAKDOWN_COLUMNS, available)
+        cases.append(_query("tab1.breakdown", name, *breakdown_sql(filters, rel), relation=rel))
+        rel = route(filters, {"date"}, available)
+        cases.append(_query("tab1.series", name, *series_sql(filters, rel), relation=rel))
+        unit, _ = resolve_bucket(filters.dstart, filters.dend)
+        if unit != "day":
+            cases.append(_query("tab1.series", f"{name}:{unit}", *series_sql(filters, rel, unit), relation=rel))
+        rel = route(filters, set(DIMENSION_COLUMNS), available)
+        where, params = filters.where()
+        pager = KeysetPager(rel, DETAIL_KEY, columns=", ".join(DIMENSION_COLUMNS + METRIC_COLUMNS), where=where,
+                            params=params, nullable=DETAIL_NULLABLE)
+        cases.append(_query("tab1.detail", name, *pager.page_sql(None), relation=rel))
+
+    for table in BENCH_TABLES:
+        rel = qualified(schema, table)
+        with engine.connect() as conn:
+            pk = list(conn.execute(text(PRIMARY_KEY_SQL), {"rel": rel}).scalars())
+            columns = [dict(r._mapping) for r in conn.execute(text(COLUMNS_SQL), {"rel": rel})]
+            estimate = conn.execute(text(TABLE_STATS_SQL), {"rel": rel}).one().row_estimate
+        key = tuple(pk) or ("ctid",)
+        select_list = projection([c["column_name"] for c in columns if not is_wide(c)], key)
+        pager = KeysetPager(rel, key, columns=select_list, page_size=PREVIEW_ROWS)
+        cases += [
+            _query("tab2.stats", table, TABLE_STATS_SQL, {"rel": rel}, rel),
+            _query("tab2.columns", table, COLUMNS_SQL, {"rel": rel}, rel),
+            _query("tab2.page", f"{table}:first", *pager.page_sql(None), relation=rel),
+            {"path": "tab2.page", "case": f"{table}:page{DEEP_PAGE}", "kind": "page", "relation": rel,
+             "key": list(key), "columns": select_list, "page": DEEP_PAGE, "page_size": PREVIEW_ROWS},
+            _query("tab2.sample", table, sample_sql(rel, select_list, "1=1",
+                                                    sample_percent(PREVIEW_ROWS, estimate), 1, PREVIEW_ROWS),
+                   relation=rel),
+        ]
+
+    all_ads = combos["all"]
+    cases += [
+        {"path": "export.csv", "case": "ads_detail", "kind": "export", "sql": detail_sql(all_ads)[0],
+         "params": detail_sql(all_ads)[1], "fmt": "csv", "relation": ADS_VIEW},
+        {"path": "export.csv", "case": "unified_sales_lines", "kind": "export",
+         "sql": f"SELECT * FROM {qualified(schema, 'unified_sales_lines')}", "params": {}, "fmt": "csv",
+         "relation": "unified_sales_lines"},
+    ]
+    return cases
+
+
+# -- worker side -------------------------------------------------------------------
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / 1024
+
+
+def _execute(engine, spec: dict, how: str) -> tuple[int | None, int]:
+    from viewer.cache import frame_nbytes
+    from viewer.export import export_query
+    from viewer.fetch import read_df
+
+    if spec["kind"] == "query":
+        df = read_df(engine, spec["sql"], spec["params"], how=how)
+        return len(df), frame_nbytes(df)
+    if spec["kind"] == "page":
+        pager = KeysetPager(spec["relation"], tuple(spec["key"]), columns=spec["columns"],
+                            page_size=spec["page_size"])
+        df = pager.page(spec["page"], lambda sql, params=None: read_df(engine, sql, params, how=how))
+        return len(df), frame_nbytes(df)
+    path = export_query(engine, spec["sql"], spec["params"], spec["fmt"])
+    try:
+        return None, os.path.getsize(path)
+    finally:
+        os.remove(path)
+
+
+def run_case(dsn: str, spec: dict, how: str, repeat: int) -> dict:
+    import pyarrow  # noqa: F401  -- imported up front so it does not count towards the case
+
+    engine = create_engine(dsn)
+    with engine.connect() as conn:
+        conn.exec_driver_sql("SELECT 1")
+    base = _peak_rss_mb()
+    timings, rows, nbytes = [], None, 0
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        rows, nbytes = _execute(engine, spec, how)
+        timings.append((time.perf_counter() - t0) * 1000)
+    peak = _peak_rss_mb()
+    engine.dispose()
+    return {
+        "path": spec["path"], "case": spec["case"], "fetch": how, "relation": spec.get("relation"),
+        "latency_ms": {"min": round(min(timings), 2), "median": round(statistics.median(timings), 2),
+                       "max": round(max(timings), 2)},
+        "rows": rows, "bytes": nbytes,
+        "peak_rss_mb": round(peak, 1), "rss_delta_mb": round(peak - base, 1),
+    }
+
+
+# -- reporting ---------------------------------------------------------------------
+def collect_meta(engine, dsn: str, schema: str) -> dict:
+    with engine.connect() as conn:
+        version = conn.execute(text("SHOW server_version")).scalar()
+        tables = {t: conn.execute(text(TABLE_STATS_SQL), {"rel": qualified(schema, t)}).one().row_estimate
+                  for t in BENCH_TABLES}
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "timestamp": dt.datetime.now(dt.timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit, "dsn": make_url(dsn).render_as_string(hide_password=True),
+        "server_version": version, "row_estimates": tables,
+        "python": platform.python_version(), "platform": platform.platform(),
+    }
+
+
+def compare(results: list[dict], baseline: list[dict], threshold: float) -> list[str]:
+    """
+    Print a comparison table; returns the keys of cases slower than
+    `threshold` x baseline (ignoring differences under NOISE_FLOOR_MS).
+    """
+    before = {(r["path"], r["case"], r["fetch"]): r for r in baseline}
+    regressions = []
+    print(f"{'case':<60} {'before':>10} {'after':>10} {'ratio':>7}")
+    for r in results:
+        key = (r["path"], r["case"], r["fetch"])
+        after = r["latency_ms"]["median"]
+        if key not in before:
+            print(f"{' '.join(key):<60} {'-':>10} {after:>10.1f}")
+            continue
+        prev = before[key]["latency_ms"]["median"]
+        ratio = after / prev if prev else float("inf")
+        slow = ratio > threshold and after - prev > NOISE_FLOOR_MS
+        if slow:
+            regressions.append(" ".join(key))
+        print(f"{' '.join(key):<60} {prev:>10.1f} {after:>10.1f} {ratio:>6.2f}x{' !' if slow else ''}")
+    return regressions
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--dsn", default=os.getenv("DATABASE_URL"), help="default: $DATABASE_URL")
+    ap.add_argument("--schema", default="public")
+    ap.add_argument("--fetch", nargs="+", default=["pandas", "arrow"], choices=["pandas", "arrow"])
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--only", help="run only cases whose path starts with this prefix (e.g. tab1)")
+    ap.add_argument("--rollups", action="store_true", help="create/refresh the rollups before measuring")
+    ap.add_argument("--out", help="write JSON here (default: stdout)")
+    ap.add_argument("--compare", help="baseline JSON from a previous run")
+    ap.add_argument("--threshold", type=float, default=1.2, help="slowdown ratio counted as a regression")
+    args = ap.parse_args(argv)
+    if not args.dsn:
+        ap.error("--dsn or DATABASE_URL is required")
+
+    engine = create_engine(args.dsn)
+    if args.rollups:
+        refresh_rollups(engine)
+    cases = [c for c in build_cases(engine, args.schema) if not args.only or c["path"].startswith(args.only)]
+    meta = collect_meta(engine, args.dsn, args.schema)
+    engine.dispose()
+
+    results = []
+    # One process per case: ru_maxrss is a high-water mark, so a shared process would blur cases together
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn"), max_tasks_per_child=1) as pool:
+        for spec in cases:
+            for how in args.fetch:
+                result = pool.submit(run_case, args.dsn, spec, how, args.repeat).result()
+                results.append(result)
+                print(f"{spec['path']:<14} {spec['case']:<40} {how:<7} "
+                      f"{result['latency_ms']['median']:>9.1f} ms  {result['peak_rss_mb']:>7.1f} MB",
+                      file=sys.stderr)
+
+    report = json.dumps({"meta": meta, "results": results}, indent=2, default=str)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(report)
+    else:
+        print(report)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) over {args.threshold}x", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,11 @@
+"""
+Amazon Selling Partner API ingestion.
+
+    auth       LWA access tokens, cached on disk until shortly before expiry
+    ratelimit  per-operation token buckets (SP-API usage plans)
+    client     async client with connection reuse, retries and pagination
+    load       batched COPY + upsert into Postgres
+    ingest     the Orders pipeline (python -m spapi.ingest)
+    reports    Reports API backfill: streamed gzip TSV into COPY (python -m spapi.reports)
+    mock       local SP-API/LWA server for tests (python -m spapi.mock)
+"""
@@ -0,0 +1,107 @@
+"""
+Login with Amazon (LWA) access tokens.
+
+Tokens live for `expires_in` seconds (an hour). They are cached in memory
+and in a small JSON file shared by every run on the machine, keyed by a
+hash of the client id and refresh token, and refreshed REFRESH_MARGIN_S
+before they expire.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import time
+
+import aiohttp
+
+LWA_ENDPOINT = "https://api.amazon.com/auth/o2/token"
+REFRESH_MARGIN_S = 60
+
+
+def default_cache_path() -> str:
+    base = os.getenv("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "spapi", "lwa-tokens.json")
+
+
+class LwaError(Exception):
+    pass
+
+
+class LwaTokenCache:
+    def __init__(self, client_id: str, client_secret: str, refresh_token: str,
+                 endpoint: str = LWA_ENDPOINT, cache_path: str | None = None):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.refresh_token = refresh_token
+        self.endpoint = endpoint
+        self.cache_path = cache_path if cache_path is not None else default_cache_path()
+        self.key = hashlib.sha256(f"{client_id}\0{refresh_token}".encode()).hexdigest()[:24]
+        self._token: str | None = None
+        self._expires_at = 0.0
+        self._lock = asyncio.Lock()
+        self.fetches = 0
+
+    # -- disk cache ---------------------------------------------------------------
+    def _read_all(self) -> dict:
+        try:
+            with open(self.cache_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _store(self, token: str, expires_at: float):
+        if not self.cache_path:
+            return
+        entries = {k: v for k, v in self._read_all().items() if v.get("expires_at", 0) > time.time()}
+        entries[self.key] = {"access_token": token, "expires_at": expires_at}
+        self._write(entries)
+
+    def _write(self, entries: dict):
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        tmp = f"{self.cache_path}.{os.getpid()}.tmp"
+        # the file holds bearer tokens: owner-only
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(entries, f)
+        os.replace(tmp, self.cache_path)
+
+    def _fresh(self, expires_at: float) -> bool:
+        return expires_at - REFRESH_MARGIN_S > time.time()
+
+    # -- public ---------------------------------------------------------------------
+    async def get(self, session: aiohttp.ClientSession) -> str:
+        async with self._lock:
+            if self._token and self._fresh(self._expires_at):
+                return self._token
+            cached = self._read_all().get(self.key) if self.cache_path else None
+            if cached and self._fresh(cached["expires_at"]):
+                self._token, self._expires_at = cached["access_token"], cached["expires_at"]
+                return self._token
+            await self._fetch(session)
+            return self._token
+
+    async def _fetch(self, session: aiohttp.ClientSession):
+        data = {
+            "grant_type": "refresh_token",
+            "refresh_token": self.refresh_token,
+            "client_id": self.client_id,
+            "client_secret": self.client_secret,
+        }
+        async with session.post(self.endpoint, data=data) as resp:
+            body = await resp.json(content_type=None)
+            if resp.status != 200 or "access_token" not in body:
+                raise LwaError(f"LWA token request failed ({resp.status}): {body}")
+        self.fetches += 1
+        self._token = body["access_token"]
+        self._expires_at = time.time() + float(body.get("expires_in", 3600))
+        self._store(self._token, self._expires_at)
+
+    def invalidate(self):
+        """
+        Forget the current token (the API rejected it).
+        """
+        self._token, self._expires_at = None, 0.0
+        if self.cache_path:
+            entries = self._read_all()
+            if entries.pop(self.key, None) is not None:
+                self._write(entries)
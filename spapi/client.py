@@ -0,0 +1,160 @@
+"""
+Async SP-API client.
+
+One aiohttp session (keep-alive connection pool) per client. Every request
+first takes a token from the operation's bucket, then retries 429 and 5xx
+responses with exponential backoff and jitter (Retry-After is honoured when
+present), and refreshes the LWA token once if it is rejected.
+
+Report documents are downloaded from pre-signed URLs, outside the usage
+plans and without the access token, and are streamed rather than read
+whole.
+"""
+import asyncio
+import random
+from typing import AsyncIterator
+
+import aiohttp
+
+from spapi.auth import LwaTokenCache
+from spapi.ratelimit import RateLimiter
+
+NA_ENDPOINT = "https://sellingpartnerapi-na.amazon.com"
+REPORTS_PATH = "/reports/2021-06-30"
+USER_AGENT = "pgviewer-spapi/1.0 (Language=Python)"
+
+
+class SpApiError(Exception):
+    def __init__(self, status: int, body):
+        super().__init__(f"SP-API error {status}: {body}")
+        self.status = status
+        self.body = body
+
+
+class SpApiClient:
+    def __init__(self, tokens: LwaTokenCache, endpoint: str = NA_ENDPOINT, limiter: RateLimiter | None = None,
+                 max_retries: int = 8, max_connections: int = 16, backoff_base: float = 1.0,
+                 backoff_max: float = 60.0):
+        self.tokens = tokens
+        self.endpoint = endpoint.rstrip("/")
+        self.limiter = limiter or RateLimiter()
+        self.max_retries = max_retries
+        self.max_connections = max_connections
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.session: aiohttp.ClientSession | None = None
+        self.requests = 0
+        self.retries = 0
+
+    async def __aenter__(self) -> "SpApiClient":
+        connector = aiohttp.TCPConnector(limit=self.max_connections, ttl_dns_cache=300, keepalive_timeout=60)
+        self.session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=120),
+                                             headers={"User-Agent": USER_AGENT})
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.session.close()
+
+    def _backoff(self, attempt: int, retry_after: str | None) -> float:
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        delay = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+        return delay / 2 + random.random() * delay / 2
+
+    @staticmethod
+    async def _body(resp: aiohttp.ClientResponse):
+        # error pages from gateways and load balancers are not JSON
+        try:
+            return await resp.json(content_type=None) or {}
+        except ValueError:
+            return await resp.text()
+
+    async def request(self, operation: str, method: str, path: str, params: dict | None = None,
+                      json: dict | None = None) -> dict:
+        refreshed, status = False, None
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.acquire(operation)
+            token = await self.tokens.get(self.session)
+            headers = {"x-amz-access-token": token, "Accept": "application/json"}
+            self.requests += 1
+            try:
+                async with self.session.request(method, self.endpoint + path, params=params, json=json,
+                                                headers=headers) as resp:
+                    self.limiter.observe(operation, resp.headers)
+                    status = resp.status
+                    if resp.status == 429 or resp.status >= 500:
+                        # drain the body (whatever it is) so the connection goes back to the pool
+                        await resp.read()
+                        if resp.status == 429:
+                            self.limiter.on_throttled(operation)
+                        self.retries += 1
+                        await asyncio.sleep(self._backoff(attempt, resp.headers.get("Retry-After")))
+                        continue
+                    body = await self._body(resp) if resp.content_length != 0 else {}
+                    if resp.status in (401, 403) and not refreshed:
+                        # a token revoked or expired early: fetch a new one once
+                        self.tokens.invalidate()
+                        refreshed = True
+                        continue
+                    if resp.status >= 400:
+                        raise SpApiError(resp.status, body)
+                    return body
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if attempt == self.max_retries:
+                    raise
+                self.retries += 1
+                await asyncio.sleep(self._backoff(attempt, None))
+        raise SpApiError(status, f"{operation}: retries exhausted")
+
+    async def iter_orders(self, marketplace_ids: list[str], created_after: str | None = None,
+                          created_before: str | None = None, last_updated_after: str | None = None,
+                          page_size: int = 100) -> AsyncIterator[list[dict]]:
+        """
+        Yield pages of orders, following NextToken to the end.
+        """
+        params = {"MarketplaceIds": ",".join(marketplace_ids), "MaxResultsPerPage": str(page_size)}
+        if created_after:
+            params["CreatedAfter"] = created_after
+        if created_before:
+            params["CreatedBefore"] = created_before
+        if last_updated_after:
+            params["LastUpdatedAfter"] = last_updated_after
+        while True:
+            body = await self.request("getOrders", "GET", "/orders/v0/orders", params)
+            payload = body.get("payload", {})
+            yield payload.get("Orders", [])
+            next_token = payload.get("NextToken")
+            if not next_token:
+                return
+            # with NextToken the other filters must be omitted
+            params = {"MarketplaceIds": params["MarketplaceIds"], "NextToken": next_token}
+
+    async def create_report(self, report_type: str, marketplace_ids: list[str], data_start: str | None = None,
+                            data_end: str | None = None) -> str:
+        body = {"reportType": report_type, "marketplaceIds": marketplace_ids}
+        if data_start:
+            body["dataStartTime"] = data_start
+        if data_end:
+            body["dataEndTime"] = data_end
+        resp = await self.request("createReport", "POST", f"{REPORTS_PATH}/reports", json=body)
+        return resp["reportId"]
+
+    async def get_report(self, report_id: str) -> dict:
+        return await self.request("getReport", "GET", f"{REPORTS_PATH}/reports/{report_id}")
+
+    async def get_report_document(self, document_id: str) -> dict:
+        return await self.request("getReportDocument", "GET", f"{REPORTS_PATH}/documents/{document_id}")
+
+    async def stream(self, url: str, chunk_size: int = 1 << 16) -> AsyncIterator[tuple[bytes, str | None]]:
+        """
+        Yield (chunk, charset) from a pre-signed document URL as it arrives.
+        """
+        timeout = aiohttp.ClientTimeout(total=None, sock_read=120)
+        async with self.session.get(url, timeout=timeout) as resp:
+            if resp.status >= 400:
+                raise SpApiError(resp.status, await resp.text())
+            async for chunk in resp.content.iter_chunked(chunk_size):
+                yield chunk, resp.charset
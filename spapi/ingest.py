@@ -0,0 +1,135 @@
+"""
+Orders ingestion pipeline.
+
+The requested period is split into `slices` windows, each paginated
+(NextToken) by its own producer; all producers share the getOrders token
+bucket, so together they use the full burst and then the sustained rate,
+and nothing else limits throughput. Pages flow through a bounded queue to
+one consumer that loads batches with COPY + upsert on a worker thread
+while fetching continues.
+
+    SPAPI_CLIENT_ID=... SPAPI_CLIENT_SECRET=... SPAPI_REFRESH_TOKEN=... \\
+    DATABASE_URL=postgresql://... python -m spapi.ingest --days 30
+
+Against the mock server:
+
+    python -m spapi.mock --orders 20000 --rate-scale 100 &
+    python -m spapi.ingest --mock-url http://127.0.0.1:8099 --rate-scale 100 --days 200 --create-table
+"""
+import argparse
+import asyncio
+import datetime as dt
+import json
+import os
+import sys
+import time
+
+from spapi.auth import LWA_ENDPOINT, LwaTokenCache
+from spapi.client import NA_ENDPOINT, SpApiClient
+from spapi.load import OrdersLoader
+from spapi.ratelimit import RateLimiter
+
+_DONE = object()
+
+
+def _iso(t: dt.datetime) -> str:
+    return t.astimezone(dt.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def time_slices(start: dt.datetime, end: dt.datetime, n: int) -> list[tuple[str, str]]:
+    step = (end - start) / max(1, n)
+    return [(_iso(start + step * i), _iso(start + step * (i + 1) if i < n - 1 else end)) for i in range(n)]
+
+
+async def ingest_orders(client: SpApiClient, loader: OrdersLoader, marketplace_ids: list[str],
+                        start: dt.datetime, end: dt.datetime, slices: int = 4, batch_size: int = 1000,
+                        log=None) -> dict:
+    queue: asyncio.Queue = asyncio.Queue(maxsize=slices * 4)
+    t0 = time.perf_counter()
+    stats = {"pages": 0, "orders": 0, "loaded": 0}
+
+    async def produce(after: str, before: str):
+        try:
+            async for page in client.iter_orders(marketplace_ids, created_after=after, created_before=before):
+                await queue.put(page)
+        finally:
+            await queue.put(_DONE)
+
+    async def consume():
+        finished, batch = 0, []
+        while finished < len(windows):
+            page = await queue.get()
+            if page is _DONE:
+                finished += 1
+                continue
+            stats["pages"] += 1
+            stats["orders"] += len(page)
+            batch.extend(page)
+            if len(batch) >= batch_size:
+                stats["loaded"] += await asyncio.to_thread(loader.load, batch)
+                batch = []
+                if log:
+                    log(f"{stats['orders']} orders, {stats['pages']} pages, "
+                        f"{stats['orders'] / (time.perf_counter() - t0):.1f} orders/s")
+        if batch:
+            stats["loaded"] += await asyncio.to_thread(loader.load, batch)
+
+    windows = time_slices(start, end, slices)
+    producers = [asyncio.create_task(produce(a, b)) for a, b in windows]
+    try:
+        await consume()
+        await asyncio.gather(*producers)
+    finally:
+        for task in producers:
+            task.cancel()
+
+    seconds = time.perf_counter() - t0
+    return {**stats, "seconds": round(seconds, 2), "orders_per_s": round(stats["orders"] / seconds, 2) if seconds else None,
+            "requests": client.requests, "retries": client.retries, "throttled": client.limiter.throttled,
+            "token_fetches": client.tokens.fetches}
+
+
+async def run(args) -> dict:
+    endpoint = args.mock_url or os.getenv("SPAPI_ENDPOINT", NA_ENDPOINT)
+    lwa = f"{args.mock_url}/auth/o2/token" if args.mock_url else os.getenv("LWA_ENDPOINT", LWA_ENDPOINT)
+    tokens = LwaTokenCache(os.getenv("SPAPI_CLIENT_ID", "mock" if args.mock_url else ""),
+                           os.getenv("SPAPI_CLIENT_SECRET", "mock" if args.mock_url else ""),
+                           os.getenv("SPAPI_REFRESH_TOKEN", "Atzr|mock" if args.mock_url else ""),
+                           endpoint=lwa, cache_path=args.token_cache)
+    if not (tokens.client_id and tokens.client_secret and tokens.refresh_token):
+        raise SystemExit("Set SPAPI_CLIENT_ID, SPAPI_CLIENT_SECRET and SPAPI_REFRESH_TOKEN")
+
+    # CreatedBefore must be at least two minutes in the past
+    end = dt.datetime.now(dt.timezone.utc) - dt.timedelta(minutes=2)
+    start = dt.datetime.fromisoformat(args.since).replace(tzinfo=dt.timezone.utc) if args.since \
+        else end - dt.timedelta(days=args.days)
+    loader = OrdersLoader(args.dsn, create_table=args.create_table)
+    try:
+        async with SpApiClient(tokens, endpoint, RateLimiter(scale=args.rate_scale)) as client:
+            return await ingest_orders(client, loader, args.marketplace_ids.split(","), start, end,
+                                       slices=args.slices, batch_size=args.batch_size,
+                                       log=lambda msg: print(msg, file=sys.stderr))
+    finally:
+        loader.close()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--dsn", default=os.getenv("DATABASE_URL"), help="default: $DATABASE_URL")
+    ap.add_argument("--marketplace-ids", default=os.getenv("SPAPI_MARKETPLACE_IDS", "ATVPDKIKX0DER"))
+    ap.add_argument("--days", type=int, default=30, help="ingest orders created in the last N days")
+    ap.add_argument("--since", help="ISO date/time (UTC) to start from instead of --days")
+    ap.add_argument("--slices", type=int, default=4, help="time windows paginated concurrently")
+    ap.add_argument("--batch-size", type=int, default=1000)
+    ap.add_argument("--token-cache", help="LWA token cache file (default: ~/.cache/spapi/lwa-tokens.json)")
+    ap.add_argument("--mock-url", help="use the local mock server (python -m spapi.mock) for LWA and SP-API")
+    ap.add_argument("--rate-scale", type=float, default=1.0, help="multiply the default quotas (mock only)")
+    ap.add_argument("--create-table", action="store_true", help="create the orders table if missing")
+    args = ap.parse_args(argv)
+    if not args.dsn:
+        ap.error("--dsn or DATABASE_URL is required")
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+"""
+Bulk loading of orders into Postgres.
+
+Each batch is streamed with COPY into a temporary staging table and merged
+with one INSERT ... ON CONFLICT, so a thousand orders cost three statements
+instead of a thousand round trips. The upsert matches the columns the
+backend's sync service writes (amazon_order_id is unique).
+
+Report documents (ReportLoader) take a different path: the TSV is fed to
+COPY as it is decompressed, never held in memory, and committed in chunks
+together with a checkpoint row so an interrupted load resumes where the
+last commit left off.
+"""
+import csv
+import io
+from dataclasses import dataclass
+from typing import Iterator
+
+import psycopg2
+
+ORDER_COLUMNS = (
+    "amazon_order_id", "purchase_date", "order_status", "order_total_amount", "order_total_currency",
+    "buyer_email", "buyer_name", "marketplace_id", "fulfillment_channel", "sales_channel",
+    "ship_service_level", "number_of_items_shipped", "number_of_items_unshipped", "is_prime",
+    "shipment_service_level_category",
+)
+
+STAGE_DDL = """
+CREATE TEMP TABLE IF NOT EXISTS _orders_stage (
+    amazon_order_id text, purchase_date timestamptz, order_status text, order_total_amount numeric,
+    order_total_currency text, buyer_email text, buyer_name text, marketplace_id text,
+    fulfillment_channel text, sales_channel text, ship_service_level text,
+    number_of_items_shipped integer, number_of_items_unshipped integer, is_prime boolean,
+    shipment_service_level_category text
+) ON COMMIT DELETE ROWS
+"""
+
+# Only for empty databases (tests, the mock server); production has the backend's table
+ORDERS_DDL = """
+CREATE TABLE IF NOT EXISTS orders (
+    id bigserial PRIMARY KEY,
+    amazon_order_id text UNIQUE NOT NULL, purchase_date timestamptz, order_status text,
+    order_total_amount numeric, order_total_currency text, buyer_email text, buyer_name text,
+    marketplace_id text, fulfillment_channel text, sales_channel text, ship_service_level text,
+    number_of_items_shipped integer, number_of_items_unshipped integer, is_prime boolean,
+    shipment_service_level_category text, created_at timestamptz DEFAULT now(), updated_at timestamptz
+)
+"""
+
+_cols = ", ".join(ORDER_COLUMNS)
+_updates = ", ".join(f"{c} = EXCLUDED.{c}" for c in ORDER_COLUMNS[1:])
+UPSERT_SQL = f"""
+INSERT INTO orders ({_cols}, updated_at)
+SELECT DISTINCT ON (amazon_order_id) {_cols}, now() FROM _orders_stage ORDER BY amazon_order_id
+ON CONFLICT (amazon_order_id) DO UPDATE SET {_updates}, updated_at = now()
+"""
+
+
+def libpq_dsn(dsn: str) -> str:
+    """
+    Accept SQLAlchemy URLs too (postgresql+psycopg2://...).
+    """
+    scheme, sep, rest = dsn.partition("://")
+    return f"{scheme.split('+', 1)[0]}{sep}{rest}" if sep else dsn
+
+
+def order_row(order: dict) -> tuple:
+    total = order.get("OrderTotal") or {}
+    return (
+        order["AmazonOrderId"], order.get("PurchaseDate"), order.get("OrderStatus"),
+        total.get("Amount", 0), total.get("CurrencyCode", "USD"),
+        (order.get("BuyerInfo") or {}).get("BuyerEmail") or order.get("BuyerEmail"),
+        (order.get("BuyerInfo") or {}).get("BuyerName") or order.get("BuyerName"),
+        order.get("MarketplaceId"), order.get("FulfillmentChannel"), order.get("SalesChannel"),
+        order.get("ShipServiceLevel"), order.get("NumberOfItemsShipped", 0),
+        order.get("NumberOfItemsUnshipped", 0), order.get("IsPrime", False),
+        order.get("ShipmentServiceLevelCategory"),
+    )
+
+
+class OrdersLoader:
+    """
+    Synchronous (psycopg2) loader; the pipeline calls it from a worker
+    thread so fetching continues while a batch is written.
+    """
+
+    def __init__(self, dsn: str, create_table: bool = False):
+        self.conn = psycopg2.connect(libpq_dsn(dsn), application_name="spapi-ingest")
+        self.loaded = 0
+        with self.conn, self.conn.cursor() as cur:
+            if create_table:
+                cur.execute(ORDERS_DDL)
+            cur.execute(STAGE_DDL)
+
+    def load(self, orders: list[dict]) -> int:
+        if not orders:
+            return 0
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        for order in orders:
+            writer.writerow(order_row(order))
+        buf.seek(0)
+        with self.conn, self.conn.cursor() as cur:
+            cur.copy_expert(f"COPY _orders_stage ({_cols}) FROM STDIN WITH (FORMAT csv)", buf)
+            cur.execute(UPSERT_SQL)
+            count = cur.rowcount
+        self.loaded += count
+        return count
+
+    def close(self):
+        self.conn.close()
+
+
+@dataclass(frozen=True)
+class ReportSpec:
+    """
+    How one report type is loaded: the report header names copied into
+    `stage` (in stage column order) and the statement merging a committed
+    chunk into the target table. `key` is the report column rows are
+    grouped by; chunks only end where it changes.
+    """
+    report_type: str
+    stage: str
+    stage_ddl: str
+    columns: dict[str, str]
+    merge_sql: str
+    key: str
+
+
+# One row per order item; items of an order are adjacent in the file
+ALL_ORDERS = ReportSpec(
+    report_type="GET_FLAT_FILE_ALL_ORDERS_DATA_BY_ORDER_DATE_GENERAL",
+    stage="_report_orders_stage",
+    stage_ddl="""
+CREATE TEMP TABLE IF NOT EXISTS _report_orders_stage (
+    amazon_order_id text, purchase_date timestamptz, order_status text, fulfillment_channel text,
+    sales_channel text, ship_service_level text, item_status text, quantity integer,
+    currency text, item_price numeric
+) ON COMMIT DELETE ROWS
+""",
+    columns={
+        "amazon-order-id": "amazon_order_id", "purchase-date": "purchase_date", "order-status": "order_status",
+        "fulfillment-channel": "fulfillment_channel", "sales-channel": "sales_channel",
+        "ship-service-level": "ship_service_level", "item-status": "item_status", "quantity": "quantity",
+        "currency": "currency", "item-price": "item_price",
+    },
+    # Only the columns the report carries are written: buyer fields from the
+    # Orders API are left alone
+    merge_sql="""
+INSERT INTO orders (amazon_order_id, purchase_date, order_status, order_total_amount, order_total_currency,
+                    marketplace_id, fulfillment_channel, sales_channel, ship_service_level,
+                    number_of_items_shipped, number_of_items_unshipped, updated_at)
+SELECT amazon_order_id, MIN(purchase_date), MAX(order_status), COALESCE(SUM(item_price), 0),
+       COALESCE(MAX(currency), 'USD'), %(marketplace_id)s,
+       CASE MAX(fulfillment_channel) WHEN 'Amazon' THEN 'AFN' WHEN 'Merchant' THEN 'MFN'
+            ELSE MAX(fulfillment_channel) END,
+       MAX(sales_channel), MAX(ship_service_level),
+       COALESCE(SUM(quantity) FILTER (WHERE item_status = 'Shipped'), 0),
+       COALESCE(SUM(quantity) FILTER (WHERE item_status <> 'Shipped'), 0), now()
+FROM _report_orders_stage
+GROUP BY amazon_order_id
+ON CONFLICT (amazon_order_id) DO UPDATE SET
+    purchase_date = EXCLUDED.purchase_date, order_status = EXCLUDED.order_status,
+    order_total_amount = EXCLUDED.order_total_amount, order_total_currency = EXCLUDED.order_total_currency,
+    marketplace_id = EXCLUDED.marketplace_id, fulfillment_channel = EXCLUDED.fulfillment_channel,
+    sales_channel = EXCLUDED.sales_channel, ship_service_level = EXCLUDED.ship_service_level,
+    number_of_items_shipped = EXCLUDED.number_of_items_shipped,
+    number_of_items_unshipped = EXCLUDED.number_of_items_unshipped, updated_at = now()
+""",
+    key="amazon-order-id",
+)
+
+REPORT_SPECS = {spec.report_type: spec for spec in (ALL_ORDERS,)}
+
+CHECKPOINT_DDL = """
+CREATE TABLE IF NOT EXISTS spapi_report_checkpoints (
+    report_type text NOT NULL,
+    marketplace_ids text NOT NULL,
+    data_start timestamptz NOT NULL,
+    data_end timestamptz NOT NULL,
+    report_id text,
+    document_id text,
+    status text NOT NULL DEFAULT 'pending',
+    rows_loaded bigint NOT NULL DEFAULT 0,
+    updated_at timestamptz NOT NULL DEFAULT now(),
+    PRIMARY KEY (report_type, marketplace_ids, data_start, data_end)
+)
+"""
+
+CHECKPOINT_SQL = """
+INSERT INTO spapi_report_checkpoints (report_type, marketplace_ids, data_start, data_end)
+VALUES (%(report_type)s, %(marketplace_ids)s, %(data_start)s, %(data_end)s)
+ON CONFLICT DO NOTHING;
+SELECT report_id, document_id, status, rows_loaded FROM spapi_report_checkpoints
+WHERE report_type = %(report_type)s AND marketplace_ids = %(marketplace_ids)s
+  AND data_start = %(data_start)s AND data_end = %(data_end)s
+"""
+
+_CHECKPOINT_WHERE = ("WHERE report_type = %(report_type)s AND marketplace_ids = %(marketplace_ids)s "
+                     "AND data_start = %(data_start)s AND data_end = %(data_end)s")
+
+
+def _copy_text(field: str) -> str:
+    # COPY text format: backslash is the escape character; tabs and
+    # newlines cannot occur inside a TSV field
+    return field.replace("\\", "\\\\") if "\\" in field else field
+
+
+class _CopySource:
+    """
+    File-like object handed to copy_expert: reads report rows from an
+    iterator, keeps the stage columns and stops after `limit` rows at the
+    next change of the key column, so one COPY never splits an order.
+    """
+
+    def __init__(self, rows: Iterator[list[str]], indexes: list[int], key_index: int, limit: int):
+        self.rows = rows
+        self.indexes = indexes
+        self.key_index = key_index
+        self.limit = limit
+        self.count = 0
+        self.pending: list[str] | None = None
+        self.exhausted = False
+        self._last_key = None
+
+    def read(self, size: int = 8192) -> str:
+        out, length = [], 0
+        while length < size:
+            fields = self.pending or next(self.rows, None)
+            self.pending = None
+            if fields is None:
+                self.exhausted = True
+                break
+            key = fields[self.key_index] if self.key_index < len(fields) else None
+            if self.count >= self.limit and key != self._last_key:
+                self.pending = fields
+                break
+            self._last_key = key
+            self.count += 1
+            line = "\t".join(_copy_text(fields[i]) if i < len(fields) else "" for i in self.indexes) + "\n"
+            out.append(line)
+            length += len(line)
+        return "".join(out)
+
+
+class ReportLoader:
+    """
+    Loads one report document per call, committing every `chunk_rows`
+    rows (rounded up to an order boundary) with its checkpoint.
+    """
+
+    def __init__(self, dsn: str, spec: ReportSpec, create_table: bool = False, chunk_rows: int = 50_000):
+        self.conn = psycopg2.connect(libpq_dsn(dsn), application_name="spapi-reports")
+        self.spec = spec
+        self.chunk_rows = chunk_rows
+        self.loaded = 0
+        with self.conn, self.conn.cursor() as cur:
+            if create_table:
+                cur.execute(ORDERS_DDL)
+            cur.execute(CHECKPOINT_DDL)
+            cur.execute(spec.stage_ddl)
+
+    def checkpoint(self, key: dict) -> dict:
+        with self.conn, self.conn.cursor() as cur:
+            cur.execute(CHECKPOINT_SQL, key)
+            report_id, document_id, status, rows_loaded = cur.fetchone()
+        return {"report_id": report_id, "document_id": document_id, "status": status, "rows_loaded": rows_loaded}
+
+    def save(self, key: dict, **fields):
+        sets = ", ".join(f"{k} = %({k})s" for k in fields)
+        with self.conn, self.conn.cursor() as cur:
+            cur.execute(f"UPDATE spapi_report_checkpoints SET {sets}, updated_at = now() {_CHECKPOINT_WHERE}",
+                        {**key, **fields})
+
+    def load(self, key: dict, rows: Iterator[list[str]], skip: int, params: dict, log=None) -> int:
+        """
+        Copy `rows` (the header first) after skipping the `skip` data rows a
+        previous run already committed. Returns the data rows loaded now.
+        """
+        header = next(rows, None)
+        if header is None:
+            return 0
+        missing = [c for c in self.spec.columns if c not in header]
+        if missing:
+            raise ValueError(f"{self.spec.report_type}: columns missing from report: {missing}")
+        indexes = [header.index(c) for c in self.spec.columns]
+        for _ in range(skip):
+            if next(rows, None) is None:
+                return 0
+        stage_cols = ", ".join(self.spec.columns.values())
+        copy_sql = f"COPY {self.spec.stage} ({stage_cols}) FROM STDIN WITH (FORMAT text, NULL '')"
+        loaded, pending = 0, None
+        while True:
+            source = _CopySource(rows, indexes, header.index(self.spec.key), self.chunk_rows)
+            source.pending = pending
+            with self.conn, self.conn.cursor() as cur:
+                cur.copy_expert(copy_sql, source, size=1 << 16)
+                if source.count:
+                    cur.execute(self.spec.merge_sql, params)
+                    cur.execute(f"UPDATE spapi_report_checkpoints SET rows_loaded = rows_loaded + %(n)s, "
+                                f"updated_at = now() {_CHECKPOINT_WHERE}", {**key, "n": source.count})
+            loaded += source.count
+            self.loaded += source.count
+            if log and source.count:
+                log(loaded + skip)
+            if source.exhausted:
+                return loaded
+            pending = source.pending
+
+    def close(self):
+        self.conn.close()
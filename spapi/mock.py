@@ -0,0 +1,278 @@
+"""
+Local stand-in for LWA and the SP-API Orders and Reports endpoints.
+
+Serves a deterministic set of synthetic orders with NextToken paging and
+enforces the real usage plan per operation with its own token buckets:
+requests over quota get 429, and every response carries
+x-amzn-RateLimit-Limit. `rate_scale` speeds the quotas up for tests.
+
+Reports become DONE `report_delay` seconds after createReport; their
+documents are the all-orders flat file (one row per item), generated and
+gzip'd while streaming. With `drop_after` the first download of each
+document is cut after that many bytes, to exercise resuming.
+
+    python -m spapi.mock --port 8099 --orders 20000 --rate-scale 100
+"""
+import argparse
+import base64
+import datetime as dt
+import json
+import time
+import uuid
+import zlib
+
+from aiohttp import web
+
+from spapi.ratelimit import OPERATION_LIMITS
+
+EPOCH = dt.datetime(2024, 1, 1, tzinfo=dt.timezone.utc)
+
+
+class _Bucket:
+    # Synchronous twin of ratelimit.TokenBucket: the server rejects instead of waiting
+    def __init__(self, rate: float, burst: int):
+        self.rate, self.burst, self.tokens, self.updated = rate, burst, float(burst), time.monotonic()
+
+    def take(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+def synthetic_order(n: int) -> dict:
+    purchased = EPOCH + dt.timedelta(minutes=7 * n)
+    return {
+        "AmazonOrderId": f"111-{n:07d}-{(n * 7919) % 10_000_000:07d}",
+        "PurchaseDate": purchased.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "LastUpdateDate": purchased.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "OrderStatus": ("Shipped", "Unshipped", "Pending", "Canceled")[n % 4],
+        "OrderTotal": {"CurrencyCode": "USD", "Amount": f"{10 + (n % 90) + 0.99:.2f}"},
+        "MarketplaceId": "ATVPDKIKX0DER",
+        "FulfillmentChannel": "AFN" if n % 3 else "MFN",
+        "SalesChannel": "Amazon.com",
+        "ShipServiceLevel": "Std US D2D Dom",
+        "NumberOfItemsShipped": n % 3,
+        "NumberOfItemsUnshipped": (n + 1) % 2,
+        "IsPrime": n % 5 == 0,
+        "ShipmentServiceLevelCategory": "Standard",
+        "BuyerInfo": {"BuyerEmail": f"buyer{n}@marketplace.amazon.com"},
+    }
+
+
+REPORT_HEADER = (
+    "amazon-order-id", "merchant-order-id", "purchase-date", "last-updated-date", "order-status",
+    "fulfillment-channel", "sales-channel", "order-channel", "ship-service-level", "product-name", "sku",
+    "asin", "item-status", "quantity", "currency", "item-price", "item-tax", "shipping-price",
+    "ship-city", "ship-state", "ship-postal-code", "ship-country", "is-business-order",
+)
+
+
+def report_rows(order: dict, n: int) -> list[str]:
+    total = float(order["OrderTotal"]["Amount"])
+    items = 1 + n % 3
+    status = {"Shipped": "Shipped", "Canceled": "Cancelled"}.get(order["OrderStatus"], "Unshipped")
+    rows = []
+    for i in range(items):
+        fields = (
+            order["AmazonOrderId"], "", order["PurchaseDate"], order["LastUpdateDate"], order["OrderStatus"],
+            "Amazon" if order["FulfillmentChannel"] == "AFN" else "Merchant", order["SalesChannel"], "",
+            order["ShipServiceLevel"], f"Product {n % 500} variant {i}", f"SKU-{n % 500}-{i}",
+            f"B0{(n * 31 + i) % 10**8:08d}", status, "1", "USD", f"{total / items:.2f}", "0.00", "0.00",
+            "Seattle", "WA", "98109", "US", "false",
+        )
+        rows.append("\t".join(fields))
+    return rows
+
+
+class MockSpApi:
+    def __init__(self, orders: int = 1000, rate_scale: float = 1.0, token_ttl: int = 3600,
+                 report_delay: float = 2.0, drop_after: int | None = None):
+        self.orders = [synthetic_order(n) for n in range(orders)]
+        self.rate_scale = rate_scale
+        self.token_ttl = token_ttl
+        self.report_delay = report_delay
+        self.drop_after = drop_after
+        self.tokens: dict[str, float] = {}
+        self.buckets: dict[str, _Bucket] = {}
+        self.reports: dict[str, dict] = {}
+        self.dropped: set[str] = set()
+        self.stats = {"token_requests": 0, "requests": 0, "throttled": 0, "reports": 0, "downloads": 0}
+
+    def _bucket(self, operation: str) -> _Bucket:
+        if operation not in self.buckets:
+            rate, burst = OPERATION_LIMITS[operation]
+            self.buckets[operation] = _Bucket(rate * self.rate_scale, burst)
+        return self.buckets[operation]
+
+    async def token(self, request: web.Request) -> web.Response:
+        form = await request.post()
+        self.stats["token_requests"] += 1
+        if form.get("grant_type") != "refresh_token" or not form.get("refresh_token"):
+            return web.json_response({"error": "invalid_request"}, status=400)
+        token = f"Atza|{uuid.uuid4().hex}"
+        self.tokens[token] = time.time() + self.token_ttl
+        return web.json_response({"access_token": token, "token_type": "bearer", "expires_in": self.token_ttl})
+
+    def _authorized(self, request: web.Request) -> bool:
+        return self.tokens.get(request.headers.get("x-amz-access-token", ""), 0) > time.time()
+
+    def _gate(self, request: web.Request, operation: str) -> tuple[dict, web.Response | None]:
+        """
+        Authorization and usage plan shared by every operation: returns the
+        rate limit header and the error response, if any.
+        """
+        self.stats["requests"] += 1
+        bucket = self._bucket(operation)
+        headers = {"x-amzn-RateLimit-Limit": f"{bucket.rate:g}"}
+        if not self._authorized(request):
+            return headers, web.json_response({"errors": [{"code": "Unauthorized"}]}, status=403, headers=headers)
+        if not bucket.take():
+            self.stats["throttled"] += 1
+            return headers, web.json_response({"errors": [{"code": "QuotaExceeded"}]}, status=429,
+                                              headers=headers)
+        return headers, None
+
+    async def get_orders(self, request: web.Request) -> web.Response:
+        headers, error = self._gate(request, "getOrders")
+        if error:
+            return error
+
+        q = request.query
+        if "NextToken" in q:
+            cursor = json.loads(base64.urlsafe_b64decode(q["NextToken"]))
+        else:
+            if "CreatedAfter" not in q and "LastUpdatedAfter" not in q:
+                return web.json_response({"errors": [{"code": "InvalidInput"}]}, status=400, headers=headers)
+            cursor = {"after": q.get("CreatedAfter") or q["LastUpdatedAfter"], "before": q.get("CreatedBefore"),
+                      "size": min(int(q.get("MaxResultsPerPage", 100)), 100), "offset": 0}
+        matching = [o for o in self.orders if o["PurchaseDate"] >= cursor["after"]
+                    and (not cursor["before"] or o["PurchaseDate"] < cursor["before"])]
+        page = matching[cursor["offset"]:cursor["offset"] + cursor["size"]]
+        payload = {"Orders": page, "CreatedBefore": cursor["before"]}
+        if cursor["offset"] + cursor["size"] < len(matching):
+            nxt = {**cursor, "offset": cursor["offset"] + cursor["size"]}
+            payload["NextToken"] = base64.urlsafe_b64encode(json.dumps(nxt).encode()).decode()
+        return web.json_response({"payload": payload}, headers=headers)
+
+    # -- Reports -------------------------------------------------------------
+    async def create_report(self, request: web.Request) -> web.Response:
+        headers, error = self._gate(request, "createReport")
+        if error:
+            return error
+        body = await request.json()
+        report_id = str(50_000 + len(self.reports))
+        self.reports[report_id] = {"reportType": body["reportType"], "dataStartTime": body.get("dataStartTime", ""),
+                                   "dataEndTime": body.get("dataEndTime", ""), "created": time.monotonic()}
+        self.stats["reports"] += 1
+        return web.json_response({"reportId": report_id}, status=202, headers=headers)
+
+    def _orders_in(self, report: dict) -> list[tuple[int, dict]]:
+        return [(n, o) for n, o in enumerate(self.orders)
+                if o["PurchaseDate"] >= report["dataStartTime"]
+                and (not report["dataEndTime"] or o["PurchaseDate"] < report["dataEndTime"])]
+
+    async def get_report(self, request: web.Request) -> web.Response:
+        headers, error = self._gate(request, "getReport")
+        if error:
+            return error
+        report_id = request.match_info["report_id"]
+        report = self.reports.get(report_id)
+        if report is None:
+            return web.json_response({"errors": [{"code": "NotFound"}]}, status=404, headers=headers)
+        age = time.monotonic() - report["created"]
+        body = {"reportId": report_id, "reportType": report["reportType"],
+                "dataStartTime": report["dataStartTime"], "dataEndTime": report["dataEndTime"]}
+        if age < self.report_delay / 2:
+            body["processingStatus"] = "IN_QUEUE"
+        elif age < self.report_delay:
+            body["processingStatus"] = "IN_PROGRESS"
+        elif not self._orders_in(report):
+            body["processingStatus"] = "CANCELLED"
+        else:
+            body["processingStatus"] = "DONE"
+            body["reportDocumentId"] = f"amzn1.spdoc.1.4.na.{report_id}"
+        return web.json_response(body, headers=headers)
+
+    async def get_report_document(self, request: web.Request) -> web.Response:
+        headers, error = self._gate(request, "getReportDocument")
+        if error:
+            return error
+        document_id = request.match_info["document_id"]
+        url = str(request.url.with_path(f"/documents/{document_id}").with_query({"expires": int(time.time()) + 300}))
+        return web.json_response({"reportDocumentId": document_id, "url": url, "compressionAlgorithm": "GZIP"},
+                                 headers=headers)
+
+    async def download(self, request: web.Request) -> web.StreamResponse:
+        # The pre-signed S3 URL: no access token, no usage plan
+        document_id = request.match_info["document_id"]
+        report = self.reports.get(document_id.rsplit(".", 1)[1])
+        if report is None:
+            return web.Response(status=404)
+        self.stats["downloads"] += 1
+        drop = self.drop_after if self.drop_after and document_id not in self.dropped else None
+        self.dropped.add(document_id)
+
+        resp = web.StreamResponse(headers={"Content-Type": "text/tab-separated-values; charset=utf-8"})
+        await resp.prepare(request)
+        deflate = zlib.compressobj(wbits=31)
+        sent, lines = 0, ["\t".join(REPORT_HEADER)]
+        orders = self._orders_in(report)
+        for i, (n, order) in enumerate(orders):
+            lines.extend(report_rows(order, n))
+            if len(lines) >= 2000 or i == len(orders) - 1:
+                data = deflate.compress(("\n".join(lines) + "\n").encode())
+                if i == len(orders) - 1:
+                    data += deflate.flush()
+                lines = []
+                if drop is not None and sent + len(data) > drop:
+                    await resp.write(data[:max(0, drop - sent)])
+                    # cut the connection mid-body, as a dropped transfer would
+                    request.transport.close()
+                    return resp
+                await resp.write(data)
+                sent += len(data)
+        await resp.write_eof()
+        return resp
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/auth/o2/token", self.token)
+        app.router.add_get("/orders/v0/orders", self.get_orders)
+        app.router.add_post("/reports/2021-06-30/reports", self.create_report)
+        app.router.add_get("/reports/2021-06-30/reports/{report_id}", self.get_report)
+        app.router.add_get("/reports/2021-06-30/documents/{document_id}", self.get_report_document)
+        app.router.add_get("/documents/{document_id}", self.download)
+        return app
+
+
+async def start_mock(port: int = 0, **kwargs) -> tuple[MockSpApi, web.AppRunner, str]:
+    """
+    Start the mock on localhost; returns (mock, runner, base_url).
+    """
+    mock = MockSpApi(**kwargs)
+    runner = web.AppRunner(mock.app())
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", port)
+    await site.start()
+    bound = site._server.sockets[0].getsockname()[1]
+    return mock, runner, f"http://127.0.0.1:{bound}"
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--port", type=int, default=8099)
+    ap.add_argument("--orders", type=int, default=1000)
+    ap.add_argument("--rate-scale", type=float, default=1.0)
+    ap.add_argument("--report-delay", type=float, default=2.0, help="seconds until a report is DONE")
+    ap.add_argument("--drop-after", type=int, help="cut each document's first download after N bytes")
+    args = ap.parse_args(argv)
+    mock = MockSpApi(args.orders, args.rate_scale, report_delay=args.report_delay, drop_after=args.drop_after)
+    web.run_app(mock.app(), host="127.0.0.1", port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Client-side rate limiting for SP-API operations.
+
+Every operation has a usage plan: a sustained rate (requests/second) and a
+burst. A token bucket per operation enforces it before the request is sent,
+so the pipeline runs at exactly the quota instead of discovering it through
+429s. Responses carry x-amzn-RateLimit-Limit, the rate actually granted to
+this seller/application, which replaces the default. A 429 empties the
+bucket so every caller waits for the next token.
+"""
+import asyncio
+import time
+
+# Default usage plans (rate/s, burst) from the SP-API Orders v0 reference
+OPERATION_LIMITS = {
+    "getOrders": (0.0167, 20),
+    "getOrder": (0.5, 30),
+    "getOrderItems": (0.5, 30),
+    "getOrderAddress": (0.5, 30),
+    "getOrderBuyerInfo": (0.5, 30),
+    "createReport": (0.0167, 15),
+    "getReport": (2.0, 15),
+    "getReportDocument": (0.0167, 15),
+}
+DEFAULT_LIMIT = (1.0, 5)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = float(rate)
+        self.burst = int(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        # The lock makes waiters queue in order instead of all waking for one token
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def set_rate(self, rate: float):
+        self._refill()
+        self.rate = float(rate)
+
+    def drain(self):
+        self._refill()
+        self.tokens = 0.0
+
+
+class RateLimiter:
+    def __init__(self, limits: dict[str, tuple[float, int]] | None = None, scale: float = 1.0):
+        """
+        `scale` multiplies every rate (used against the mock server).
+        """
+        self.limits = {**OPERATION_LIMITS, **(limits or {})}
+        self.scale = scale
+        self._buckets: dict[str, TokenBucket] = {}
+        self.throttled = 0
+
+    def bucket(self, operation: str) -> TokenBucket:
+        if operation not in self._buckets:
+            rate, burst = self.limits.get(operation, DEFAULT_LIMIT)
+            self._buckets[operation] = TokenBucket(rate * self.scale, burst)
+        return self._buckets[operation]
+
+    async def acquire(self, operation: str):
+        await self.bucket(operation).acquire()
+
+    def observe(self, operation: str, headers):
+        limit = headers.get("x-amzn-RateLimit-Limit")
+        if limit:
+            try:
+                self.bucket(operation).set_rate(float(limit))
+            except ValueError:
+                pass
+
+    def on_throttled(self, operation: str):
+        self.throttled += 1
+        self.bucket(operation).drain()
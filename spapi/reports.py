@@ -0,0 +1,330 @@
+"""
+Reports API backfill.
+
+Loading history through getOrders costs one request per 100 orders at
+one request a minute. A flat-file report returns a whole window of orders
+in one document, so a year is a dozen reports. The pipeline for each
+window:
+
+    createReport -> getReport (poll with backoff) -> getReportDocument
+    -> stream the gzip'd TSV -> gunzip -> decode -> split lines -> COPY
+
+Network I/O stays on the event loop; decompressed text blocks cross a
+bounded queue to a worker thread that parses and feeds COPY FROM STDIN,
+so memory is a few blocks however large the document is. The report id,
+document id and rows committed per window live in
+spapi_report_checkpoints: a rerun skips finished windows, reuses reports
+already requested and resumes a document after its last committed chunk.
+
+    DATABASE_URL=postgresql://... python -m spapi.reports --since 2024-01-01
+
+Against the mock server:
+
+    python -m spapi.mock --orders 75000 --rate-scale 100 &
+    python -m spapi.reports --mock-url http://127.0.0.1:8099 --rate-scale 100 --since 2024-01-01 --create-table
+"""
+import argparse
+import asyncio
+import codecs
+import datetime as dt
+import json
+import os
+import queue
+import sys
+import time
+import zlib
+from typing import AsyncIterator, Iterable, Iterator
+
+import aiohttp
+
+from spapi.auth import LWA_ENDPOINT, LwaTokenCache
+from spapi.client import NA_ENDPOINT, SpApiClient
+from spapi.ingest import _iso
+from spapi.load import ALL_ORDERS, REPORT_SPECS, ReportLoader, ReportSpec
+from spapi.ratelimit import RateLimiter
+
+# Amazon caps the order-date flat files at 30 days per report
+WINDOW_DAYS = 30
+_END = object()
+
+
+class ReportError(Exception):
+    pass
+
+
+def report_windows(start: dt.datetime, end: dt.datetime, days: int = WINDOW_DAYS) -> list[tuple[str, str]]:
+    windows, step = [], dt.timedelta(days=days)
+    while start < end:
+        windows.append((_iso(start), _iso(min(start + step, end))))
+        start += step
+    return windows
+
+
+async def wait_for_report(client: SpApiClient, report_id: str, first_delay: float = 2.0,
+                          max_delay: float = 60.0, timeout: float = 3600.0) -> dict:
+    """
+    Poll getReport until the report leaves IN_QUEUE/IN_PROGRESS, waiting
+    longer between polls (x1.5 up to `max_delay`).
+    """
+    delay, deadline = first_delay, time.monotonic() + timeout
+    while True:
+        report = await client.get_report(report_id)
+        if report.get("processingStatus") in ("DONE", "CANCELLED", "FATAL"):
+            return report
+        if time.monotonic() + delay > deadline:
+            raise ReportError(f"report {report_id} still {report.get('processingStatus')} after {timeout:.0f}s")
+        await asyncio.sleep(delay)
+        delay = min(max_delay, delay * 1.5)
+
+
+async def document_blocks(client: SpApiClient, document: dict, encoding: str = "utf-8",
+                          stats: dict | None = None) -> AsyncIterator[str]:
+    """
+    Download a report document and yield it as decoded text blocks,
+    decompressing as bytes arrive.
+    """
+    inflate = zlib.decompressobj(wbits=31) if document.get("compressionAlgorithm") == "GZIP" else None
+    decoder = None
+    async for chunk, charset in client.stream(document["url"]):
+        if stats is not None:
+            stats["bytes"] += len(chunk)
+        if inflate:
+            data = inflate.decompress(chunk)
+            # concatenated gzip members: start a new inflater on the remainder
+            while inflate.eof and inflate.unused_data:
+                rest = inflate.unused_data
+                inflate = zlib.decompressobj(wbits=31)
+                data += inflate.decompress(rest)
+        else:
+            data = chunk
+        if decoder is None:
+            decoder = codecs.getincrementaldecoder(charset or encoding)(errors="replace")
+        text = decoder.decode(data)
+        if text:
+            yield text
+    if inflate and not inflate.eof:
+        raise zlib.error("truncated gzip stream")
+    if decoder is not None:
+        tail = decoder.decode(b"", final=True)
+        if tail:
+            yield tail
+
+
+def iter_lines(blocks: Iterable[str]) -> Iterator[str]:
+    tail = ""
+    for block in blocks:
+        lines = (tail + block).split("\n")
+        tail = lines.pop()
+        yield from lines
+    if tail:
+        yield tail
+
+
+def iter_rows(lines: Iterable[str]) -> Iterator[list[str]]:
+    for line in lines:
+        line = line.rstrip("\r")
+        if line:
+            yield line.split("\t")
+
+
+class _BlockQueue:
+    """
+    Bounded hand-off from the event loop to the loader thread. An
+    exception put by the producer is re-raised in the consumer, so a
+    dropped download rolls back the chunk in progress.
+    """
+
+    def __init__(self, maxsize: int = 16):
+        self.q: queue.Queue = queue.Queue(maxsize)
+        self.closed = False
+
+    async def put(self, item):
+        while True:
+            try:
+                self.q.put_nowait(item)
+                return
+            except queue.Full:
+                if self.closed:
+                    return
+                await asyncio.sleep(0.005)
+
+    def __iter__(self) -> Iterator[str]:
+        while True:
+            item = self.q.get()
+            if item is _END:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+
+
+async def load_document(client: SpApiClient, loader: ReportLoader, key: dict, document: dict, skip: int,
+                        params: dict, encoding: str, stats: dict, log=None) -> int:
+    blocks = _BlockQueue()
+
+    def consume():
+        try:
+            return loader.load(key, iter_rows(iter_lines(blocks)), skip, params, log)
+        finally:
+            blocks.closed = True
+
+    consumer = asyncio.create_task(asyncio.to_thread(consume))
+    error = None
+    try:
+        async for text in document_blocks(client, document, encoding, stats):
+            if blocks.closed:
+                break
+            await blocks.put(text)
+        await blocks.put(_END)
+    except BaseException as e:
+        error = e
+        await blocks.put(e)
+    # the consumer must finish (or roll back) before the connection is reused
+    try:
+        loaded = await asyncio.shield(consumer)
+    except Exception:
+        if error is None:
+            raise
+    if error is not None:
+        # COPY fails with the download's error wrapped; raise the original
+        raise error
+    return loaded
+
+
+async def load_window(client: SpApiClient, dsn: str, spec: ReportSpec, marketplace_ids: list[str],
+                      window: tuple[str, str], stats: dict, create_table: bool = False,
+                      chunk_rows: int = 50_000, encoding: str = "utf-8", attempts: int = 3,
+                      poll_delay: float = 2.0, slots: asyncio.Semaphore | None = None, log=None):
+    key = {"report_type": spec.report_type, "marketplace_ids": ",".join(marketplace_ids),
+           "data_start": window[0], "data_end": window[1]}
+    loader = await asyncio.to_thread(ReportLoader, dsn, spec, create_table, chunk_rows)
+    try:
+        state = await asyncio.to_thread(loader.checkpoint, key)
+        if state["status"] == "done":
+            stats["windows_skipped"] += 1
+            return
+        if not state["report_id"]:
+            state["report_id"] = await client.create_report(spec.report_type, marketplace_ids, *window)
+            stats["reports_created"] += 1
+            await asyncio.to_thread(loader.save, key, report_id=state["report_id"], status="requested")
+        report = await wait_for_report(client, state["report_id"], first_delay=poll_delay)
+        status = report["processingStatus"]
+        if status == "CANCELLED":
+            # no data in the window
+            await asyncio.to_thread(loader.save, key, status="done")
+            return
+        if status == "FATAL":
+            # a failed report cannot be retried: request a new one next run
+            await asyncio.to_thread(loader.save, key, report_id=None, status="pending")
+            raise ReportError(f"report {state['report_id']} for {window[0]}..{window[1]} failed")
+        document_id = report["reportDocumentId"]
+        skip = state["rows_loaded"]
+        if state["document_id"] != document_id:
+            skip = 0
+            await asyncio.to_thread(loader.save, key, document_id=document_id, rows_loaded=0, status="loading")
+
+        def progress(n):
+            if log:
+                log(f"{window[0][:10]}..{window[1][:10]}: {n} rows")
+
+        async with slots or asyncio.Semaphore():
+            for attempt in range(attempts):
+                # pre-signed URLs expire after minutes: ask for a fresh one on every attempt
+                document = await client.get_report_document(document_id)
+                try:
+                    await load_document(client, loader, key, document, skip,
+                                        {"marketplace_id": marketplace_ids[0]}, encoding, stats, progress)
+                    break
+                except (aiohttp.ClientError, OSError, asyncio.TimeoutError, zlib.error) as e:
+                    if attempt == attempts - 1:
+                        raise
+                    stats["resumes"] += 1
+                    skip = (await asyncio.to_thread(loader.checkpoint, key))["rows_loaded"]
+                    if log:
+                        log(f"{window[0][:10]}..{window[1][:10]}: download failed ({e!r}), "
+                            f"resuming after row {skip}")
+        await asyncio.to_thread(loader.save, key, status="done")
+        stats["windows_loaded"] += 1
+    finally:
+        stats["rows"] += loader.loaded
+        loader.close()
+
+
+async def backfill(client: SpApiClient, dsn: str, marketplace_ids: list[str], start: dt.datetime,
+                   end: dt.datetime, spec: ReportSpec = ALL_ORDERS, window_days: int = WINDOW_DAYS,
+                   concurrency: int = 3, log=None, **kwargs) -> dict:
+    """
+    Load every window of [start, end). Reports for all windows are
+    requested and polled concurrently; at most `concurrency` documents are
+    downloaded and copied at once.
+    """
+    windows = report_windows(start, end, window_days)
+    stats = {"windows": len(windows), "windows_loaded": 0, "windows_skipped": 0, "reports_created": 0,
+             "rows": 0, "bytes": 0, "resumes": 0}
+    t0 = time.perf_counter()
+    slots = asyncio.Semaphore(concurrency)
+    # create the tables once, before the windows connect concurrently
+    if windows:
+        setup = await asyncio.to_thread(ReportLoader, dsn, spec, kwargs.pop("create_table", False))
+        setup.close()
+    results = await asyncio.gather(*(load_window(client, dsn, spec, marketplace_ids, w, stats, slots=slots,
+                                                 log=log, **kwargs) for w in windows),
+                                   return_exceptions=True)
+    errors = [f"{w[0]}..{w[1]}: {r}" for w, r in zip(windows, results) if isinstance(r, BaseException)]
+    seconds = time.perf_counter() - t0
+    return {**stats, "errors": errors, "seconds": round(seconds, 2),
+            "rows_per_s": round(stats["rows"] / seconds, 1) if seconds else None,
+            "requests": client.requests, "retries": client.retries, "throttled": client.limiter.throttled}
+
+
+async def run(args) -> dict:
+    endpoint = args.mock_url or os.getenv("SPAPI_ENDPOINT", NA_ENDPOINT)
+    lwa = f"{args.mock_url}/auth/o2/token" if args.mock_url else os.getenv("LWA_ENDPOINT", LWA_ENDPOINT)
+    tokens = LwaTokenCache(os.getenv("SPAPI_CLIENT_ID", "mock" if args.mock_url else ""),
+                           os.getenv("SPAPI_CLIENT_SECRET", "mock" if args.mock_url else ""),
+                           os.getenv("SPAPI_REFRESH_TOKEN", "Atzr|mock" if args.mock_url else ""),
+                           endpoint=lwa, cache_path=args.token_cache)
+    if not (tokens.client_id and tokens.client_secret and tokens.refresh_token):
+        raise SystemExit("Set SPAPI_CLIENT_ID, SPAPI_CLIENT_SECRET and SPAPI_REFRESH_TOKEN")
+
+    end = dt.datetime.fromisoformat(args.until).replace(tzinfo=dt.timezone.utc) if args.until \
+        else dt.datetime.now(dt.timezone.utc) - dt.timedelta(minutes=2)
+    start = dt.datetime.fromisoformat(args.since).replace(tzinfo=dt.timezone.utc) if args.since \
+        else end - dt.timedelta(days=args.days)
+    async with SpApiClient(tokens, endpoint, RateLimiter(scale=args.rate_scale)) as client:
+        return await backfill(client, args.dsn, args.marketplace_ids.split(","), start, end,
+                              spec=REPORT_SPECS[args.report_type], window_days=args.window_days,
+                              concurrency=args.concurrency, create_table=args.create_table,
+                              chunk_rows=args.chunk_rows, encoding=args.encoding,
+                              poll_delay=args.poll_delay / args.rate_scale,
+                              log=lambda msg: print(msg, file=sys.stderr))
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--dsn", default=os.getenv("DATABASE_URL"), help="default: $DATABASE_URL")
+    ap.add_argument("--marketplace-ids", default=os.getenv("SPAPI_MARKETPLACE_IDS", "ATVPDKIKX0DER"))
+    ap.add_argument("--report-type", default=ALL_ORDERS.report_type, choices=sorted(REPORT_SPECS))
+    ap.add_argument("--days", type=int, default=365, help="load the last N days")
+    ap.add_argument("--since", help="ISO date (UTC) to start from instead of --days")
+    ap.add_argument("--until", help="ISO date (UTC) to stop at (default: now)")
+    ap.add_argument("--window-days", type=int, default=WINDOW_DAYS, help="days covered by each report")
+    ap.add_argument("--concurrency", type=int, default=3, help="documents downloaded and copied at once")
+    ap.add_argument("--chunk-rows", type=int, default=50_000, help="rows per commit/checkpoint")
+    ap.add_argument("--encoding", default="utf-8", help="document encoding when the server sends no charset")
+    ap.add_argument("--poll-delay", type=float, default=2.0, help="first getReport poll delay (s)")
+    ap.add_argument("--token-cache", help="LWA token cache file (default: ~/.cache/spapi/lwa-tokens.json)")
+    ap.add_argument("--mock-url", help="use the local mock server (python -m spapi.mock) for LWA and SP-API")
+    ap.add_argument("--rate-scale", type=float, default=1.0, help="multiply the default quotas (mock only)")
+    ap.add_argument("--create-table", action="store_true", help="create the orders table if missing")
+    args = ap.parse_args(argv)
+    if not args.dsn:
+        ap.error("--dsn or DATABASE_URL is required")
+    result = asyncio.run(run(args))
+    print(json.dumps(result, indent=2))
+    if result["errors"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+import os
+import sys
+import uuid
+
+# The viewer/spapi packages are imported from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+
+@pytest.fixture(scope="session")
+def pg_engine():
+    """
+    Engine for tests that need a real Postgres: set PGVIEWER_TEST_DSN.
+    """
+    dsn = os.getenv("PGVIEWER_TEST_DSN")
+    if not dsn:
+        pytest.skip("PGVIEWER_TEST_DSN is not set")
+    from sqlalchemy import create_engine
+
+    return create_engine(dsn)
+
+
+@pytest.fixture
+def pg_scratch_dsn(pg_engine):
+    """
+    libpq DSN whose search_path is a fresh schema, dropped afterwards, for
+    loaders that create and fill their own tables.
+    """
+    schema = f"test_{uuid.uuid4().hex[:12]}"
+    with pg_engine.begin() as conn:
+        conn.exec_driver_sql(f"CREATE SCHEMA {schema}")
+    url = pg_engine.url.update_query_dict({"options": f"-csearch_path={schema}"})
+    yield url.render_as_string(hide_password=False)
+    with pg_engine.begin() as conn:
+        conn.exec_driver_sql(f"DROP SCHEMA {schema} CASCADE")
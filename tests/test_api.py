@@ -0,0 +1,18 @@
+import pytest
+
+from viewer.api import ApiError, decode_cursor, encode_cursor
+
+
+def test_cursor_round_trips_null_keys():
+    key = ("2025-01-01", None, "B01", None, "Camp X")
+    assert decode_cursor(encode_cursor(key)) == key
+
+
+@pytest.mark.parametrize("key", [
+    ("2025-01-01", 1, "B01", "S1"),  # cursor from the previous, shorter key
+    ("2025-01-01", 1, "B01", "S1", "Camp X", "extra"),
+    ("2025-01-01", [1], "B01", "S1", "Camp X"),
+])
+def test_cursor_must_match_detail_key(key):
+    with pytest.raises(ApiError):
+        decode_cursor(encode_cursor(key))
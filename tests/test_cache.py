@@ -0,0 +1,24 @@
+from sqlalchemy import create_engine
+
+import viewer.cache
+from viewer.cache import ResultCache, Watermarks, cached_query
+
+
+class Recorder:
+    def __init__(self):
+        self.fetches = []
+
+    def record_fetch(self, sql, df, seconds, hit, nbytes=None):
+        self.fetches.append((hit, nbytes))
+
+
+def test_hits_reuse_the_size_measured_on_store(monkeypatch):
+    measured = []
+    monkeypatch.setattr(viewer.cache, "frame_nbytes", lambda df: measured.append(len(df)) or 1234)
+    # sqlite has no pg_stat views: the watermark degrades to a time bucket
+    engine, cache, marks, metrics = create_engine("sqlite://"), ResultCache(1 << 20), Watermarks(3600), Recorder()
+    for _ in range(3):
+        df = cached_query(cache, marks, engine, "SELECT 1 AS a UNION ALL SELECT 2", None, "pandas", metrics=metrics)
+    assert df["a"].tolist() == [1, 2]
+    assert metrics.fetches == [(False, 1234), (True, 1234), (True, 1234)]
+    assert measured == [2]
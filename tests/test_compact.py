@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from viewer.compact import compact_frame
+
+N = 100
+
+
+@pytest.mark.parametrize("arrow", [False, True])
+def test_measures_keep_64_bits_and_do_not_wrap(arrow):
+    df = pd.DataFrame({
+        "campaign_id": np.arange(N, dtype=np.int64),
+        "clicks": np.full(N, 30_000_000, dtype=np.int64),
+        "spend": np.full(N, 12.5),
+        "sales_14d": np.full(N, 100.0),
+    })
+    if arrow:
+        df = df.astype({c: pd.ArrowDtype(pa.from_numpy_dtype(df[c].dtype)) for c in df.columns})
+    out = compact_frame(df)
+    assert str(out["campaign_id"].dtype).startswith("int32")
+    assert str(out["clicks"].dtype).startswith("int64")
+    assert str(out["spend"].dtype).startswith("double" if arrow else "float64")
+    assert str(out["sales_14d"].dtype).startswith("int64")
+    assert out["clicks"].cumsum().iloc[-1] == 30_000_000 * N
+    assert (out["clicks"] * 1000).min() > 0
+
+
+def test_other_columns_are_narrowed_losslessly():
+    df = pd.DataFrame({"status": ["ok", "late"] * (N // 2), "units": np.arange(N, dtype=np.int64),
+                       "ratio": np.full(N, 0.5)})
+    out = compact_frame(df)
+    assert isinstance(out["status"].dtype, pd.CategoricalDtype)
+    assert out["units"].dtype == np.int32 and out["ratio"].dtype == np.float32
+    pd.testing.assert_frame_equal(out.astype(df.dtypes.to_dict()), df)
@@ -0,0 +1,12 @@
+from viewer.dimensions import options_sql
+from viewer.queries import AdsFilters
+from viewer.rollups import DIMENSION_LIST, dimension_list_sql
+
+
+def test_trigram_index_matches_the_substring_filter():
+    stmts = dimension_list_sql(trigram=True)
+    for column in ("campaign_name", "advertised_asin"):
+        sql, params, _ = options_sql(column, AdsFilters(), "abc", {DIMENSION_LIST}, trigram=True)
+        assert f"lower({column}) LIKE :pattern" in sql and params["pattern"] == "%abc%"
+        assert any(f"USING gin (lower({column}) gin_trgm_ops)" in s for s in stmts)
+        assert not any(f"gin ({column} gin_trgm_ops)" in s for s in stmts)
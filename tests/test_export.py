@@ -0,0 +1,25 @@
+from collections import namedtuple
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from viewer.export import export_query
+from viewer.pgtypes import arrow_schema
+
+Column = namedtuple("Column", "name type_code")
+
+
+def test_arrays_map_to_lists_or_text():
+    description = [Column("id", 23), Column("tags", 1009), Column("days", 1182)]
+    assert arrow_schema(description).field("tags").type == pa.list_(pa.string())
+    assert arrow_schema(description, arrays=False).types == [pa.int32(), pa.string(), pa.string()]
+
+
+def test_parquet_export_with_array_columns(pg_engine):
+    sql = ("SELECT 1 AS id, ARRAY['a', 'b'] AS tags, ARRAY[1, 2]::int4[] AS counts, NULL::text[] AS empty "
+           "UNION ALL SELECT 2, ARRAY[]::text[], NULL, ARRAY['x']")
+    path = export_query(pg_engine, sql, fmt="parquet")
+    table = pq.read_table(path)
+    assert table.column("id").to_pylist() == [1, 2]
+    assert table.column("tags").to_pylist() == ["{a,b}", "{}"]
+    assert table.column("counts").to_pylist() == ["{1,2}", None]
@@ -0,0 +1,28 @@
+import pandas as pd
+
+from viewer.incremental import IncrementalSeries
+from viewer.queries import AdsFilters
+
+
+def series_fetch(spend: float):
+    def fetch(sql, params=None):
+        dates = pd.date_range(params.get("dstart", "2025-01-01"), "2025-01-10")
+        return pd.DataFrame({"date": dates, "spend": spend})
+    return fetch
+
+
+def test_series_are_kept_per_database_and_relation():
+    store = IncrementalSeries()
+    filters = AdsFilters("2025-01-01", "2025-01-10")
+    a = store.get("postgresql://a/db", filters, series_fetch(1.0), "w1")
+    b = store.get("postgresql://b/db", filters, series_fetch(2.0), "w1")
+    rollup = store.get("postgresql://a/db", filters, series_fetch(3.0), "w1", relation="rollup_daily")
+    assert a["spend"].tolist() == [1.0] * 10
+    assert b["spend"].tolist() == [2.0] * 10
+    assert rollup["spend"].tolist() == [3.0] * 10
+
+    # a moved watermark refreshes only the tail, from the same database's history
+    again = store.get("postgresql://b/db", filters, series_fetch(5.0), "w2", restate_days=2)
+    assert len(again) == 10
+    assert set(again["spend"].iloc[:7]) == {2.0}
+    assert set(again["spend"].iloc[7:]) == {5.0}
@@ -0,0 +1,71 @@
+import os
+import uuid
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from viewer.snapshot import SnapshotQuery, SnapshotSource, SnapshotStore, export_source
+
+duckdb = pytest.importorskip("duckdb")
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SnapshotStore(str(tmp_path / "snapshot"))
+    store.write_part("public.sales", "2025-01", pa.table({"date": ["2025-01-01", "2025-01-02"], "units": [3, 4]}))
+    store.save_manifest({"public.sales": {"date_column": "date", "exported_through": "2025-01-02"}})
+    return store
+
+
+def run(store, sql):
+    query = SnapshotQuery(store, sql, timeout_s=30).start()
+    query._thread.join()
+    return query
+
+
+def test_views_resolve_qualified_and_unqualified(store):
+    assert run(store, "SELECT SUM(units) AS u FROM sales").preview["u"].tolist() == [7]
+    assert run(store, "SELECT COUNT(*) AS n FROM public.sales").preview["n"].tolist() == [2]
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT * FROM read_text('/etc/hostname')",
+    "COPY (SELECT 1) TO '{outside}/leak.csv'",
+    "INSTALL httpfs",
+    "LOAD httpfs",
+    "SET enable_external_access = true",
+    "ATTACH '{outside}/other.db'",
+])
+def test_free_sql_cannot_reach_outside_the_snapshot(store, tmp_path, sql):
+    query = run(store, sql.format(outside=tmp_path))
+    assert query.state == "error"
+    assert not os.path.exists(tmp_path / "leak.csv")
+
+
+def test_export_writes_to_the_export_dir(store):
+    path = store.export("SELECT * FROM sales", "csv")
+    try:
+        with open(path) as f:
+            assert f.read().splitlines() == ["date,units", "2025-01-01,3", "2025-01-02,4"]
+    finally:
+        os.remove(path)
+
+
+def test_export_source_streams_whole_and_monthly_parts(pg_engine, tmp_path):
+    table = f"public.test_snapshot_{uuid.uuid4().hex[:8]}"
+    with pg_engine.begin() as conn:
+        conn.exec_driver_sql(f"CREATE TABLE {table} AS SELECT g AS id, DATE '2025-01-30' + g AS day "
+                             f"FROM generate_series(0, 4) g")
+    store = SnapshotStore(str(tmp_path / "snapshot"))
+    folder = store.relation_dir(table)
+    try:
+        whole = export_source(pg_engine, store, SnapshotSource(table, None), {}, restate_days=3)
+        assert pq.read_table(os.path.join(folder, "all.parquet")).column("id").to_pylist() == [0, 1, 2, 3, 4]
+        monthly = export_source(pg_engine, store, SnapshotSource(table, "day"), {}, restate_days=3)
+    finally:
+        with pg_engine.begin() as conn:
+            conn.exec_driver_sql(f"DROP TABLE {table}")
+    assert whole == {"date_column": None, "rows": 5}
+    assert monthly == {"date_column": "day", "exported_through": "2025-02-03", "rows": 5}
+    assert sorted(f for f in os.listdir(folder) if f.endswith(".parquet")) == ["2025-01.parquet", "2025-02.parquet"]
@@ -0,0 +1,134 @@
+import asyncio
+import contextlib
+import datetime as dt
+
+import psycopg2
+import pytest
+from aiohttp import web
+
+from spapi.auth import LwaTokenCache
+from spapi.client import SpApiClient, SpApiError
+from spapi.ingest import ingest_orders
+from spapi.load import OrdersLoader, libpq_dsn
+from spapi.mock import EPOCH, start_mock
+from spapi.ratelimit import RateLimiter
+
+MARKETPLACES = ["ATVPDKIKX0DER"]
+SINCE = "2024-01-01T00:00:00Z"
+
+
+@contextlib.asynccontextmanager
+async def mock_client(limiter: RateLimiter, **mock_kwargs):
+    mock, runner, url = await start_mock(**mock_kwargs)
+    tokens = LwaTokenCache("mock", "mock", "Atzr|mock", endpoint=f"{url}/auth/o2/token", cache_path="")
+    try:
+        async with SpApiClient(tokens, url, limiter, backoff_base=0.01) as client:
+            yield mock, client
+    finally:
+        await runner.cleanup()
+
+
+async def fetch_all(client: SpApiClient, page_size: int) -> list[list[dict]]:
+    return [page async for page in client.iter_orders(MARKETPLACES, created_after=SINCE, page_size=page_size)]
+
+
+def test_pages_follow_next_token_to_the_end():
+    async def main():
+        async with mock_client(RateLimiter(scale=1000), orders=250, rate_scale=1000) as (mock, client):
+            return mock, client, await fetch_all(client, page_size=30)
+
+    mock, client, pages = asyncio.run(main())
+    assert [len(p) for p in pages] == [30] * 8 + [10]
+    ids = [o["AmazonOrderId"] for page in pages for o in page]
+    assert ids == [o["AmazonOrderId"] for o in mock.orders]
+    assert client.tokens.fetches == 1
+
+
+def test_throttled_requests_are_retried():
+    # the client believes it may burst 100 requests; the server allows 20, then 20/s
+    limiter = RateLimiter(limits={"getOrders": (100.0, 100)})
+
+    async def main():
+        async with mock_client(limiter, orders=400, rate_scale=1200) as (mock, client):
+            return mock, client, await fetch_all(client, page_size=10)
+
+    mock, client, pages = asyncio.run(main())
+    assert mock.stats["throttled"] > 0
+    assert client.retries == limiter.throttled == mock.stats["throttled"]
+    assert len({o["AmazonOrderId"] for page in pages for o in page}) == 400
+    # x-amzn-RateLimit-Limit replaced the configured rate
+    assert limiter.bucket("getOrders").rate == pytest.approx(0.0167 * 1200)
+
+
+async def gateway(failures: list[web.Response]):
+    """
+    Token endpoint plus a getOrders that answers with `failures` first,
+    then with one empty page. Returns (runner, base_url).
+    """
+    async def token(request):
+        return web.json_response({"access_token": "Atza|gw", "expires_in": 3600})
+
+    async def orders(request):
+        if failures:
+            return failures.pop(0)
+        return web.json_response({"payload": {"Orders": []}})
+
+    app = web.Application()
+    app.router.add_post("/auth/o2/token", token)
+    app.router.add_get("/orders/v0/orders", orders)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    return runner, f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+
+
+def gateway_errors(n: int) -> list[web.Response]:
+    return [web.Response(status=502, text="<html><body>Bad Gateway</body></html>", content_type="text/html"),
+            web.Response(status=503)] * (n // 2) + [web.Response(status=504, text="")] * (n % 2)
+
+
+async def fetch_through_gateway(failures: list[web.Response], max_retries: int = 8):
+    runner, url = await gateway(failures)
+    tokens = LwaTokenCache("gw", "gw", "Atzr|gw", endpoint=f"{url}/auth/o2/token", cache_path="")
+    try:
+        async with SpApiClient(tokens, url, RateLimiter(scale=1000), max_retries=max_retries,
+                               backoff_base=0.01) as client:
+            return client, await fetch_all(client, page_size=10)
+    finally:
+        await runner.cleanup()
+
+
+def test_gateway_errors_without_json_are_retried():
+    client, pages = asyncio.run(fetch_through_gateway(gateway_errors(3)))
+    assert pages == [[]]
+    assert client.retries == 3
+
+
+def test_exhausted_retries_report_the_last_status():
+    with pytest.raises(SpApiError) as raised:
+        asyncio.run(fetch_through_gateway(gateway_errors(3), max_retries=2))
+    assert raised.value.status == 504
+
+
+def test_ingest_loads_every_order(pg_scratch_dsn):
+    orders = 600
+    end = EPOCH + dt.timedelta(minutes=7 * orders)
+
+    async def main():
+        loader = OrdersLoader(pg_scratch_dsn, create_table=True)
+        try:
+            async with mock_client(RateLimiter(scale=1000), orders=orders, rate_scale=1000) as (mock, client):
+                first = await ingest_orders(client, loader, MARKETPLACES, EPOCH, end, slices=4, batch_size=250)
+                again = await ingest_orders(client, loader, MARKETPLACES, EPOCH, end, slices=3, batch_size=250)
+                return first, again
+        finally:
+            loader.close()
+
+    first, again = asyncio.run(main())
+    assert first["orders"] == first["loaded"] == orders
+    # a rerun upserts the same orders instead of duplicating them
+    assert again["orders"] == again["loaded"] == orders
+    with psycopg2.connect(libpq_dsn(pg_scratch_dsn)) as conn, conn.cursor() as cur:
+        cur.execute("SELECT COUNT(*), COUNT(DISTINCT amazon_order_id), SUM(is_prime::int) FROM orders")
+        assert cur.fetchone() == (orders, orders, orders // 5)
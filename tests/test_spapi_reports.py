@@ -0,0 +1,114 @@
+import asyncio
+import contextlib
+import datetime as dt
+
+import aiohttp
+import psycopg2
+import pytest
+
+from spapi.auth import LwaTokenCache
+from spapi.client import SpApiClient
+from spapi.load import ALL_ORDERS, libpq_dsn
+from spapi.mock import EPOCH, REPORT_HEADER, start_mock
+from spapi.ratelimit import RateLimiter
+from spapi.reports import backfill, document_blocks, iter_lines, iter_rows, wait_for_report
+
+MARKETPLACES = ["ATVPDKIKX0DER"]
+ORDERS = 600
+# one row per item, 1 + n % 3 items per order
+ITEMS = sum(1 + n % 3 for n in range(ORDERS))
+
+
+@contextlib.asynccontextmanager
+async def mock_client(**mock_kwargs):
+    mock, runner, url = await start_mock(orders=ORDERS, rate_scale=100, **mock_kwargs)
+    tokens = LwaTokenCache("mock", "mock", "Atzr|mock", endpoint=f"{url}/auth/o2/token", cache_path="")
+    try:
+        async with SpApiClient(tokens, url, RateLimiter(scale=100), backoff_base=0.01) as client:
+            yield mock, client
+    finally:
+        await runner.cleanup()
+
+
+def iso(t: dt.datetime) -> str:
+    return t.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+async def create_and_wait(client: SpApiClient, start: dt.datetime, end: dt.datetime) -> dict:
+    report_id = await client.create_report(ALL_ORDERS.report_type, MARKETPLACES, iso(start), iso(end))
+    return await wait_for_report(client, report_id, first_delay=0.02, max_delay=0.1)
+
+
+async def download(client: SpApiClient, document_id: str) -> list[list[str]]:
+    document = await client.get_report_document(document_id)
+    blocks = [text async for text in document_blocks(client, document)]
+    return list(iter_rows(iter_lines(blocks)))
+
+
+def test_report_is_polled_until_done_and_decompressed():
+    async def main():
+        async with mock_client(report_delay=0.2) as (mock, client):
+            report = await create_and_wait(client, EPOCH, EPOCH + dt.timedelta(days=30))
+            rows = await download(client, report["reportDocumentId"])
+            return mock, report, rows
+
+    mock, report, rows = asyncio.run(main())
+    assert report["processingStatus"] == "DONE"
+    # IN_QUEUE, IN_PROGRESS, then DONE
+    assert mock.stats["requests"] > 3
+    assert tuple(rows[0]) == REPORT_HEADER
+    assert len(rows) - 1 == ITEMS
+    assert len({r[0] for r in rows[1:]}) == ORDERS
+    assert all(len(r) == len(REPORT_HEADER) for r in rows)
+
+
+def test_report_without_orders_is_cancelled():
+    async def main():
+        async with mock_client(report_delay=0.05) as (mock, client):
+            return await create_and_wait(client, EPOCH - dt.timedelta(days=30), EPOCH)
+
+    report = asyncio.run(main())
+    assert report["processingStatus"] == "CANCELLED"
+    assert "reportDocumentId" not in report
+
+
+def test_dropped_download_is_an_error():
+    async def main():
+        async with mock_client(report_delay=0, drop_after=4000) as (mock, client):
+            report = await create_and_wait(client, EPOCH, EPOCH + dt.timedelta(days=30))
+            with pytest.raises(aiohttp.ClientPayloadError):
+                await download(client, report["reportDocumentId"])
+            # only the first download of a document is cut
+            return await download(client, report["reportDocumentId"])
+
+    assert len(asyncio.run(main())) - 1 == ITEMS
+
+
+def test_backfill_loads_and_resumes(pg_scratch_dsn):
+    # the orders span three days: three windows with a document, one empty; every
+    # first download is cut
+    start, end = EPOCH, EPOCH + dt.timedelta(days=4)
+    log = []
+
+    async def main():
+        async with mock_client(report_delay=0.1, drop_after=4000) as (mock, client):
+            first = await backfill(client, pg_scratch_dsn, MARKETPLACES, start, end, window_days=1,
+                                   create_table=True, chunk_rows=100, poll_delay=0.02, log=log.append)
+            again = await backfill(client, pg_scratch_dsn, MARKETPLACES, start, end, window_days=1)
+            return mock, first, again
+
+    mock, first, again = asyncio.run(main())
+    assert first["errors"] == []
+    assert first["windows"] == 4 and first["reports_created"] == 4
+    assert first["resumes"] == 3
+    # chunks committed before the cut are not loaded twice
+    assert any("resuming after row" in m and not m.endswith(" 0") for m in log)
+    assert first["rows"] == ITEMS
+    assert mock.stats["downloads"] == 6
+    # finished windows are skipped on a rerun
+    assert again["windows_skipped"] == 4 and again["rows"] == 0
+    with psycopg2.connect(libpq_dsn(pg_scratch_dsn)) as conn, conn.cursor() as cur:
+        cur.execute("SELECT COUNT(*), SUM(number_of_items_shipped + number_of_items_unshipped) FROM orders")
+        assert cur.fetchone() == (ORDERS, ITEMS)
+        cur.execute("SELECT status, SUM(rows_loaded) FROM spapi_report_checkpoints GROUP BY status")
+        assert cur.fetchall() == [("done", ITEMS)]
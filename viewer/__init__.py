@@ -0,0 +1,5 @@
+"""
+Building blocks for the Postgres viewer (app.py).
+
+Everything here is free of Streamlit so it can be reused from scripts.
+"""
@@ -0,0 +1,155 @@
+"""
+Ad-hoc SQL execution for the free SQL tab.
+
+A statement runs on its own thread with a `statement_timeout`, so the
+Streamlit script never blocks on it and the pooled connection is released
+after at most the timeout. Only the first `preview_rows` rows are fetched;
+the rest are counted server-side with MOVE, without being transferred.
+A running statement can be cancelled with pg_cancel_backend.
+"""
+import json
+import threading
+import time
+import uuid
+
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from viewer.cache import frame_nbytes
+from viewer.compact import compact_frame
+from viewer.sql import ROW_RETURNING
+
+
+def flatten_plan(plan: dict) -> pd.DataFrame:
+    """
+    One row per node of an EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) plan,
+    with the time spent in the node itself (excluding its children).
+    """
+    rows = []
+
+    def walk(node: dict, depth: int):
+        loops = node.get("Actual Loops", 1) or 1
+        total_ms = node.get("Actual Total Time", 0.0) * loops
+        children = node.get("Plans", [])
+        child_ms = sum(c.get("Actual Total Time", 0.0) * (c.get("Actual Loops", 1) or 1) for c in children)
+        label = node.get("Node Type", "?")
+        if node.get("Relation Name"):
+            label += f" on {node['Relation Name']}"
+        if node.get("Index Name"):
+            label += f" using {node['Index Name']}"
+        rows.append({
+            "node": "  " * depth + label,
+            "self_ms": round(max(total_ms - child_ms, 0.0), 3),
+            "total_ms": round(total_ms, 3),
+            "rows": node.get("Actual Rows"),
+            "plan_rows": node.get("Plan Rows"),
+            "loops": loops,
+            "shared_hit": node.get("Shared Hit Blocks"),
+            "shared_read": node.get("Shared Read Blocks"),
+            "temp_written": node.get("Temp Written Blocks"),
+        })
+        for child in children:
+            walk(child, depth + 1)
+
+    walk(plan["Plan"], 0)
+    return pd.DataFrame(rows)
+
+
+class AdhocQuery:
+    """
+    One ad-hoc statement. Call start(); then poll `state`, which moves from
+    "running" to "done", "error" or "cancelled".
+    """
+
+    def __init__(self, engine: Engine, sql: str, timeout_s: float = 30, preview_rows: int = 1000,
+                 explain: bool = False):
+        self.engine = engine
+        self.sql = sql.strip().rstrip(";")
+        self.timeout_s = timeout_s
+        self.preview_rows = preview_rows
+        self.explain = explain
+        self.state = "running"
+        self.preview: pd.DataFrame | None = None
+        self.plan: pd.DataFrame | None = None
+        self.plan_summary: dict = {}
+        self.rows: int | None = None
+        self.error: str | None = None
+        self.pid: int | None = None
+        self.started = time.monotonic()
+        self.finished: float | None = None
+        self._cancel_requested = False
+        self._thread = threading.Thread(target=self._run, name="pgviewer-adhoc", daemon=True)
+
+    def start(self) -> "AdhocQuery":
+        self._thread.start()
+        return self
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.monotonic()) - self.started
+
+    def cancel(self):
+        """
+        Ask the backend running the statement to cancel it (from a separate
+        connection, since the worker's is busy).
+        """
+        if self.state != "running" or self.pid is None:
+            return
+        self._cancel_requested = True
+        with self.engine.connect() as conn:
+            conn.execute(text("SELECT pg_cancel_backend(:pid)"), {"pid": self.pid})
+
+    def _run(self):
+        raw = self.engine.raw_connection()
+        try:
+            cur = raw.cursor()
+            cur.execute("SELECT pg_backend_pid()")
+            self.pid = cur.fetchone()[0]
+            # SET LOCAL: the limit ends with this transaction, so the pooled connection is unaffected
+            cur.execute("SELECT set_config('statement_timeout', %s, true)", (f"{int(self.timeout_s * 1000)}",))
+            if self.explain:
+                self._run_explain(cur)
+            elif ROW_RETURNING.match(self.sql):
+                self._run_select(raw, cur)
+            else:
+                cur.execute(self.sql)
+                self.rows = cur.rowcount
+                if cur.description:
+                    self.preview = self._frame(cur.description, cur.fetchmany(self.preview_rows))
+            self.state = "done"
+        except Exception as e:
+            self.error = str(e).strip()
+            self.state = "cancelled" if self._cancel_requested else "error"
+        finally:
+            self.finished = time.monotonic()
+            try:
+                raw.rollback()
+            finally:
+                raw.close()
+
+    def nbytes(self) -> int:
+        return sum(frame_nbytes(df) for df in (self.preview, self.plan) if df is not None)
+
+    @staticmethod
+    def _frame(description, rows) -> pd.DataFrame:
+        return compact_frame(pd.DataFrame(rows, columns=[d.name for d in description]))
+
+    def _run_select(self, raw, cur):
+        name = f"pgviewer_adhoc_{uuid.uuid4().hex[:12]}"
+        named = raw.cursor(name=name)
+        named.execute(self.sql)
+        first = named.fetchmany(self.preview_rows)
+        self.preview = self._frame(named.description, first)
+        # Count what is left without shipping it to the client
+        cur.execute(f'MOVE FORWARD ALL IN "{name}"')
+        self.rows = len(first) + cur.rowcount
+        named.close()
+
+    def _run_explain(self, cur):
+        cur.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {self.sql}")
+        doc = cur.fetchone()[0]
+        plan = (json.loads(doc) if isinstance(doc, str) else doc)[0]
+        self.plan = flatten_plan(plan)
+        self.plan_summary = {k: plan.get(k) for k in ("Planning Time", "Execution Time")}
+        self.rows = plan["Plan"].get("Actual Rows")
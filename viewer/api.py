@@ -0,0 +1,408 @@
+"""
+Headless HTTP API for the Ads metrics.
+
+The Tab 1 filters are query parameters (`start`, `end`, repeatable
+`campaign` and `asin`) on:
+
+    GET /api/ads/meta                       date bounds of the data
+    GET /api/ads/kpis                       totals and derived ratios
+    GET /api/ads/breakdown?level=campaign   campaign / asin / campaign_asin rows
+    GET /api/ads/series?unit=auto           day / week / month buckets with *_prev columns
+    GET /api/ads/detail?page_size=500       product rows, one keyset page; pass the
+                                            returned `next` cursor as `after`
+
+Bodies are JSON (`{"source": ..., "data": [...]}`), or an Arrow IPC stream
+with `format=arrow` or `Accept: application/vnd.apache.arrow.stream` (the
+envelope fields then travel in X-Pgviewer-* headers). Queries are built
+by the dashboard's builders and go through its engine registry and result
+cache.
+
+Every response carries an ETag derived from the data watermark of the
+relation it reads plus the request, so revalidating an unchanged result
+returns 304 without a query. Encoded bodies of recent responses are kept
+as well, so while the watermark is fresh a repeated request is answered on
+the event loop; queries and watermark polls run on worker threads.
+"""
+import argparse
+import asyncio
+import base64
+import datetime as dt
+import hashlib
+import io
+import json
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable
+
+import pandas as pd
+from aiohttp import web
+from sqlalchemy.engine import Engine
+
+from viewer.breakdown import BREAKDOWN_COLUMNS, LEVELS, breakdown_sql, split_levels
+from viewer.buckets import BUCKET_CHOICES, resolve_bucket
+from viewer.cache import ResultCache, Watermarks, cached_query, engine_ident
+from viewer.fetch import read_df
+from viewer.incremental import IncrementalSeries
+from viewer.metadata import ADS_META_SQL, boot_queries
+from viewer.pagination import KeysetPager
+from viewer.queries import ADS_SCOPE, DETAIL_KEY, DETAIL_NULLABLE, DIMENSION_COLUMNS, METRIC_COLUMNS, AdsFilters, series_sql
+from viewer.rollups import route
+
+ARROW_MIME = "application/vnd.apache.arrow.stream"
+MAX_PAGE_SIZE = 5000
+# Bumped whenever a response shape changes, so old ETags stop matching
+API_VERSION = "2"
+
+
+class ApiError(Exception):
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+@dataclass
+class ApiContext:
+    """
+    What the API shares with the dashboard: the pooled engine, the result
+    cache and watermarks, and the incremental series store when enabled.
+    """
+    engine: Engine
+    cache: ResultCache
+    watermarks: Watermarks
+    how: str = "pandas"
+    series: IncrementalSeries | None = None
+    restate_days: int = 3
+    metrics: object | None = None
+    budget: object | None = None
+    body_cache_bytes: int = 64 << 20
+    cors_origin: str | None = None
+
+
+class ResponseCache:
+    """
+    Encoded bodies by ETag, least recently used dropped beyond `max_bytes`.
+    Has the store interface of viewer.memory.MemoryBudget.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._bodies: OrderedDict[str, tuple[bytes, dict, float]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.budget = None
+
+    def get(self, etag: str) -> tuple[bytes, dict] | None:
+        with self._lock:
+            entry = self._bodies.get(etag)
+            if entry is None:
+                return None
+            self._bodies.move_to_end(etag)
+            self._bodies[etag] = (entry[0], entry[1], time.monotonic())
+            return entry[0], entry[1]
+
+    def put(self, etag: str, body: bytes, headers: dict):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._bodies.pop(etag, None)
+            self._bytes += len(body) - (len(old[0]) if old else 0)
+            self._bodies[etag] = (body, headers, time.monotonic())
+            while self._bytes > self.max_bytes:
+                self.evict_oldest(locked=True)
+        if self.budget is not None:
+            self.budget.enforce()
+
+    def nbytes(self) -> int:
+        return self._bytes
+
+    def oldest(self) -> float | None:
+        with self._lock:
+            return next(iter(self._bodies.values()))[2] if self._bodies else None
+
+    def evict_oldest(self, locked: bool = False) -> int:
+        if not locked:
+            with self._lock:
+                return self.evict_oldest(locked=True)
+        if not self._bodies:
+            return 0
+        body = self._bodies.popitem(last=False)[1][0]
+        self._bytes -= len(body)
+        return len(body)
+
+
+# -- request parsing ----------------------------------------------------------
+def _date(value: str | None, name: str) -> str | None:
+    if not value:
+        return None
+    try:
+        return dt.date.fromisoformat(value).isoformat()
+    except ValueError:
+        raise ApiError(f"{name}: expected YYYY-MM-DD, got {value!r}")
+
+
+def parse_filters(query) -> AdsFilters:
+    start, end = _date(query.get("start"), "start"), _date(query.get("end"), "end")
+    if start and end and start > end:
+        raise ApiError("start is after end")
+    return AdsFilters(start, end, tuple(query.getall("campaign", [])), tuple(query.getall("asin", [])))
+
+
+def _int(query, name: str, default: int, lo: int, hi: int) -> int:
+    try:
+        value = int(query.get(name, default))
+    except ValueError:
+        raise ApiError(f"{name}: expected an integer")
+    if not lo <= value <= hi:
+        raise ApiError(f"{name}: expected {lo}..{hi}")
+    return value
+
+
+def encode_cursor(key: tuple) -> str:
+    raw = json.dumps(list(key), default=str, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError:
+        raise ApiError("after: not a cursor returned by this API")
+    # One scalar (or null) per DETAIL_KEY column; anything else was not issued here
+    if not isinstance(key, list) or len(key) != len(DETAIL_KEY) \
+            or not all(v is None or isinstance(v, (str, int, float)) for v in key):
+        raise ApiError("after: not a cursor returned by this API")
+    return tuple(key)
+
+
+def wants_arrow(request: web.Request) -> bool:
+    fmt = request.query.get("format")
+    if fmt is not None:
+        if fmt not in ("json", "arrow"):
+            raise ApiError("format: expected json or arrow")
+        return fmt == "arrow"
+    return ARROW_MIME in request.headers.get("Accept", "")
+
+
+# -- encoding -----------------------------------------------------------------
+def encode_json(df: pd.DataFrame, meta: dict) -> bytes:
+    # df.to_json does the rows in C; the envelope is spliced around it
+    rows = df.to_json(orient="records", date_format="iso", date_unit="s", default_handler=str)
+    head = json.dumps(meta, default=str)[:-1]
+    return f'{head}{", " if meta else ""}"data": {rows}}}'.encode()
+
+
+def encode_arrow(df: pd.DataFrame, meta: dict) -> bytes:
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}),
+                                           **{f"pgviewer.{k}": str(v) for k, v in meta.items() if v is not None}})
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+def _matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+
+# -- server -------------------------------------------------------------------
+class AdsApi:
+    """
+    Request handlers over one ApiContext.
+    """
+
+    def __init__(self, ctx: ApiContext):
+        self.ctx = ctx
+        self.ident = engine_ident(ctx.engine)
+        self.bodies = ResponseCache(ctx.body_cache_bytes)
+        if ctx.budget is not None:
+            ctx.budget.register("api", self.bodies)
+        self._available: tuple[float, set[str]] | None = None
+        self.requests = 0
+        self.not_modified = 0
+        self.body_hits = 0
+
+    # -- blocking helpers (worker threads) ------------------------------------
+    def _query(self, sql: str, params: dict | None, scope: tuple[str, ...] | None) -> pd.DataFrame:
+        ctx = self.ctx
+        return cached_query(ctx.cache, ctx.watermarks, ctx.engine, sql, params, ctx.how, scope, metrics=ctx.metrics)
+
+    def _refresh_available(self) -> set[str]:
+        sql, params, scope = boot_queries()["rollups"]
+        available = set(self._query(sql, params, scope)["name"])
+        self._available = (time.monotonic(), available)
+        return available
+
+    def _bounds(self) -> tuple:
+        meta = self._query(ADS_META_SQL, None, ADS_SCOPE)
+        if meta.empty:
+            return None, None
+        return meta.iloc[0]["min_date"], meta.iloc[0]["max_date"]
+
+    # -- event loop -----------------------------------------------------------
+    async def _available_rollups(self) -> set[str]:
+        cached = self._available
+        if cached and time.monotonic() - cached[0] < self.ctx.watermarks.interval:
+            return cached[1]
+        return await asyncio.to_thread(self._refresh_available)
+
+    async def _watermark(self, relation: str) -> str:
+        marks, engine = self.ctx.watermarks, self.ctx.engine
+        value = marks.peek(engine, (relation,))
+        return value if value is not None else await asyncio.to_thread(marks.get, engine, (relation,))
+
+    def _etag(self, request: web.Request, watermark: str, arrow: bool) -> str:
+        canonical = "&".join(f"{k}={v}" for k, v in sorted(request.query.items()))
+        raw = "|".join((API_VERSION, self.ident, watermark, request.path, canonical, "arrow" if arrow else "json"))
+        return '"' + hashlib.sha1(raw.encode()).hexdigest() + '"'
+
+    async def _serve(self, request: web.Request, relation: str,
+                     build: Callable[[], tuple[pd.DataFrame, dict]]) -> web.Response:
+        """
+        304 / cached body / freshly built response for a result read from
+        `relation`. `build` runs on a worker thread and returns the frame
+        and the envelope fields.
+        """
+        arrow = wants_arrow(request)
+        etag = self._etag(request, await self._watermark(relation), arrow)
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if _matches(request.headers.get("If-None-Match"), etag):
+            self.not_modified += 1
+            return web.Response(status=304, headers=headers)
+        cached = self.bodies.get(etag)
+        if cached is not None:
+            self.body_hits += 1
+            body, extra = cached
+        else:
+            df, meta = await asyncio.to_thread(build)
+            body = encode_arrow(df, meta) if arrow else encode_json(df, meta)
+            extra = {f"X-Pgviewer-{k.capitalize()}": str(v) for k, v in meta.items() if v is not None}
+            self.bodies.put(etag, body, extra)
+        return web.Response(body=body, headers={**headers, **extra},
+                            content_type=ARROW_MIME if arrow else "application/json")
+
+    async def meta(self, request: web.Request) -> web.Response:
+        def build():
+            lo, hi = self._bounds()
+            return pd.DataFrame({"min_date": [lo], "max_date": [hi]}), {"source": ADS_SCOPE[0]}
+        return await self._serve(request, ADS_SCOPE[0], build)
+
+    async def _breakdown(self, request: web.Request, level: str) -> web.Response:
+        filters = parse_filters(request.query)
+        relation = route(filters, BREAKDOWN_COLUMNS, await self._available_rollups())
+
+        def build():
+            levels = split_levels(self._query(*breakdown_sql(filters, relation), (relation,)))
+            return levels[level], {"source": relation, "level": level}
+        return await self._serve(request, relation, build)
+
+    async def kpis(self, request: web.Request) -> web.Response:
+        return await self._breakdown(request, "total")
+
+    async def breakdown(self, request: web.Request) -> web.Response:
+        level = request.query.get("level", "campaign")
+        if level not in LEVELS:
+            raise ApiError(f"level: expected one of {', '.join(LEVELS)}")
+        return await self._breakdown(request, level)
+
+    async def series(self, request: web.Request) -> web.Response:
+        filters = parse_filters(request.query)
+        requested = request.query.get("unit", "auto")
+        if requested not in BUCKET_CHOICES:
+            raise ApiError(f"unit: expected one of {', '.join(BUCKET_CHOICES)}")
+        relation = route(filters, {"date"}, await self._available_rollups())
+        ctx = self.ctx
+
+        def build():
+            lo, hi = self._bounds()
+            unit, coarsened = resolve_bucket(filters.dstart or lo, filters.dend or hi, requested)
+            if ctx.series is not None:
+                fetch = lambda sql, params=None: read_df(ctx.engine, sql, params, how=ctx.how)  # noqa: E731
+                df = ctx.series.get(engine_ident(ctx.engine), filters, fetch,
+                                    ctx.watermarks.get(ctx.engine, (relation,)), ctx.restate_days, relation, unit)
+            else:
+                df = self._query(*series_sql(filters, relation, unit), (relation,))
+            return df, {"source": relation, "unit": unit, "coarsened": coarsened}
+        return await self._serve(request, relation, build)
+
+    async def detail(self, request: web.Request) -> web.Response:
+        filters = parse_filters(request.query)
+        page_size = _int(request.query, "page_size", 500, 1, MAX_PAGE_SIZE)
+        after = decode_cursor(request.query["after"]) if request.query.get("after") else None
+        relation = route(filters, set(DIMENSION_COLUMNS), await self._available_rollups())
+        where, params = filters.where()
+        pager = KeysetPager(relation, DETAIL_KEY, ", ".join(DIMENSION_COLUMNS + METRIC_COLUMNS), where, params,
+                            page_size, nullable=DETAIL_NULLABLE)
+
+        def build():
+            df = self._query(*pager.page_sql(after), (relation,))
+            cursor = encode_cursor(pager._last_key(df)) if len(df) == page_size else None
+            return df, {"source": relation, "next": cursor}
+        return await self._serve(request, relation, build)
+
+    async def health(self, request: web.Request) -> web.Response:
+        return web.json_response({"requests": self.requests, "not_modified": self.not_modified,
+                                  "body_hits": self.body_hits, "body_bytes": self.bodies.nbytes(),
+                                  "cache": self.ctx.cache.summary()})
+
+    async def preflight(self, request: web.Request) -> web.Response:
+        return web.Response(status=204)
+
+    @web.middleware
+    async def middleware(self, request: web.Request, handler) -> web.StreamResponse:
+        self.requests += 1
+        try:
+            resp = await handler(request)
+        except ApiError as e:
+            resp = web.json_response({"error": str(e)}, status=e.status)
+        except web.HTTPException:
+            raise
+        except Exception as e:
+            resp = web.json_response({"error": str(e)}, status=500)
+        if self.ctx.cors_origin:
+            resp.headers["Access-Control-Allow-Origin"] = self.ctx.cors_origin
+            resp.headers["Access-Control-Allow-Headers"] = "If-None-Match, Accept"
+            resp.headers["Access-Control-Expose-Headers"] = "ETag, X-Pgviewer-Source, X-Pgviewer-Next, " \
+                                                            "X-Pgviewer-Unit, X-Pgviewer-Level, X-Pgviewer-Coarsened"
+        return resp
+
+    def app(self) -> web.Application:
+        app = web.Application(middlewares=[self.middleware])
+        app.router.add_get("/api/health", self.health)
+        app.router.add_get("/api/ads/meta", self.meta)
+        app.router.add_get("/api/ads/kpis", self.kpis)
+        app.router.add_get("/api/ads/breakdown", self.breakdown)
+        app.router.add_get("/api/ads/series", self.series)
+        app.router.add_get("/api/ads/detail", self.detail)
+        app.router.add_route("OPTIONS", "/api/{tail:.*}", self.preflight)
+        return app
+
+
+def start_in_thread(ctx: ApiContext, host: str, port: int) -> threading.Thread:
+    """
+    Serve the API from a daemon thread with its own event loop, e.g. next to
+    the Streamlit server so both share the process-wide pool and caches.
+    """
+    def run():
+        web.run_app(AdsApi(ctx).app(), host=host, port=port, handle_signals=False, print=None)
+
+    thread = threading.Thread(target=run, name="pgviewer-api", daemon=True)
+    thread.start()
+    return thread
+
+
+def main(make_context: Callable[[str], ApiContext], default_dsn: str | None = None, argv=None):
+    ap = argparse.ArgumentParser(description="Headless Ads metrics API (see viewer/api.py).")
+    ap.add_argument("--dsn", default=default_dsn, required=not default_dsn,
+                    help="defaults to DATABASE_URL or the DB_* variables")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8502)
+    args = ap.parse_args(argv)
+    web.run_app(AdsApi(make_context(args.dsn)).app(), host=args.host, port=args.port)
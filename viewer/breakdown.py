@@ -0,0 +1,116 @@
+"""
+Multi-level Ads metrics in one scan.
+
+One GROUPING SETS query returns the grand total and the sums by campaign,
+by ASIN and by campaign x ASIN; a `level` column tells the rows apart
+(GROUPING() rather than NULL checks, since the dimensions themselves can
+be NULL). Derived ratios are added column-wise afterwards, so the drill-
+down tables, their sort orders and the KPI cards all come from the same
+cached frame.
+"""
+import numpy as np
+import pandas as pd
+
+from viewer.queries import ADS_VIEW, METRIC_COLUMNS, AdsFilters
+
+LEVELS = ("total", "campaign", "asin", "campaign_asin")
+LEVEL_DIMENSIONS = {
+    "total": (),
+    "campaign": ("campaign_name",),
+    "asin": ("advertised_asin",),
+    "campaign_asin": ("campaign_name", "advertised_asin"),
+}
+BREAKDOWN_COLUMNS = {"campaign_name", "advertised_asin"}
+
+# (name, numerator, denominator, factor)
+DERIVED_METRICS = (
+    ("ctr", "clicks", "impressions", 100.0),
+    ("cpc", "spend", "clicks", 1.0),
+    ("acos", "spend", "sales_14d", 100.0),
+    ("roas", "sales_14d", "spend", 1.0),
+    ("cvr", "conv_14d", "clicks", 100.0),
+)
+
+
+def breakdown_sql(filters: AdsFilters, relation: str = ADS_VIEW) -> tuple[str, dict]:
+    """
+    The filtered rows are first summed per campaign x ASIN pair (a hash
+    aggregate into a few thousand groups); the grouping sets then roll up
+    those pairs instead of sorting every source row.
+    """
+    where, params = filters.where()
+    pair_sums = ",\n               ".join(f"SUM({c}) AS {c}" for c in METRIC_COLUMNS)
+    sums = ",\n           ".join(f"COALESCE(SUM({c}), 0) AS {c}" for c in METRIC_COLUMNS)
+    sql = f"""
+    WITH pairs AS (
+        SELECT campaign_name, advertised_asin, COUNT(*) AS n_rows,
+               {pair_sums}
+        FROM {relation}
+        WHERE {where}
+        GROUP BY campaign_name, advertised_asin
+    )
+    SELECT CASE GROUPING(campaign_name, advertised_asin)
+               WHEN 3 THEN 'total' WHEN 1 THEN 'campaign' WHEN 2 THEN 'asin' ELSE 'campaign_asin'
+           END AS level,
+           campaign_name,
+           advertised_asin,
+           COALESCE(SUM(n_rows), 0) AS n_rows,
+           {sums}
+    FROM pairs
+    GROUP BY GROUPING SETS ((), (campaign_name), (advertised_asin), (campaign_name, advertised_asin));
+    """
+    return sql, params
+
+
+def _values(s: pd.Series) -> np.ndarray:
+    # Arrow-backed and nullable columns alike become plain float arrays
+    return pd.to_numeric(s, errors="coerce").to_numpy(dtype="float64", na_value=0.0)
+
+
+def with_derived(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Copy of `df` with CTR/CPC/ACOS/ROAS/CVR columns; a zero denominator
+    gives 0 rather than inf/NaN.
+    """
+    out = df.copy()
+    for name, num, den, factor in DERIVED_METRICS:
+        n, d = _values(out[num]), _values(out[den])
+        ratio = np.divide(n, d, out=np.zeros_like(n), where=d != 0)
+        out[name] = ratio * factor
+    return out
+
+
+def split_levels(df: pd.DataFrame) -> dict[str, pd.DataFrame]:
+    """
+    Breakdown result -> one frame per level, each with only its own
+    dimension columns and the derived metrics.
+    """
+    derived = with_derived(df)
+    levels = derived["level"].astype(str)
+    frames = {}
+    for level, dims in LEVEL_DIMENSIONS.items():
+        part = derived[levels == level]
+        dropped = [c for c in ("level", *BREAKDOWN_COLUMNS) if c not in dims]
+        frames[level] = part.drop(columns=dropped).reset_index(drop=True)
+    return frames
+
+
+def drill(frames: dict[str, pd.DataFrame], level: str, value) -> pd.DataFrame:
+    """
+    Children of one campaign (its ASINs) or one ASIN (its campaigns),
+    taken from the campaign x ASIN level.
+    """
+    parent = "campaign_name" if level == "campaign" else "advertised_asin"
+    pairs = frames["campaign_asin"]
+    mask = pairs[parent].isna() if pd.isna(value) else pairs[parent] == value
+    return pairs[mask].drop(columns=parent).reset_index(drop=True)
+
+
+def ranked(df: pd.DataFrame, by: str, ascending: bool = False, min_spend: float = 0.0) -> pd.DataFrame:
+    """
+    Sort a level by one metric; rows below `min_spend` are dropped so
+    ratios over a few cents do not top the list.
+    """
+    if min_spend:
+        df = df[_values(df["spend"]) >= min_spend]
+    return df.sort_values(by, ascending=ascending, na_position="last", kind="stable").reset_index(drop=True)
@@ -0,0 +1,103 @@
+"""
+Statistics-aware table browsing.
+
+Everything shown before the first row is fetched comes from the catalog:
+the row estimate is pg_class.reltuples (as of the last ANALYZE/VACUUM),
+sizes come from pg_table_size/pg_indexes_size, and column widths from
+pg_stats. No COUNT(*) is ever issued.
+"""
+from dataclasses import dataclass
+
+from viewer.sql import quote_ident
+
+TABLE_STATS_SQL = """
+SELECT c.relkind,
+       CASE WHEN c.reltuples < 0 THEN NULL ELSE c.reltuples::bigint END AS row_estimate,
+       pg_table_size(c.oid) AS table_bytes,
+       pg_indexes_size(c.oid) AS index_bytes,
+       pg_total_relation_size(c.oid) AS total_bytes,
+       GREATEST(s.last_analyze, s.last_autoanalyze) AS last_analyzed
+FROM pg_class c
+LEFT JOIN pg_stat_all_tables s ON s.relid = c.oid
+WHERE c.oid = CAST(:rel AS regclass);
+"""
+
+# One row per column: type, nullability, average width from pg_stats and
+# whether some valid btree index leads with the column (so it can serve an
+# ORDER BY or a range filter on it).
+COLUMNS_SQL = """
+SELECT a.attname AS column_name,
+       format_type(a.atttypid, a.atttypmod) AS data_type,
+       t.typname AS type_name,
+       t.typcategory AS type_category,
+       a.attnotnull AS not_null,
+       st.avg_width,
+       EXISTS (
+           SELECT 1 FROM pg_index i JOIN pg_class ic ON ic.oid = i.indexrelid JOIN pg_am am ON am.oid = ic.relam
+           WHERE i.indrelid = a.attrelid AND i.indkey[0] = a.attnum AND i.indisvalid AND am.amname = 'btree'
+       ) AS indexed
+FROM pg_attribute a
+JOIN pg_type t ON t.oid = a.atttypid
+JOIN pg_class c ON c.oid = a.attrelid
+JOIN pg_namespace n ON n.oid = c.relnamespace
+LEFT JOIN pg_stats st ON st.schemaname = n.nspname AND st.tablename = c.relname AND st.attname = a.attname
+WHERE a.attrelid = CAST(:rel AS regclass) AND a.attnum > 0 AND NOT a.attisdropped
+ORDER BY a.attnum;
+"""
+
+WIDE_TYPES = {"json", "jsonb", "bytea", "xml", "tsvector"}
+WIDE_AVG_BYTES = 256
+SAMPLE_RELKINDS = {"r", "m", "p"}
+FILTER_OPS = ("=", ">=", "<=", "começa com")
+
+
+def is_wide(column: dict) -> bool:
+    """
+    Columns left out of the default projection: document/binary types,
+    arrays, and any column whose average stored width is large.
+    """
+    if column["type_name"] in WIDE_TYPES or column["type_category"] == "A":
+        return True
+    return (column.get("avg_width") or 0) > WIDE_AVG_BYTES
+
+
+def projection(columns: list[str], key: tuple[str, ...]) -> str:
+    """
+    Select list for `columns`, always including the (non-ctid) key columns
+    the pager needs to seek.
+    """
+    cols = [k for k in key if k != "ctid" and k not in columns] + list(columns)
+    return ", ".join(quote_ident(c) for c in cols) if cols else "*"
+
+
+def sample_percent(target_rows: int, row_estimate: int | None, oversample: float = 3.0) -> float:
+    """
+    TABLESAMPLE SYSTEM percentage expected to yield about `target_rows`.
+    SYSTEM samples whole pages, so the yield is lumpy; oversample and LIMIT.
+    """
+    if not row_estimate:
+        return 100.0
+    return float(min(100.0, max(0.001, target_rows * oversample * 100.0 / row_estimate)))
+
+
+def sample_sql(relation: str, select_list: str, where: str, percent: float, seed: int, limit: int) -> str:
+    return (f"SELECT {select_list} FROM {relation} TABLESAMPLE SYSTEM ({percent:.6f}) "
+            f"REPEATABLE ({int(seed)}) WHERE {where} LIMIT {int(limit)};")
+
+
+@dataclass(frozen=True)
+class ColumnFilter:
+    column: str
+    op: str
+    value: str
+    data_type: str
+
+    def where(self) -> tuple[str, dict]:
+        col = quote_ident(self.column)
+        if self.op == "começa com":
+            escaped = self.value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            return f"{col}::text LIKE :_fv", {"_fv": escaped + "%"}
+        if self.op not in FILTER_OPS:
+            raise ValueError(f"Operador inválido: {self.op}")
+        # data_type comes from format_type() in the catalog, not from the user
+        return f"{col} {self.op} CAST(:_fv AS {self.data_type})", {"_fv": self.value}
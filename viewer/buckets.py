@@ -0,0 +1,83 @@
+"""
+Time buckets for the Ads series.
+
+The bucket (day, week or month) is picked from the selected period so a
+series never exceeds MAX_BUCKETS points, and Postgres does the
+date_trunc, so a five-year range transfers ~60 monthly rows instead of
+~1800 daily ones. A user override is honoured unless it would exceed the
+bound, in which case the next coarser unit is used.
+
+Buckets at the edges of the period can be partial, so period-over-period
+changes compare per-day averages rather than raw sums.
+"""
+import datetime as dt
+
+import numpy as np
+import pandas as pd
+
+BUCKET_UNITS = ("day", "week", "month")
+BUCKET_CHOICES = ("auto",) + BUCKET_UNITS
+MAX_BUCKETS = 400
+
+_DAYS_PER = {"day": 1.0, "week": 7.0, "month": 30.44}
+
+
+def _as_date(value) -> dt.date:
+    return pd.Timestamp(value).date()
+
+
+def bucket_count(dstart, dend, unit: str) -> int:
+    """
+    Approximate number of `unit` buckets in [dstart, dend].
+    """
+    span = (_as_date(dend) - _as_date(dstart)).days + 1
+    return int(np.ceil(span / _DAYS_PER[unit]))
+
+
+def resolve_bucket(dstart, dend, requested: str = "auto", max_buckets: int = MAX_BUCKETS) -> tuple[str, bool]:
+    """
+    (unit, coarsened): the finest unit that fits `max_buckets`, or the
+    requested one when it fits. `coarsened` is True when an explicit
+    request had to be overridden.
+    """
+    if requested not in BUCKET_CHOICES:
+        raise ValueError(f"Agrupamento desconhecido: {requested}")
+    if dstart is None or dend is None:
+        return ("day" if requested == "auto" else requested), False
+    first = 0 if requested == "auto" else BUCKET_UNITS.index(requested)
+    for unit in BUCKET_UNITS[first:]:
+        if bucket_count(dstart, dend, unit) <= max_buckets:
+            return unit, unit != requested and requested != "auto"
+    return BUCKET_UNITS[-1], requested not in ("auto", BUCKET_UNITS[-1])
+
+
+def bucket_start(value, unit: str) -> dt.date:
+    """
+    Python twin of date_trunc(unit, value) for dates (ISO weeks start on Monday).
+    """
+    d = _as_date(value)
+    if unit == "week":
+        return d - dt.timedelta(days=d.weekday())
+    if unit == "month":
+        return d.replace(day=1)
+    return d
+
+
+def previous_bucket_start(value, unit: str) -> dt.date:
+    return bucket_start(bucket_start(value, unit) - dt.timedelta(days=1), unit)
+
+
+def pop_change(df: pd.DataFrame, column: str) -> pd.Series:
+    """
+    Percent change of `column` against the previous bucket (the `*_prev`
+    columns series_sql adds), on per-day averages; NaN without a previous
+    bucket or when it was zero.
+    """
+    cur = pd.to_numeric(df[column], errors="coerce").to_numpy("float64", na_value=np.nan)
+    prev = pd.to_numeric(df[f"{column}_prev"], errors="coerce").to_numpy("float64", na_value=np.nan)
+    days = pd.to_numeric(df["days"], errors="coerce").to_numpy("float64", na_value=np.nan)
+    prev_days = pd.to_numeric(df["days_prev"], errors="coerce").to_numpy("float64", na_value=np.nan)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rate, prev_rate = cur / days, prev / prev_days
+        pct = np.where(prev_rate > 0, (rate - prev_rate) / prev_rate * 100, np.nan)
+    return pd.Series(pct, index=df.index, name=f"{column}_pop_pct")
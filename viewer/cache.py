@@ -0,0 +1,342 @@
+"""
+Process-wide query result cache.
+
+Entries are evicted least-recently-used once their summed in-memory size
+exceeds a byte budget. An optional Parquet directory acts as a second tier
+shared by every worker process that points at it.
+
+Instead of a TTL, each entry remembers the data watermark it was computed
+under; once the watermark moves (rows were inserted/updated/deleted in the
+tables the query depends on) the entry is stale and recomputed.
+
+Each entry also records its size, hits and last use, so a
+viewer.memory.MemoryBudget can account for it and evict across stores.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+WATERMARK_META_KEY = b"pgviewer_watermark"
+
+# Modification counters of the given relations and, for views, of every
+# relation they are built on.
+SCOPED_WATERMARK_SQL = """
+WITH RECURSIVE deps(oid) AS (
+    SELECT c.oid FROM pg_class c WHERE c.oid = ANY(CAST(:rels AS regclass[]))
+    UNION
+    SELECT d.refobjid
+    FROM deps
+    JOIN pg_rewrite r ON r.ev_class = deps.oid
+    JOIN pg_depend d ON d.classid = 'pg_rewrite'::regclass AND d.objid = r.oid
+                    AND d.refclassid = 'pg_class'::regclass AND d.refobjid <> deps.oid
+)
+SELECT COALESCE(SUM(s.n_tup_ins + s.n_tup_upd + s.n_tup_del), 0)::text AS watermark
+FROM pg_stat_user_tables s
+WHERE s.relid IN (SELECT oid FROM deps);
+"""
+
+DATABASE_WATERMARK_SQL = """
+SELECT (SELECT COALESCE(SUM(n_tup_ins + n_tup_upd + n_tup_del), 0) FROM pg_stat_user_tables)::text
+       || ':' || (SELECT COUNT(*) FROM pg_class)::text
+       || ':' || COALESCE((SELECT stats_reset::text FROM pg_stat_database
+                           WHERE datname = current_database()), '') AS watermark;
+"""
+
+
+def frame_nbytes(df: pd.DataFrame) -> int:
+    return int(df.memory_usage(deep=True, index=True).sum())
+
+
+class Watermarks:
+    """
+    Polls data watermarks, at most once every `interval` seconds per
+    (engine, scope). If the statistics views are not readable it degrades
+    to a time bucket, i.e. a plain TTL of `interval`.
+    """
+
+    def __init__(self, interval: float = 10.0):
+        self.interval = interval
+        self._values: dict[tuple, tuple[float, str]] = {}
+        self._lock = threading.Lock()
+
+    def peek(self, engine: Engine, scope: tuple[str, ...] | None = None) -> str | None:
+        """
+        The polled watermark while it is still fresh, without a round trip
+        (None when get() would have to query).
+        """
+        with self._lock:
+            cached = self._values.get((engine_ident(engine), scope))
+        if cached and time.monotonic() - cached[0] < self.interval:
+            return cached[1]
+        return None
+
+    def get(self, engine: Engine, scope: tuple[str, ...] | None = None) -> str:
+        ident = (engine_ident(engine), scope)
+        now = time.monotonic()
+        with self._lock:
+            cached = self._values.get(ident)
+            if cached and now - cached[0] < self.interval:
+                return cached[1]
+        try:
+            with engine.connect() as conn:
+                if scope:
+                    value = conn.execute(text(SCOPED_WATERMARK_SQL), {"rels": list(scope)}).scalar()
+                else:
+                    value = conn.execute(text(DATABASE_WATERMARK_SQL)).scalar()
+        except Exception:
+            value = f"t{int(time.time() // self.interval)}"
+        with self._lock:
+            self._values[ident] = (now, value)
+        return value
+
+
+@dataclass
+class CacheEntry:
+    watermark: str
+    df: pd.DataFrame
+    nbytes: int
+    label: str = ""
+    hits: int = 0
+    stored: float = field(default_factory=time.time)
+    last_used: float = field(default_factory=time.monotonic)
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    disk_hits: int = 0
+    misses: int = 0
+    stale: int = 0
+    evictions: int = 0
+    stores: int = 0
+
+
+class ResultCache:
+    """
+    Thread-safe LRU of DataFrames bounded by `max_bytes`.
+
+    Returned frames are shallow copies: callers may add or replace columns,
+    but must not modify values in place. When a `budget` is attached
+    (MemoryBudget.register) every store is followed by a budget check.
+    """
+
+    def __init__(self, max_bytes: int, disk_dir: str | None = None, disk_max_bytes: int = 0):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self.stats = CacheStats()
+        self._entries: OrderedDict[str, CacheEntry] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.budget = None
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        return hashlib.sha256(repr(parts).encode()).hexdigest()
+
+    # -- memory tier --------------------------------------------------------
+    def _drop(self, key: str):
+        self._bytes -= self._entries.pop(key).nbytes
+
+    def _store(self, key: str, watermark: str, df: pd.DataFrame, label: str = "", nbytes: int | None = None):
+        nbytes = frame_nbytes(df) if nbytes is None else nbytes
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = CacheEntry(watermark, df, nbytes, label)
+            self._bytes += nbytes
+            self.stats.stores += 1
+            while self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.stats.evictions += 1
+        if self.budget is not None:
+            self.budget.enforce()
+
+    def get(self, key: str, watermark: str, label: str = "") -> pd.DataFrame | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry.watermark == watermark:
+                    self._entries.move_to_end(key)
+                    entry.hits += 1
+                    entry.last_used = time.monotonic()
+                    self.stats.hits += 1
+                    return entry.df.copy(deep=False)
+                self._drop(key)
+                self.stats.stale += 1
+        df = self._disk_get(key, watermark)
+        if df is not None:
+            with self._lock:
+                self.stats.disk_hits += 1
+            self._store(key, watermark, df, label)
+            return df.copy(deep=False)
+        with self._lock:
+            self.stats.misses += 1
+        return None
+
+    def put(self, key: str, watermark: str, df: pd.DataFrame, label: str = "", nbytes: int | None = None):
+        """
+        Store `df`; `nbytes` skips measuring it again when the caller already has.
+        """
+        self._store(key, watermark, df, label, nbytes)
+        self._disk_put(key, watermark, df)
+
+    def entry_nbytes(self, key: str) -> int:
+        """
+        Size recorded when `key` was stored (0 when not in memory).
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry.nbytes if entry is not None else 0
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {**asdict(self.stats), "entries": len(self._entries), "bytes": self._bytes,
+                    "max_bytes": self.max_bytes}
+
+    # -- accounting (viewer.memory) -------------------------------------------
+    def nbytes(self) -> int:
+        return self._bytes
+
+    def oldest(self) -> float | None:
+        """
+        Last use (time.monotonic) of the least recently used entry.
+        """
+        with self._lock:
+            return next(iter(self._entries.values())).last_used if self._entries else None
+
+    def evict_oldest(self) -> int:
+        with self._lock:
+            if not self._entries:
+                return 0
+            key = next(iter(self._entries))
+            freed = self._entries[key].nbytes
+            self._drop(key)
+            self.stats.evictions += 1
+            return freed
+
+    def entries(self) -> pd.DataFrame:
+        """
+        One row per in-memory entry, largest first.
+        """
+        now, wall = time.monotonic(), time.time()
+        with self._lock:
+            rows = [{"consulta": e.label, "linhas": len(e.df), "mb": round(e.nbytes / 1e6, 3), "hits": e.hits,
+                     "idade_s": round(wall - e.stored), "ocioso_s": round(now - e.last_used)}
+                    for e in self._entries.values()]
+        return pd.DataFrame(rows, columns=["consulta", "linhas", "mb", "hits", "idade_s", "ocioso_s"]) \
+            .sort_values("mb", ascending=False, ignore_index=True)
+
+    # -- disk tier ------------------------------------------------------------
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.parquet")
+
+    def _disk_get(self, key: str, watermark: str) -> pd.DataFrame | None:
+        if not self.disk_dir:
+            return None
+        import pyarrow.parquet as pq
+
+        path = self._path(key)
+        try:
+            meta = pq.read_schema(path).metadata or {}
+            if meta.get(WATERMARK_META_KEY, b"").decode() != watermark:
+                return None
+            df = pq.read_table(path).to_pandas()
+            os.utime(path)
+            return df
+        except (OSError, ValueError):
+            return None
+
+    def _disk_put(self, key: str, watermark: str, df: pd.DataFrame):
+        if not self.disk_dir:
+            return
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+        except (pa.ArrowException, TypeError, ValueError):
+            return  # e.g. object columns mixing dicts and strings
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}),
+                                               WATERMARK_META_KEY: watermark.encode()})
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            pq.write_table(table, tmp)
+            os.replace(tmp, path)
+        except OSError:
+            return
+        self._disk_trim()
+
+    def _disk_trim(self):
+        if not self.disk_max_bytes:
+            return
+        files = []
+        for name in os.listdir(self.disk_dir):
+            if name.endswith(".parquet"):
+                path = os.path.join(self.disk_dir, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+        total = sum(f[1] for f in files)
+        for _, size, path in sorted(files):
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+
+def engine_ident(engine: Engine) -> str:
+    # rendered without the password
+    return engine.url.render_as_string(hide_password=True)
+
+
+def cached_query(cache: ResultCache, watermarks: Watermarks, engine: Engine, sql: str,
+                 params: dict | None, how: str, scope: tuple[str, ...] | None = None,
+                 metrics=None) -> pd.DataFrame:
+    """
+    Serve `sql` from `cache`, re-running it only when the watermark for
+    `scope` (or the whole database) has moved. When `metrics` (a
+    viewer.instrumentation.QueryMetrics) is given, the hit/miss, fetch
+    latency, rows and size are recorded against the query's fingerprint.
+    """
+    from viewer.fetch import read_df
+    from viewer.instrumentation import fingerprint
+
+    key = ResultCache.make_key(engine_ident(engine), sql, params, how)
+    label = " ".join(fingerprint(sql))[:120]
+    watermark = watermarks.get(engine, scope)
+    df = cache.get(key, watermark, label)
+    if df is not None:
+        if metrics is not None:
+            # the size measured when the entry was stored: hits stay O(1)
+            metrics.record_fetch(sql, df, None, hit=True, nbytes=cache.entry_nbytes(key))
+        return df
+    t0 = time.perf_counter()
+    df = read_df(engine, sql, params, how=how)
+    seconds, nbytes = time.perf_counter() - t0, frame_nbytes(df)
+    if metrics is not None:
+        metrics.record_fetch(sql, df, seconds, hit=False, nbytes=nbytes)
+    cache.put(key, watermark, df, label, nbytes)
+    return df.copy(deep=False)
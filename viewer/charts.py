@@ -0,0 +1,69 @@
+"""
+Chart rendering for the Ads time series.
+
+Series are downsampled with Largest-Triangle-Three-Buckets (LTTB), which
+keeps peaks and troughs, so a 5-year daily series renders as fast as a
+30-day one. Rendering uses matplotlib's object API (no pyplot global
+state), which is safe to call from several sessions at once.
+"""
+import io
+
+import numpy as np
+import pandas as pd
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+MAX_POINTS = 800
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Indices of the points LTTB keeps out of (x, y); x must be increasing.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = x.astype(np.float64)
+    y = y.astype(np.float64)
+    out = np.empty(threshold, dtype=np.int64)
+    out[0], out[-1] = 0, n - 1
+    # Interior points are split into threshold - 2 buckets
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nlo, nhi = edges[i + 1], (edges[i + 2] if i + 2 < len(edges) else n)
+        # Average of the next bucket (the last point when it is empty)
+        if nhi > nlo:
+            cx, cy = x[nlo:nhi].mean(), y[nlo:nhi].mean()
+        else:
+            cx, cy = x[-1], y[-1]
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(np.nanargmax(area)) if len(area) and not np.all(np.isnan(area)) else lo
+        out[i + 1] = a
+    return out
+
+
+def downsample(dates: pd.Series, values: pd.Series, max_points: int = MAX_POINTS) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Return (datetime64 x, float y) arrays with at most `max_points` points.
+    """
+    x = pd.to_datetime(dates).to_numpy(dtype="datetime64[ns]")
+    y = pd.to_numeric(values).to_numpy(dtype=np.float64, na_value=np.nan)
+    idx = lttb_indices(x.view(np.int64), np.nan_to_num(y), max_points)
+    return x[idx], y[idx]
+
+
+def render_line_png(x: np.ndarray, y: np.ndarray, title: str, xlabel: str, ylabel: str) -> bytes:
+    fig = Figure(figsize=(8, 3), dpi=100)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    ax.plot(x, y)
+    ax.set_title(title)
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    fig.autofmt_xdate()
+    fig.tight_layout()
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png")
+    return buf.getvalue()
@@ -0,0 +1,157 @@
+"""
+Post-fetch compaction of result frames.
+
+Query results arrive with text as one Python str object per cell and every
+number at 64 bits. Most text columns here are low-cardinality dimensions
+(campaign names, ASINs, SKUs, statuses) and most numeric sums are whole
+numbers, so:
+
+* strings whose distinct count is at most CATEGORY_MAX_RATIO of the rows
+  become pandas categoricals (one copy of each value plus integer codes);
+* integer columns, and float columns that only hold whole numbers, are
+  narrowed to int32 when their range fits;
+* other floats become float32 only when every value survives the round
+  trip exactly.
+
+Every change is lossless for the values as fetched, but narrowed columns
+compute at their new width: int32 arithmetic (clicks * 1000, a cumsum)
+wraps past 2**31 and float32 sums lose precision. Measures, the columns
+that get added up, scaled and accumulated (MEASURE_COLUMNS), therefore
+keep 64 bits; whole-number float measures become int64. Everything else
+(dimensions, IDs, small counts) is narrowed; cast before doing heavy
+arithmetic on such a column.
+
+Numbers from the "arrow" fetch engine stay Arrow-backed; its text columns
+become categoricals whose categories keep the Arrow string type.
+"""
+import numpy as np
+import pandas as pd
+
+from viewer.queries import METRIC_COLUMNS
+
+CATEGORY_MAX_RATIO = 0.5
+# Below this many rows the per-column overhead outweighs the savings
+MIN_ROWS = 32
+
+_I32 = np.iinfo(np.int32)
+
+# Never narrowed below 64 bits (the Ads metrics and their period-over-period columns)
+MEASURE_COLUMNS = frozenset(METRIC_COLUMNS) | {f"{c}_prev" for c in METRIC_COLUMNS}
+
+
+def _is_arrow(dtype) -> bool:
+    return isinstance(dtype, pd.ArrowDtype)
+
+
+def _is_text(s: pd.Series) -> bool:
+    if _is_arrow(s.dtype):
+        import pyarrow as pa
+
+        return pa.types.is_string(s.dtype.pyarrow_dtype) or pa.types.is_large_string(s.dtype.pyarrow_dtype)
+    if pd.api.types.is_string_dtype(s.dtype) and not isinstance(s.dtype, pd.CategoricalDtype):
+        return pd.api.types.infer_dtype(s, skipna=True) in ("string", "empty")
+    return False
+
+
+def _fits_int32(values: np.ndarray) -> bool:
+    return values.size == 0 or (values.min() >= _I32.min and values.max() <= _I32.max)
+
+
+def _compact_text(s: pd.Series, max_ratio: float) -> pd.Series | None:
+    if s.nunique(dropna=True) > max_ratio * len(s):
+        return None
+    return s.astype("category")
+
+
+def _compact_numpy_number(s: pd.Series, wide: bool = False) -> pd.Series | None:
+    values = s.to_numpy()
+    if pd.api.types.is_integer_dtype(s.dtype):
+        if not wide and s.dtype.itemsize > 4 and _fits_int32(values):
+            return s.astype(np.int32)
+        return None
+    if s.dtype != np.float64:
+        return None
+    finite = np.isfinite(values)
+    if finite.all() and np.array_equal(values, np.round(values)):
+        return s.astype(np.int32 if not wide and _fits_int32(values) else np.int64)
+    if wide:
+        return None
+    narrowed = values.astype(np.float32)
+    if np.array_equal(narrowed.astype(np.float64), values, equal_nan=True):
+        return pd.Series(narrowed, index=s.index, name=s.name)
+    return None
+
+
+def _compact_arrow_number(s: pd.Series, wide: bool = False) -> pd.Series | None:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    arr = s.array.__arrow_array__()
+    if not isinstance(arr, pa.ChunkedArray):
+        arr = pa.chunked_array([arr])
+    typ = arr.type
+    if wide and not pa.types.is_float64(typ):
+        return None
+    if pa.types.is_integer(typ) and typ.bit_width > 32:
+        bounds = pc.min_max(arr)
+        lo, hi = bounds["min"].as_py(), bounds["max"].as_py()
+        if lo is None or (lo >= _I32.min and hi <= _I32.max):
+            return pd.Series(arr.cast(pa.int32()), index=s.index, name=s.name, dtype=pd.ArrowDtype(pa.int32()))
+        return None
+    if pa.types.is_float64(typ):
+        values = s.to_numpy(dtype=np.float64, na_value=np.nan)
+        present = ~np.isnan(values)
+        if np.isfinite(values[present]).all() and np.array_equal(values[present], np.round(values[present])):
+            target = pa.int32() if not wide and _fits_int32(values[present]) else pa.int64()
+            return pd.Series(arr.cast(target), index=s.index, name=s.name, dtype=pd.ArrowDtype(target))
+        if wide:
+            return None
+        narrowed = values.astype(np.float32)
+        if np.array_equal(narrowed.astype(np.float64), values, equal_nan=True):
+            return pd.Series(arr.cast(pa.float32()), index=s.index, name=s.name, dtype=pd.ArrowDtype(pa.float32()))
+    return None
+
+
+def compact_column(s: pd.Series, max_ratio: float = CATEGORY_MAX_RATIO, wide: bool = False) -> pd.Series | None:
+    """
+    Compacted copy of `s`, or None when nothing can be saved losslessly.
+    A `wide` (measure) column keeps 64-bit numbers.
+    """
+    if _is_text(s):
+        return _compact_text(s, max_ratio)
+    if _is_arrow(s.dtype):
+        return _compact_arrow_number(s, wide)
+    if pd.api.types.is_numeric_dtype(s.dtype) and not pd.api.types.is_bool_dtype(s.dtype):
+        return _compact_numpy_number(s, wide)
+    return None
+
+
+def compact_frame(df: pd.DataFrame, max_ratio: float = CATEGORY_MAX_RATIO,
+                  stats: dict | None = None, measures: frozenset = MEASURE_COLUMNS) -> pd.DataFrame:
+    """
+    Frame with every compactable column replaced (the input is left
+    untouched); numbers in `measures` keep 64 bits. `stats`, when given,
+    receives the bytes before and after for the replaced columns.
+    """
+    if len(df) < MIN_ROWS or not df.columns.is_unique:
+        return df
+    replaced = {}
+    for name in df.columns:
+        try:
+            compacted = compact_column(df[name], max_ratio, wide=name in measures)
+        except (TypeError, ValueError, OverflowError):
+            # e.g. a text column holding unhashable values
+            continue
+        if compacted is not None:
+            replaced[name] = compacted
+    if not replaced:
+        return df
+    if stats is not None:
+        stats["before"] = stats.get("before", 0) + sum(int(df[c].memory_usage(deep=True, index=False))
+                                                       for c in replaced)
+        stats["after"] = stats.get("after", 0) + sum(int(s.memory_usage(deep=True, index=False))
+                                                     for s in replaced.values())
+    out = df.copy(deep=False)
+    for name, compacted in replaced.items():
+        out[name] = compacted
+    return out
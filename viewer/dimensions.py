@@ -0,0 +1,65 @@
+"""
+Typeahead options for the campaign and ASIN filters.
+
+Options are searched, not listed: each lookup returns at most `limit`
+values matching what the user typed, ranked by spend, and scoped to the
+selected period and to the other filter (picking a campaign narrows the
+ASIN list and vice versa).
+
+The source is the campaign x ASIN dimension list maintained with the
+rollups (rollups.DIMENSION_LIST), a few thousand rows with lower(col)
+prefix indexes and, where pg_trgm is installed, trigram indexes for
+substring search. Its date scoping is by each pair's first/last active
+day, so a pair idle for part of the period still shows up. Without the
+list, the finest populated rollup (or the live view) is searched instead.
+"""
+from viewer.queries import AdsFilters
+from viewer.rollups import DIMENSION_LIST, route
+
+OPTION_LIMIT = 50
+_OTHER = {"campaign_name": "advertised_asin", "advertised_asin": "campaign_name"}
+
+
+def _pattern(query: str, contains: bool) -> str:
+    escaped = query.lower().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%" if contains else f"{escaped}%"
+
+
+def options_sql(column: str, filters: AdsFilters, query: str, available: set[str],
+                trigram: bool = False, limit: int = OPTION_LIMIT) -> tuple[str, dict, str]:
+    """
+    (sql, params, source relation) for the options of `column`. `filters`
+    should carry the period and the *other* dimension's selection only.
+    Matching is by substring when pg_trgm can index it, by prefix otherwise.
+    """
+    if column not in _OTHER:
+        raise ValueError(f"Coluna sem typeahead: {column}")
+    other = _OTHER[column]
+    selected = filters.asins if other == "advertised_asin" else filters.campaigns
+    params = {"lim": int(limit)}
+    where = [f"{column} IS NOT NULL"]
+    if query:
+        # lower() on both sides so the prefix form can use the lower(col) text_pattern_ops index
+        where.append(f"lower({column}) LIKE :pattern")
+        params["pattern"] = _pattern(query, trigram)
+
+    if DIMENSION_LIST in available:
+        source = DIMENSION_LIST
+        if filters.dstart:
+            where.append("last_date >= :dstart")
+            params["dstart"] = filters.dstart
+        if filters.dend:
+            where.append("first_date <= :dend")
+            params["dend"] = filters.dend
+        if selected:
+            where.append(f"{other} = ANY(:others)")
+            params["others"] = list(selected)
+    else:
+        source = route(filters, {column}, available)
+        filter_sql, filter_params = filters.where()
+        where.append(filter_sql)
+        params.update(filter_params)
+
+    sql = (f"SELECT {column} AS value FROM {source} WHERE {' AND '.join(where)} "
+           f"GROUP BY {column} ORDER BY SUM(spend) DESC NULLS LAST, {column} LIMIT :lim;")
+    return sql, params, source
@@ -0,0 +1,118 @@
+"""
+Streaming exports.
+
+The query runs inside `COPY (...) TO STDOUT`, so Postgres sends CSV that is
+written straight to a temp file (optionally gzip'd, or converted to Parquet
+batch by batch). Nothing proportional to the result size is held in memory.
+"""
+import gzip
+import os
+import tempfile
+import time
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv", ".csv"),
+    "csv.gz": ("application/gzip", ".csv.gz"),
+    "parquet": ("application/vnd.apache.parquet", ".parquet"),
+}
+
+EXPORT_DIR = os.path.join(tempfile.gettempdir(), "pgviewer-exports")
+EXPORT_MAX_AGE_S = 3600
+
+
+def _cleanup_old_exports():
+    now = time.time()
+    for name in os.listdir(EXPORT_DIR):
+        path = os.path.join(EXPORT_DIR, name)
+        try:
+            if now - os.path.getmtime(path) > EXPORT_MAX_AGE_S:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+def bind_sql(cursor, engine: Engine, sql: str, params: dict | None = None) -> str:
+    """
+    Render `sql` (with :named params) as a literal statement, the only form
+    COPY accepts. Values are escaped by psycopg2 itself.
+    """
+    compiled = str(text(sql).compile(dialect=engine.dialect))
+    rendered = cursor.mogrify(compiled, params or {}).decode()
+    return rendered.strip().rstrip(";").strip()
+
+
+def _copy_csv(cursor, query: str, fileobj):
+    cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER true)", fileobj)
+
+
+def _csv_to_parquet(cursor, query: str, csv_path: str, out_path: str, block_size: int = 8 << 20):
+    import pyarrow.csv as pacsv
+    import pyarrow.parquet as pq
+    from viewer.pgtypes import arrow_schema
+
+    cursor.execute(f"SELECT * FROM ({query}) AS q LIMIT 0")
+    # COPY writes arrays as '{a,b}' literals, which the CSV reader can only take as text
+    schema = arrow_schema(cursor.description, arrays=False)
+    reader = pacsv.open_csv(
+        csv_path,
+        read_options=pacsv.ReadOptions(block_size=block_size),
+        convert_options=pacsv.ConvertOptions(
+            column_types=schema,
+            true_values=["t"],
+            false_values=["f"],
+            strings_can_be_null=True,
+            quoted_strings_can_be_null=False,
+            timestamp_parsers=["%Y-%m-%d %H:%M:%S%z", pacsv.ISO8601],
+        ),
+    )
+    with pq.ParquetWriter(out_path, schema) as writer:
+        for batch in reader:
+            writer.write_batch(batch)
+
+
+def export_query(engine: Engine, sql: str, params: dict | None = None, fmt: str = "csv",
+                 timeout_s: float | None = None) -> str:
+    """
+    Stream the result of `sql` to a temp file and return its path.
+    `fmt` is one of EXPORT_FORMATS; `timeout_s` bounds the statement.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Formato de exportação desconhecido: {fmt}")
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    _cleanup_old_exports()
+    fd, path = tempfile.mkstemp(suffix=EXPORT_FORMATS[fmt][1], dir=EXPORT_DIR)
+    os.close(fd)
+
+    raw = engine.raw_connection()
+    try:
+        cur = raw.cursor()
+        if timeout_s:
+            cur.execute("SELECT set_config('statement_timeout', %s, true)", (f"{int(timeout_s * 1000)}",))
+        query = bind_sql(cur, engine, sql, params)
+        if fmt == "csv":
+            with open(path, "wb") as f:
+                _copy_csv(cur, query, f)
+        elif fmt == "csv.gz":
+            with gzip.open(path, "wb", compresslevel=6) as f:
+                _copy_csv(cur, query, f)
+        else:
+            csv_path = path + ".csv"
+            try:
+                with open(csv_path, "wb") as f:
+                    _copy_csv(cur, query, f)
+                _csv_to_parquet(cur, query, csv_path, path)
+            finally:
+                if os.path.exists(csv_path):
+                    os.remove(csv_path)
+        cur.close()
+        raw.rollback()
+    except Exception:
+        raw.rollback()
+        os.remove(path)
+        raise
+    finally:
+        raw.close()
+    return path
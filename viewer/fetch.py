@@ -0,0 +1,111 @@
+"""
+Result fetch engines.
+
+"pandas" is the original `pd.read_sql` path (as read_sql_query, which skips
+the has_table probe read_sql issues first). "arrow" streams the result
+through a server-side cursor in batches and decodes each batch column-wise
+into Arrow arrays, so no per-row Python objects survive the fetch and the
+DataFrame comes out Arrow-backed with types taken from the Postgres OIDs.
+"""
+import uuid
+from contextlib import contextmanager
+
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from viewer.compact import compact_frame
+from viewer.sql import ROW_RETURNING
+
+FETCH_ENGINES = ("pandas", "arrow")
+ARROW_BATCH_ROWS = 50_000
+
+
+def read_pandas(engine: Engine, sql: str, params: dict | None = None) -> pd.DataFrame:
+    with engine.connect() as conn:
+        return pd.read_sql_query(text(sql), conn, params=params)
+
+
+def _register_casts(cursor):
+    import psycopg2.extensions as ext
+    import psycopg2.extras as extras
+
+    # numeric -> float and json -> raw text, so batches map onto fixed Arrow types
+    dec2float = ext.new_type(ext.DECIMAL.values, "PGVIEWER_DEC2FLOAT",
+                             lambda v, cur: float(v) if v is not None else None)
+    ext.register_type(dec2float, cursor)
+    extras.register_default_json(cursor, loads=lambda v: v)
+    extras.register_default_jsonb(cursor, loads=lambda v: v)
+
+
+def _batch_to_arrow(rows: list, schema):
+    import pyarrow as pa
+
+    arrays = []
+    for field, values in zip(schema, zip(*rows)):
+        if pa.types.is_string(field.type):
+            values = [v if v is None or isinstance(v, str) else str(v) for v in values]
+        arrays.append(pa.array(values, type=field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+@contextmanager
+def arrow_batches(engine: Engine, sql: str, params: dict | None = None, batch_rows: int = ARROW_BATCH_ROWS):
+    """
+    Stream `sql` as a pyarrow.RecordBatchReader, `batch_rows` rows per
+    round trip; the server-side cursor lives as long as the context.
+    """
+    import pyarrow as pa
+    from viewer.pgtypes import arrow_schema
+
+    compiled = str(text(sql).compile(dialect=engine.dialect))
+    raw = engine.raw_connection()
+    try:
+        cur = raw.cursor(name=f"pgviewer_{uuid.uuid4().hex[:12]}")
+        cur.itersize = batch_rows
+        _register_casts(cur)
+        cur.execute(compiled, params or {})
+        rows = cur.fetchmany(batch_rows)
+        schema = arrow_schema(cur.description)
+
+        def batches():
+            nonlocal rows
+            while rows:
+                yield _batch_to_arrow(rows, schema)
+                rows = cur.fetchmany(batch_rows)
+
+        yield pa.RecordBatchReader.from_batches(schema, batches())
+        cur.close()
+        raw.rollback()
+    except Exception:
+        raw.rollback()
+        raise
+    finally:
+        raw.close()
+
+
+def read_arrow_table(engine: Engine, sql: str, params: dict | None = None,
+                     batch_rows: int = ARROW_BATCH_ROWS):
+    """
+    Fetch `sql` into a pyarrow.Table, `batch_rows` rows per round trip.
+    """
+    with arrow_batches(engine, sql, params, batch_rows) as reader:
+        return reader.read_all()
+
+
+def read_arrow(engine: Engine, sql: str, params: dict | None = None) -> pd.DataFrame:
+    return read_arrow_table(engine, sql, params).to_pandas(types_mapper=pd.ArrowDtype)
+
+
+def read_df(engine: Engine, sql: str, params: dict | None = None, how: str = "pandas",
+            compact: bool = True) -> pd.DataFrame:
+    """
+    Run `sql` with the chosen fetch engine. Statements a server-side cursor
+    cannot DECLARE (DDL, DML, SHOW...) always take the pandas path. With
+    `compact` the frame goes through viewer.compact before it is returned.
+    """
+    if how == "arrow" and ROW_RETURNING.match(sql):
+        df = read_arrow(engine, sql.strip().rstrip(";"), params)
+    else:
+        df = read_pandas(engine, sql, params)
+    return compact_frame(df) if compact else df
@@ -0,0 +1,119 @@
+"""
+Incremental refresh of the Ads series.
+
+Only the newest days of vw_sp_campaign_metrics_per_product change (late
+attribution restates the last few days). The store keeps the series already
+loaded for each database, relation, filter set and bucket unit and, when
+the data watermark
+moves, re-queries only the buckets from the one holding `last loaded day -
+restate_days` onward and splices them in. The re-query starts one bucket
+earlier so the first spliced row still gets its previous-bucket values
+from LAG; that extra row is dropped.
+"""
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import replace
+from datetime import timedelta
+from typing import Callable
+
+import pandas as pd
+
+from viewer.buckets import bucket_start, previous_bucket_start
+from viewer.cache import frame_nbytes
+from viewer.queries import ADS_VIEW, AdsFilters, series_sql
+
+Fetch = Callable[[str, dict], pd.DataFrame]
+# (engine identity, relation, filters, unit)
+Key = tuple[str, str, AdsFilters, str]
+
+
+def _normalize(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.copy(deep=False)
+    df["date"] = pd.to_datetime(df["date"])
+    return df
+
+
+class IncrementalSeries:
+    """
+    Process-wide store of per-filter-set series, bounded to `max_entries`
+    (database, relation, filter set, unit) keys (least recently used are
+    dropped). Like
+    ResultCache it can be registered with a viewer.memory.MemoryBudget.
+    """
+
+    def __init__(self, max_entries: int = 32):
+        self.max_entries = max_entries
+        # key -> (watermark, frame, nbytes, last use)
+        self._frames: OrderedDict[Key, tuple[str, pd.DataFrame, int, float]] = OrderedDict()
+        self._key_locks: dict[Key, threading.Lock] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.budget = None
+
+    def _key_lock(self, key: Key) -> threading.Lock:
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _load(self, key: Key, fetch: Fetch, watermark: str, restate_days: int) -> pd.DataFrame:
+        _, relation, filters, unit = key
+        with self._lock:
+            kept = self._frames.get(key)
+        if kept is not None and kept[0] == watermark:
+            return kept[1]
+        if kept is None or kept[1].empty:
+            return _normalize(fetch(*series_sql(filters, relation, unit)))
+
+        frame = kept[1]
+        cutoff = pd.Timestamp(bucket_start(frame["date"].max() - timedelta(days=restate_days), unit))
+        dstart = pd.Timestamp(previous_bucket_start(cutoff, unit))
+        if filters.dstart:
+            dstart = max(pd.Timestamp(filters.dstart), dstart)
+        delta = _normalize(fetch(*series_sql(replace(filters, dstart=str(dstart.date())), relation, unit)))
+        merged = pd.concat([frame[frame["date"] < cutoff], delta[delta["date"] >= cutoff]], ignore_index=True)
+        return merged.sort_values("date", ignore_index=True)
+
+    def get(self, source: str, filters: AdsFilters, fetch: Fetch, watermark: str, restate_days: int = 3,
+            relation: str = ADS_VIEW, unit: str = "day") -> pd.DataFrame:
+        """
+        Series for `filters` in `unit` buckets, refreshed from the tail when
+        `watermark` has moved since it was loaded. `source` identifies the
+        database `fetch` reads (viewer.cache.engine_ident). Any relation with
+        the view's columns (e.g. a rollup) can serve as `relation`.
+        """
+        key = (source, relation, filters, unit)
+        with self._key_lock(key):
+            df = self._load(key, fetch, watermark, restate_days)
+            nbytes = frame_nbytes(df)
+            with self._lock:
+                old = self._frames.pop(key, None)
+                self._bytes += nbytes - (old[2] if old else 0)
+                self._frames[key] = (watermark, df, nbytes, time.monotonic())
+                while len(self._frames) > self.max_entries:
+                    self._evict_first()
+        if self.budget is not None:
+            self.budget.enforce()
+        return df
+
+    def _evict_first(self) -> int:
+        evicted, entry = self._frames.popitem(last=False)
+        self._key_locks.pop(evicted, None)
+        self._bytes -= entry[2]
+        return entry[2]
+
+    def clear(self):
+        with self._lock:
+            self._frames.clear()
+            self._bytes = 0
+
+    # -- accounting (viewer.memory) -------------------------------------------
+    def nbytes(self) -> int:
+        return self._bytes
+
+    def oldest(self) -> float | None:
+        with self._lock:
+            return next(iter(self._frames.values()))[3] if self._frames else None
+
+    def evict_oldest(self) -> int:
+        with self._lock:
+            return self._evict_first() if self._frames else 0
@@ -0,0 +1,252 @@
+"""
+Query instrumentation.
+
+Two layers feed one registry, keyed by a normalized SQL fingerprint:
+
+- SQLAlchemy cursor events time every statement the engine executes
+  ("exec" latency, which for client-side cursors includes the transfer);
+- cached_query records each logical fetch: cache hit/miss, end-to-end
+  fetch latency (including decode), rows and approximate bytes. This also
+  covers paths that use raw DBAPI cursors (Arrow fetch, exports).
+
+Pool checkout wait is measured around the pool's connect().
+
+Set VIEWER_METRICS_JSONL to append every event as a JSON line, and
+VIEWER_METRICS_PROM to keep a Prometheus text file (textfile collector
+format) up to date.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import weakref
+from collections import OrderedDict, deque
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+MAX_FINGERPRINTS = 500
+SAMPLES_PER_FINGERPRINT = 512
+PROM_WRITE_INTERVAL_S = 15
+
+_COMMENTS = re.compile(r"--[^\n]*|/\*.*?\*/", re.DOTALL)
+_STRINGS = re.compile(r"'(?:[^']|'')*'")
+_NUMBERS = re.compile(r"(?<![\w$])-?\d+(?:\.\d+)?\b")
+_BINDS = re.compile(r"%\(\w+\)s|(?<![:\w]):\w+")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_sql(sql: str) -> str:
+    sql = _COMMENTS.sub(" ", sql)
+    sql = _STRINGS.sub("?", sql)
+    sql = _BINDS.sub("?", sql)
+    sql = _NUMBERS.sub("?", sql)
+    return _SPACES.sub(" ", sql).strip().rstrip(";").strip().lower()
+
+
+def fingerprint(sql: str) -> tuple[str, str]:
+    norm = normalize_sql(sql)
+    return hashlib.sha1(norm.encode()).hexdigest()[:12], norm
+
+
+class _Stats:
+    __slots__ = ("sql", "execs", "exec_s", "fetches", "fetch_s", "rows", "bytes", "hits", "misses", "errors")
+
+    def __init__(self, sql: str):
+        self.sql = sql
+        self.execs = 0
+        self.exec_s = deque(maxlen=SAMPLES_PER_FINGERPRINT)
+        self.fetches = 0
+        self.fetch_s = deque(maxlen=SAMPLES_PER_FINGERPRINT)
+        self.rows = 0
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+
+def _pct(samples, q) -> float | None:
+    return float(np.percentile(samples, q)) if samples else None
+
+
+class QueryMetrics:
+    """
+    Thread-safe per-fingerprint registry (bounded LRU of fingerprints).
+    """
+
+    def __init__(self, jsonl_path: str | None = None, prom_path: str | None = None):
+        self.jsonl_path = jsonl_path
+        self.prom_path = prom_path
+        self.pool_wait_s = deque(maxlen=SAMPLES_PER_FINGERPRINT * 4)
+        self._stats: OrderedDict[str, _Stats] = OrderedDict()
+        self._engines = weakref.WeakSet()
+        self._lock = threading.Lock()
+        self._prom_written = 0.0
+
+    # -- recording ------------------------------------------------------------
+    def _get(self, sql: str) -> tuple[str, _Stats]:
+        fp, norm = fingerprint(sql)
+        st = self._stats.get(fp)
+        if st is None:
+            st = self._stats[fp] = _Stats(norm[:500])
+            while len(self._stats) > MAX_FINGERPRINTS:
+                self._stats.popitem(last=False)
+        else:
+            self._stats.move_to_end(fp)
+        return fp, st
+
+    def record_exec(self, sql: str, seconds: float, error: bool = False):
+        with self._lock:
+            fp, st = self._get(sql)
+            st.execs += 1
+            st.exec_s.append(seconds)
+            st.errors += int(error)
+        self._emit({"event": "exec", "fp": fp, "seconds": seconds, "error": error})
+
+    def record_fetch(self, sql: str, df: pd.DataFrame | None, seconds: float | None, hit: bool,
+                     nbytes: int | None = None):
+        if nbytes is None:
+            nbytes = int(df.memory_usage(deep=True, index=True).sum()) if df is not None else 0
+        rows = len(df) if df is not None else 0
+        with self._lock:
+            fp, st = self._get(sql)
+            if hit:
+                st.hits += 1
+            else:
+                st.misses += 1
+                st.fetches += 1
+                st.fetch_s.append(seconds or 0.0)
+                st.rows += rows
+                st.bytes += nbytes
+        self._emit({"event": "fetch", "fp": fp, "cache": "hit" if hit else "miss",
+                    "seconds": seconds, "rows": rows, "bytes": nbytes})
+
+    def record_pool_wait(self, seconds: float):
+        with self._lock:
+            self.pool_wait_s.append(seconds)
+
+    def _emit(self, record: dict):
+        if self.jsonl_path:
+            line = json.dumps({"ts": time.time(), **record})
+            with self._lock, open(self.jsonl_path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        if self.prom_path and time.monotonic() - self._prom_written > PROM_WRITE_INTERVAL_S:
+            self._prom_written = time.monotonic()
+            self.write_prometheus(self.prom_path)
+
+    # -- engine hooks -----------------------------------------------------------
+    def instrument(self, engine: Engine):
+        """
+        Attach cursor and pool-checkout timing to `engine` (idempotent).
+        """
+        with self._lock:
+            if engine in self._engines:
+                return
+            self._engines.add(engine)
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def _before(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault("pgviewer_t0", []).append(time.perf_counter())
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def _after(conn, cursor, statement, parameters, context, executemany):
+            self.record_exec(statement, time.perf_counter() - conn.info["pgviewer_t0"].pop())
+
+        @event.listens_for(engine, "handle_error")
+        def _error(ctx):
+            starts = ctx.connection.info.get("pgviewer_t0") if ctx.connection is not None else None
+            if starts and ctx.statement:
+                self.record_exec(ctx.statement, time.perf_counter() - starts.pop(), error=True)
+
+        pool = engine.pool
+        checkout = pool.connect
+
+        def timed_connect():
+            t0 = time.perf_counter()
+            try:
+                return checkout()
+            finally:
+                self.record_pool_wait(time.perf_counter() - t0)
+
+        pool.connect = timed_connect
+
+    # -- reporting ----------------------------------------------------------------
+    def snapshot(self) -> pd.DataFrame:
+        with self._lock:
+            rows = [{
+                "fingerprint": fp,
+                "sql": st.sql[:120],
+                "execs": st.execs,
+                "exec_p50_ms": _ms(_pct(st.exec_s, 50)),
+                "exec_p95_ms": _ms(_pct(st.exec_s, 95)),
+                "exec_p99_ms": _ms(_pct(st.exec_s, 99)),
+                "fetches": st.fetches,
+                "fetch_p50_ms": _ms(_pct(st.fetch_s, 50)),
+                "fetch_p95_ms": _ms(_pct(st.fetch_s, 95)),
+                "rows": st.rows,
+                "mb": round(st.bytes / 1e6, 2),
+                "cache_hits": st.hits,
+                "cache_misses": st.misses,
+                "errors": st.errors,
+            } for fp, st in self._stats.items()]
+        df = pd.DataFrame(rows)
+        return df.sort_values("exec_p95_ms", ascending=False, na_position="last") if not df.empty else df
+
+    def pool_summary(self) -> dict:
+        with self._lock:
+            waits = list(self.pool_wait_s)
+        return {"checkouts": len(waits), "wait_p50_ms": _ms(_pct(waits, 50)),
+                "wait_p95_ms": _ms(_pct(waits, 95)), "wait_max_ms": _ms(max(waits) if waits else None)}
+
+    def prometheus_text(self) -> str:
+        lines = [
+            "# TYPE pgviewer_query_exec_seconds summary",
+            "# TYPE pgviewer_query_fetch_seconds summary",
+            "# TYPE pgviewer_query_rows_total counter",
+            "# TYPE pgviewer_query_bytes_total counter",
+            "# TYPE pgviewer_query_cache_total counter",
+            "# TYPE pgviewer_pool_checkout_wait_seconds summary",
+        ]
+        with self._lock:
+            for fp, st in self._stats.items():
+                label = f'fingerprint="{fp}"'
+                for name, samples, count in (("exec", st.exec_s, st.execs), ("fetch", st.fetch_s, st.fetches)):
+                    for q in (0.5, 0.95, 0.99):
+                        if samples:
+                            lines.append(f'pgviewer_query_{name}_seconds{{{label},quantile="{q}"}} '
+                                         f"{_pct(samples, q * 100):.6f}")
+                    lines.append(f"pgviewer_query_{name}_seconds_count{{{label}}} {count}")
+                lines.append(f"pgviewer_query_rows_total{{{label}}} {st.rows}")
+                lines.append(f"pgviewer_query_bytes_total{{{label}}} {st.bytes}")
+                lines.append(f'pgviewer_query_cache_total{{{label},result="hit"}} {st.hits}')
+                lines.append(f'pgviewer_query_cache_total{{{label},result="miss"}} {st.misses}')
+            waits = list(self.pool_wait_s)
+            engines = list(self._engines)
+        for q in (0.5, 0.95, 0.99):
+            if waits:
+                lines.append(f'pgviewer_pool_checkout_wait_seconds{{quantile="{q}"}} {_pct(waits, q * 100):.6f}')
+        lines.append(f"pgviewer_pool_checkout_wait_seconds_count {len(waits)}")
+        for engine in engines:
+            url = engine.url
+            lines.append(f'pgviewer_pool_checked_out{{db="{url.host}/{url.database}"}} '
+                         f"{getattr(engine.pool, 'checkedout', lambda: 0)()}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str):
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp, path)
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self.pool_wait_s.clear()
+
+
+def _ms(seconds: float | None) -> float | None:
+    return round(seconds * 1000, 1) if seconds is not None else None
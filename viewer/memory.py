@@ -0,0 +1,171 @@
+"""
+Process-wide memory budget and per-session accounting.
+
+The shared result stores (ResultCache, IncrementalSeries) register with one
+MemoryBudget, and every session reports what its session_state holds at the
+end of each run. Whenever stores and sessions together exceed `max_bytes`,
+the least recently used entry across all stores is evicted until the total
+fits again. Session data cannot be dropped from another session's thread,
+so it only squeezes the shared caches; each session is held to
+`session_max_bytes` on its own by trimming its pagers' page caches.
+"""
+import threading
+import time
+from typing import Mapping
+
+import numpy as np
+import pandas as pd
+
+from viewer.cache import frame_nbytes
+
+# Sessions that have not reported for this long are assumed closed
+SESSION_TTL_S = 1800
+
+
+def object_nbytes(obj, _seen: set | None = None) -> int:
+    """
+    Bytes held by frames and arrays reachable from `obj` (containers are
+    walked; objects with an nbytes() method report for themselves).
+    """
+    seen = set() if _seen is None else _seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    if isinstance(obj, pd.DataFrame):
+        return frame_nbytes(obj)
+    if isinstance(obj, pd.Series):
+        return int(obj.memory_usage(deep=True, index=True))
+    if isinstance(obj, np.ndarray):
+        return int(obj.nbytes)
+    if isinstance(obj, (bytes, bytearray)):
+        return len(obj)
+    if isinstance(obj, dict):
+        return sum(object_nbytes(v, seen) for v in obj.values())
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return sum(object_nbytes(v, seen) for v in obj)
+    nbytes = getattr(obj, "nbytes", None)
+    if callable(nbytes):
+        return int(nbytes())
+    return 0
+
+
+def session_usage(state: Mapping) -> dict[str, int]:
+    """
+    Bytes per session_state key, for keys that hold anything.
+    """
+    usage = {}
+    for key in list(state.keys()):
+        try:
+            nbytes = object_nbytes(state[key])
+        except (KeyError, TypeError, ValueError):
+            continue
+        if nbytes:
+            usage[str(key)] = nbytes
+    return dict(sorted(usage.items(), key=lambda kv: -kv[1]))
+
+
+def trim_pagers(state: Mapping, excess: int) -> int:
+    """
+    Release at least `excess` bytes from the session's pager caches, least
+    recently used pager first; the most recent one keeps its current page.
+    """
+    pagers = sorted((p for _, p in state.get("pagers", {}).values()), key=lambda p: p.last_used)
+    freed = 0
+    for i, pager in enumerate(pagers):
+        if freed >= excess:
+            break
+        freed += pager.trim(keep=1 if i == len(pagers) - 1 else 0)
+    return freed
+
+
+class MemoryBudget:
+    """
+    Shared byte budget over registered stores and reporting sessions.
+
+    A store is any object with nbytes(), oldest() (last use, in
+    time.monotonic seconds, of its least recently used entry, or None when
+    empty) and evict_oldest() (returns the bytes released) plus a `budget`
+    attribute it calls enforce() on after storing.
+    """
+
+    def __init__(self, max_bytes: int, session_max_bytes: int = 0, session_ttl: float = SESSION_TTL_S):
+        self.max_bytes = max_bytes
+        self.session_max_bytes = session_max_bytes
+        self.session_ttl = session_ttl
+        self.evictions = 0
+        self.evicted_bytes = 0
+        self._stores: dict[str, object] = {}
+        self._sessions: dict[str, tuple[int, float]] = {}  # id -> (bytes, last report)
+        self._lock = threading.Lock()
+        self._enforce_lock = threading.Lock()
+
+    def register(self, name: str, store):
+        store.budget = self
+        with self._lock:
+            self._stores[name] = store
+        self.enforce()
+
+    # -- sessions -------------------------------------------------------------
+    def account(self, session_id: str, state: Mapping) -> dict[str, int]:
+        """
+        Measure one session's state, trim it to `session_max_bytes` and
+        report it. Returns bytes per session_state key.
+        """
+        usage = session_usage(state)
+        total = sum(usage.values())
+        if self.session_max_bytes and total > self.session_max_bytes:
+            trim_pagers(state, total - self.session_max_bytes)
+            usage = session_usage(state)
+        self.report_session(session_id, sum(usage.values()))
+        return usage
+
+    def report_session(self, session_id: str, nbytes: int):
+        now = time.monotonic()
+        with self._lock:
+            self._sessions[session_id] = (nbytes, now)
+            for sid in [s for s, (_, seen) in self._sessions.items() if now - seen > self.session_ttl]:
+                del self._sessions[sid]
+        self.enforce()
+
+    def forget_session(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    # -- budget ---------------------------------------------------------------
+    def _used(self) -> tuple[dict[str, int], int]:
+        with self._lock:
+            stores = {name: store.nbytes() for name, store in self._stores.items()}
+            sessions = sum(b for b, _ in self._sessions.values())
+        return stores, sessions
+
+    def enforce(self) -> int:
+        """
+        Evict least recently used entries across stores until the budget
+        holds (or nothing evictable is left); returns the bytes released.
+        """
+        freed = 0
+        with self._enforce_lock:
+            while True:
+                stores, sessions = self._used()
+                if sum(stores.values()) + sessions <= self.max_bytes:
+                    break
+                with self._lock:
+                    candidates = [(s.oldest(), name, s) for name, s in self._stores.items()]
+                candidates = [c for c in candidates if c[0] is not None]
+                if not candidates:
+                    break
+                released = min(candidates, key=lambda c: c[0])[2].evict_oldest()
+                if not released:
+                    break
+                freed += released
+                self.evictions += 1
+        self.evicted_bytes += freed
+        return freed
+
+    def summary(self) -> dict:
+        stores, sessions = self._used()
+        with self._lock:
+            n_sessions = len(self._sessions)
+        return {"max_bytes": self.max_bytes, "used": sum(stores.values()) + sessions, "stores": stores,
+                "sessions": n_sessions, "session_bytes": sessions, "session_max_bytes": self.session_max_bytes,
+                "evictions": self.evictions, "evicted_bytes": self.evicted_bytes}
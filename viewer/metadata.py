@@ -0,0 +1,72 @@
+"""
+Metadata bootstrap and concurrent query execution.
+
+The lookups the dashboard needs before it can paint (does the Ads view
+exist, its date bounds, the schema list) are independent, so they are
+issued together on a shared thread pool instead of one round trip after
+another.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from viewer.queries import ADS_SCOPE, ADS_VIEW
+from viewer.rollups import AVAILABLE_ROLLUPS_SQL, DIMENSION_LIST, ROLLUPS, TRIGRAM_AVAILABLE_SQL
+
+ADS_VIEW_EXISTS_SQL = """
+SELECT EXISTS (
+    SELECT 1 FROM information_schema.views
+    WHERE table_schema = 'public' AND table_name = 'vw_sp_campaign_metrics_per_product'
+) AS exists_view;
+"""
+
+# Date bounds only: filter options are searched on demand (viewer.dimensions)
+ADS_META_SQL = f"""
+SELECT MIN(date) AS min_date,
+       MAX(date) AS max_date
+FROM {ADS_VIEW};
+"""
+
+SCHEMAS_SQL = """
+SELECT nspname AS schema_name
+FROM pg_namespace
+WHERE nspname NOT IN ('pg_catalog','information_schema')
+ORDER BY 1;
+"""
+
+TABLES_SQL = """
+SELECT tablename FROM pg_tables WHERE schemaname = :s ORDER BY 1;
+"""
+
+
+def boot_queries(schema: str = "public") -> dict[str, tuple[str, dict | None, tuple[str, ...] | None]]:
+    """
+    name -> (sql, params, watermark scope) of every bootstrap lookup; the
+    dashboard and the cache warmer (viewer.warmup) issue the same statements.
+    """
+    return {
+        "exists": (ADS_VIEW_EXISTS_SQL, None, None),
+        "ads_meta": (ADS_META_SQL, None, ADS_SCOPE),
+        "schemas": (SCHEMAS_SQL, None, None),
+        "tables": (TABLES_SQL, {"s": schema}, None),
+        "rollups": (AVAILABLE_ROLLUPS_SQL, {"names": [r.name for r in ROLLUPS] + [DIMENSION_LIST]}, None),
+        "trgm": (TRIGRAM_AVAILABLE_SQL, None, None),
+    }
+
+
+_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="pgviewer-query")
+
+
+def run_parallel(tasks: dict[str, Callable]) -> dict:
+    """
+    Run independent callables concurrently. Each result is either the
+    callable's return value or the exception it raised; callers decide
+    which failures matter.
+    """
+    futures = {name: _pool.submit(fn) for name, fn in tasks.items()}
+    results = {}
+    for name, fut in futures.items():
+        try:
+            results[name] = fut.result()
+        except Exception as e:
+            results[name] = e
+    return results
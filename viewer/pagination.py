@@ -0,0 +1,160 @@
+"""
+Keyset (seek) pagination for large result sets.
+
+Instead of materializing `SELECT ... LIMIT 100000`, a pager fetches one page
+at a time with `WHERE (key) > (:last_key) ORDER BY key LIMIT :n`, which is a
+single indexed range scan no matter how deep the page is.
+"""
+import time
+from collections import OrderedDict
+from typing import Callable
+
+import pandas as pd
+
+from viewer.cache import frame_nbytes
+from viewer.sql import quote_ident
+
+Fetch = Callable[[str, dict], pd.DataFrame]
+
+
+class KeysetPager:
+    """
+    Pages through `relation` ordered by `key` (which must be unique; use
+    ctid when a table has no primary key). Key columns that can be NULL are
+    listed in `nullable` with a stand-in value of the same type: they sort
+    as (col IS NULL, COALESCE(col, stand-in)), so NULLs sort last and the
+    row comparison never evaluates to NULL.
+
+    The last key of every visited page is remembered so that moving to the
+    next or previous page costs one query; the most recent pages are kept
+    in a small LRU so flipping back and forth does not hit the database.
+    """
+
+    def __init__(self, relation: str, key: tuple[str, ...], columns: str = "*",
+                 where: str = "1=1", params: dict | None = None,
+                 page_size: int = 500, cache_pages: int = 5, nullable: dict | None = None):
+        self.relation = relation
+        self.key = tuple(key)
+        self.nullable = dict(nullable or {})
+        self.columns = columns
+        self.where = where
+        self.params = dict(params or {})
+        self.page_size = int(page_size)
+        self.cache_pages = cache_pages
+        self._bounds: dict[int, tuple] = {}  # page index -> last key on that page
+        self._pages: OrderedDict[int, pd.DataFrame] = OrderedDict()
+        self.last_used = time.monotonic()
+
+    # -- SQL --------------------------------------------------------------
+    def _key_expr(self, params: dict) -> str:
+        terms = []
+        for i, k in enumerate(self.key):
+            if k == "ctid":
+                terms.append("ctid")
+            elif k in self.nullable:
+                params[f"_n{i}"] = self.nullable[k]
+                terms += [f"({quote_ident(k)} IS NULL)", f"COALESCE({quote_ident(k)}, :_n{i})"]
+            else:
+                terms.append(quote_ident(k))
+        return ", ".join(terms)
+
+    def _after_clause(self, after: tuple | None, params: dict) -> str:
+        if after is None:
+            return ""
+        names = []
+        for i, (k, v) in enumerate(zip(self.key, after)):
+            if k in self.nullable:
+                params[f"_k{i}_null"] = v is None
+                params[f"_k{i}"] = self.nullable[k] if v is None else v
+                names += [f":_k{i}_null", f":_k{i}"]
+            else:
+                params[f"_k{i}"] = v
+                names.append(f"CAST(:_k{i} AS tid)" if k == "ctid" else f":_k{i}")
+        return f" AND ({self._key_expr(params)}) > ({', '.join(names)})"
+
+    def _select_list(self) -> str:
+        # ctid is read back under another name: an output column called
+        # "ctid" would make ORDER BY sort by its text form.
+        if "ctid" in self.key:
+            return f"ctid::text AS _ctid, {self.columns}"
+        return self.columns
+
+    def page_sql(self, after: tuple | None) -> tuple[str, dict]:
+        params = dict(self.params)
+        sql = (
+            f"SELECT {self._select_list()} FROM {self.relation} "
+            f"WHERE {self.where}{self._after_clause(after, params)} "
+            f"ORDER BY {self._key_expr(params)} LIMIT {self.page_size};"
+        )
+        return sql, params
+
+    def _seek_sql(self, after: tuple | None, skip: int) -> tuple[str, dict]:
+        # Key-only probe used when jumping past pages we have not visited;
+        # with a matching index this is an index-only scan.
+        params = dict(self.params)
+        keys = ", ".join("ctid::text AS _ctid" if k == "ctid" else quote_ident(k) for k in self.key)
+        sql = (
+            f"SELECT {keys} FROM {self.relation} "
+            f"WHERE {self.where}{self._after_clause(after, params)} "
+            f"ORDER BY {self._key_expr(params)} LIMIT 1 OFFSET {int(skip)};"
+        )
+        return sql, params
+
+    # -- Paging -----------------------------------------------------------
+    def _last_key(self, df: pd.DataFrame) -> tuple:
+        cols = ["_ctid" if k == "ctid" else k for k in self.key]
+        # pd.NA / NaT / NaN (Arrow-backed or float columns) go back to the driver as NULL
+        return tuple(None if pd.isna(v) else v for v in (df[c].iloc[-1:].tolist()[0] for c in cols))
+
+    def _start_after(self, n: int, fetch: Fetch) -> tuple | None:
+        """
+        Key that page `n` starts after (None for the first page).
+        """
+        if n == 0:
+            return None
+        if n - 1 in self._bounds:
+            return self._bounds[n - 1]
+        known = [i for i in self._bounds if i < n - 1]
+        base = max(known) if known else -1
+        after = self._bounds[base] if base >= 0 else None
+        skip = (n - 1 - base) * self.page_size - 1
+        probe = fetch(*self._seek_sql(after, skip))
+        if probe.empty:
+            return None
+        self._bounds[n - 1] = self._last_key(probe)
+        return self._bounds[n - 1]
+
+    def page(self, n: int, fetch: Fetch) -> pd.DataFrame:
+        """
+        Return page `n` (0-based). Past the end an empty frame is returned.
+        """
+        self.last_used = time.monotonic()
+        if n in self._pages:
+            self._pages.move_to_end(n)
+            return self._pages[n]
+        after = self._start_after(n, fetch)
+        if n > 0 and after is None:
+            return pd.DataFrame()
+        df = fetch(*self.page_sql(after))
+        if not df.empty:
+            self._bounds[n] = self._last_key(df)
+        if "_ctid" in df.columns:
+            df = df.drop(columns="_ctid")
+        self._pages[n] = df
+        while len(self._pages) > self.cache_pages:
+            self._pages.popitem(last=False)
+        return df
+
+    # -- accounting (viewer.memory) ------------------------------------------
+    def nbytes(self) -> int:
+        return sum(frame_nbytes(df) for df in self._pages.values())
+
+    def trim(self, keep: int = 0) -> int:
+        """
+        Drop cached pages down to the `keep` most recent; returns the bytes
+        released. Page bounds are kept, so revisiting costs one query.
+        """
+        freed = 0
+        while len(self._pages) > keep:
+            freed += frame_nbytes(self._pages.popitem(last=False)[1])
+        return freed
@@ -0,0 +1,44 @@
+"""
+Postgres type OID -> Arrow type mapping.
+
+Only the built-in types that show up in our tables (and one-dimensional
+arrays of them) are listed; anything else (json, uuid, intervals...) is
+carried as text.
+"""
+import pyarrow as pa
+
+_OID_TO_ARROW = {
+    16: pa.bool_(),                        # bool
+    20: pa.int64(),                        # int8
+    21: pa.int16(),                        # int2
+    23: pa.int32(),                        # int4
+    26: pa.int64(),                        # oid
+    700: pa.float32(),                     # float4
+    701: pa.float64(),                     # float8
+    1700: pa.float64(),                    # numeric (money values; float64 is enough for display/analysis)
+    1082: pa.date32(),                     # date
+    1114: pa.timestamp("us"),              # timestamp
+    1184: pa.timestamp("us", tz="UTC"),    # timestamptz
+}
+
+# Array OIDs of the types above (plus text-like element types)
+_ARRAY_OID_TO_ELEMENT = {
+    1000: 16, 1016: 20, 1005: 21, 1007: 23, 1021: 700, 1022: 701, 1231: 1700,
+    1182: 1082, 1115: 1114, 1185: 1184,
+    1009: 25, 1015: 25, 1014: 25, 1003: 25,  # text[], varchar[], bpchar[], name[]
+}
+
+
+def arrow_type_for_oid(oid: int, arrays: bool = True) -> pa.DataType:
+    if oid in _ARRAY_OID_TO_ELEMENT:
+        return pa.list_(arrow_type_for_oid(_ARRAY_OID_TO_ELEMENT[oid])) if arrays else pa.string()
+    return _OID_TO_ARROW.get(oid, pa.string())
+
+
+def arrow_schema(description, arrays: bool = True) -> pa.Schema:
+    """
+    Build a schema from a DB-API cursor.description. With `arrays=False`
+    array columns stay text (their Postgres literal), for readers that
+    cannot build lists, such as pyarrow's CSV reader.
+    """
+    return pa.schema([pa.field(col.name, arrow_type_for_oid(col.type_code, arrays)) for col in description])
@@ -0,0 +1,145 @@
+"""
+Process-wide connection pool registry.
+
+One Engine per normalized DSN, however the DSN was entered (DATABASE_URL or
+the individual fields) and however many sessions use it. Pools are sized
+from the environment and kept healthy by a background liveness thread
+instead of pool_pre_ping, which costs a round trip on every checkout.
+
+In PgBouncer mode (transaction pooling) the app keeps no pool of its own:
+PgBouncer already multiplexes server connections, and holding idle client
+connections here would only pin them. Nothing in the viewer relies on
+session state surviving a transaction (timeouts are set with
+set_config(..., true), server-side cursors live inside one transaction).
+"""
+import os
+import threading
+import time
+from dataclasses import dataclass
+
+from sqlalchemy import create_engine
+from sqlalchemy.engine import URL, Engine, make_url
+from sqlalchemy.pool import NullPool
+
+_DRIVERS = {"postgres": "postgresql+psycopg2", "postgresql": "postgresql+psycopg2"}
+
+
+@dataclass(frozen=True)
+class PoolSettings:
+    pool_size: int = 8          # matches the run_parallel worker count
+    max_overflow: int = 8
+    pool_recycle: int = 1800
+    pool_timeout: int = 30
+    liveness_interval: float = 30.0
+    pgbouncer: bool = False
+
+    @classmethod
+    def from_env(cls) -> "PoolSettings":
+        env = os.environ.get
+        return cls(
+            pool_size=int(env("VIEWER_POOL_SIZE", cls.pool_size)),
+            max_overflow=int(env("VIEWER_POOL_MAX_OVERFLOW", cls.max_overflow)),
+            pool_recycle=int(env("VIEWER_POOL_RECYCLE_S", cls.pool_recycle)),
+            pool_timeout=int(env("VIEWER_POOL_TIMEOUT_S", cls.pool_timeout)),
+            liveness_interval=float(env("VIEWER_POOL_LIVENESS_S", cls.liveness_interval)),
+            pgbouncer=env("VIEWER_PGBOUNCER", "0") == "1",
+        )
+
+
+def normalize_url(url: str | URL) -> URL:
+    """
+    Canonical form of a DSN: explicit psycopg2 driver, default port, sorted
+    query options. Equal connections get equal URLs.
+    """
+    url = make_url(url)
+    url = url.set(drivername=_DRIVERS.get(url.drivername, url.drivername))
+    if url.port is None and url.host:
+        url = url.set(port=5432)
+    return url.set(query=dict(sorted(url.query.items())))
+
+
+def build_url(host: str, port: str | int, database: str, user: str, password: str | None) -> URL:
+    # URL.create quotes special characters in the password, unlike an f-string
+    return normalize_url(URL.create("postgresql+psycopg2", username=user or None, password=password or None,
+                                    host=host or None, port=int(port) if port else None,
+                                    database=database or None))
+
+
+class LivenessChecker(threading.Thread):
+    """
+    Every `interval` seconds, ping each idle pooled connection once.
+
+    QueuePool hands connections out FIFO, so checking out and returning
+    `checkedin()` connections one after another visits each idle connection.
+    A ping that fails with a disconnect makes SQLAlchemy invalidate the whole
+    pool, so the next user checkout reconnects instead of erroring.
+    """
+
+    def __init__(self, engine: Engine, interval: float):
+        super().__init__(daemon=True, name="pgviewer-liveness")
+        self.engine = engine
+        self.interval = interval
+        self.last_check = None
+        self.last_error = None
+
+    def check(self):
+        for _ in range(max(self.engine.pool.checkedin(), 1)):
+            with self.engine.connect() as conn:
+                conn.exec_driver_sql("SELECT 1")
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.check()
+                self.last_error = None
+            except Exception as exc:  # the pool has been invalidated; the next check reconnects
+                self.last_error = str(exc)
+            self.last_check = time.time()
+
+
+class EngineRegistry:
+    def __init__(self, settings: PoolSettings | None = None):
+        self.settings = settings or PoolSettings()
+        self._engines: dict[str, Engine] = {}
+        self._checkers: dict[str, LivenessChecker] = {}
+        self._lock = threading.Lock()
+
+    def get(self, url: str | URL) -> Engine:
+        url = normalize_url(url)
+        key = url.render_as_string(hide_password=False)
+        with self._lock:
+            engine = self._engines.get(key)
+            if engine is None:
+                engine = self._engines[key] = self._create(url)
+                if not self.settings.pgbouncer and self.settings.liveness_interval > 0:
+                    checker = self._checkers[key] = LivenessChecker(engine, self.settings.liveness_interval)
+                    checker.start()
+            return engine
+
+    def _create(self, url: URL) -> Engine:
+        s = self.settings
+        connect_args = {
+            "application_name": "pgviewer",
+            # let the kernel notice dead peers between liveness checks
+            "keepalives": 1, "keepalives_idle": 30, "keepalives_interval": 10, "keepalives_count": 3,
+        }
+        if s.pgbouncer:
+            return create_engine(url, poolclass=NullPool, connect_args=connect_args)
+        return create_engine(url, pool_size=s.pool_size, max_overflow=s.max_overflow,
+                             pool_recycle=s.pool_recycle, pool_timeout=s.pool_timeout,
+                             connect_args=connect_args)
+
+    def summary(self) -> list[dict]:
+        with self._lock:
+            items = list(self._engines.items())
+        out = []
+        for key, engine in items:
+            checker = self._checkers.get(key)
+            out.append({
+                "dsn": engine.url.render_as_string(hide_password=True),
+                "pool": engine.pool.status(),
+                "last_liveness": checker.last_check if checker else None,
+                "liveness_error": checker.last_error if checker else None,
+            })
+        return out
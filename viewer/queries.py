@@ -0,0 +1,105 @@
+"""
+SQL builders for the Ads metrics tab (vw_sp_campaign_metrics_per_product).
+
+Totals and bucketed series are aggregated by Postgres; only the detail table
+needs product-level rows, and it is fetched separately.
+"""
+from dataclasses import dataclass
+
+from viewer.buckets import BUCKET_UNITS
+
+ADS_VIEW = "public.vw_sp_campaign_metrics_per_product"
+# Relations whose modifications invalidate cached Ads results
+ADS_SCOPE = (ADS_VIEW,)
+
+DIMENSION_COLUMNS = ("date", "campaign_id", "campaign_name", "advertised_asin", "advertised_sku")
+METRIC_COLUMNS = ("impressions", "clicks", "spend", "sales_14d", "conv_14d")
+# Keyset for the detail table: every column the view groups by, in the
+# finest rollup's unique index order. All but date can be NULL; the values
+# stand in for NULL when seeking (see KeysetPager).
+DETAIL_KEY = ("date", "campaign_id", "advertised_asin", "advertised_sku", "campaign_name")
+DETAIL_NULLABLE = {"campaign_id": 0, "advertised_asin": "", "advertised_sku": "", "campaign_name": ""}
+
+
+@dataclass(frozen=True)
+class AdsFilters:
+    """
+    Tab 1 filter set. Hashable, so it can key caches directly.
+    """
+    dstart: str | None = None
+    dend: str | None = None
+    campaigns: tuple[str, ...] = ()
+    asins: tuple[str, ...] = ()
+
+    def where(self) -> tuple[str, dict]:
+        params = {}
+        where = ["1=1"]
+        if self.dstart:
+            where.append("date >= :dstart")
+            params["dstart"] = self.dstart
+        if self.dend:
+            where.append("date <= :dend")
+            params["dend"] = self.dend
+        if self.campaigns:
+            where.append("campaign_name = ANY(:camps)")
+            params["camps"] = list(self.campaigns)
+        if self.asins:
+            where.append("advertised_asin = ANY(:asins)")
+            params["asins"] = list(self.asins)
+        return " AND ".join(where), params
+
+    def columns(self) -> set[str]:
+        """
+        Columns the WHERE clause references.
+        """
+        cols = set()
+        if self.dstart or self.dend:
+            cols.add("date")
+        if self.campaigns:
+            cols.add("campaign_name")
+        if self.asins:
+            cols.add("advertised_asin")
+        return cols
+
+
+def _sum_columns() -> str:
+    return ",\n           ".join(f"COALESCE(SUM({c}), 0) AS {c}" for c in METRIC_COLUMNS)
+
+
+def series_sql(filters: AdsFilters, relation: str = ADS_VIEW, unit: str = "day") -> tuple[str, dict]:
+    """
+    One row per `unit` bucket (viewer.buckets), truncated by Postgres, with
+    the number of days it covers and, through LAG, the previous bucket's
+    values for period-over-period comparison.
+    """
+    if unit not in BUCKET_UNITS:
+        raise ValueError(f"Agrupamento desconhecido: {unit}")
+    where, params = filters.where()
+    lags = ",\n           ".join(f"LAG({c}) OVER w AS {c}_prev" for c in ("days",) + METRIC_COLUMNS)
+    sql = f"""
+    SELECT date, days, {', '.join(METRIC_COLUMNS)},
+           {lags}
+    FROM (
+        SELECT date_trunc('{unit}', date::timestamp)::date AS date,
+               COUNT(DISTINCT date) AS days,
+               {_sum_columns()}
+        FROM {relation}
+        WHERE {where}
+        GROUP BY 1
+    ) buckets
+    WINDOW w AS (ORDER BY date)
+    ORDER BY date ASC;
+    """
+    return sql, params
+
+
+def detail_sql(filters: AdsFilters, relation: str = ADS_VIEW) -> tuple[str, dict]:
+    where, params = filters.where()
+    sql = f"""
+    SELECT {', '.join(DIMENSION_COLUMNS + METRIC_COLUMNS)}
+    FROM {relation}
+    WHERE {where}
+    ORDER BY date ASC;
+    """
+    return sql, params
+
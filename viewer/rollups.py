@@ -0,0 +1,192 @@
+"""
+App-managed materialized rollups of vw_sp_campaign_metrics_per_product.
+
+The view re-aggregates ads_sp_advertised_product_daily on every query.
+Three materialized views (day x campaign x ASIN, day x campaign, day) hold
+the same sums pre-aggregated, each built from the next finer one, and every
+Tab 1 query is routed to the coarsest rollup that still has the columns it
+filters and groups on. Without populated rollups queries use the live view.
+
+A fourth, much smaller view lists every campaign x ASIN pair with its
+active date span and spend; it backs the filter typeahead
+(viewer.dimensions).
+"""
+import threading
+import time
+from dataclasses import dataclass
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from viewer.queries import ADS_VIEW, DIMENSION_COLUMNS, METRIC_COLUMNS, AdsFilters
+
+# Arbitrary constant for pg_try_advisory_lock, so only one process refreshes at a time
+REFRESH_LOCK_KEY = 7_311_001
+
+
+@dataclass(frozen=True)
+class Rollup:
+    name: str
+    dimensions: tuple[str, ...]
+    source: str
+    # Unique index columns, ordered to also serve the detail keyset
+    unique_key: tuple[str, ...]
+    indexes: tuple[tuple[str, ...], ...] = ()
+    # Column groups with extended ndistinct statistics, for GROUP BY estimates
+    statistics: tuple[tuple[str, ...], ...] = ()
+
+    @property
+    def short_name(self) -> str:
+        return self.name.split(".", 1)[1]
+
+
+# Finest first: each rollup is built from the previous one
+ROLLUPS = (
+    Rollup("public.mv_sp_ads_daily_campaign_asin", DIMENSION_COLUMNS, ADS_VIEW,
+           unique_key=("date", "campaign_id", "advertised_asin", "advertised_sku", "campaign_name"),
+           indexes=(("campaign_name", "date"), ("advertised_asin", "date")),
+           # the campaign x ASIN breakdown hashes into as many groups as there are pairs,
+           # far fewer than the product of the per-column estimates
+           statistics=(("campaign_name", "advertised_asin"),)),
+    Rollup("public.mv_sp_ads_daily_campaign", ("date", "campaign_id", "campaign_name"),
+           "public.mv_sp_ads_daily_campaign_asin",
+           unique_key=("date", "campaign_id", "campaign_name"),
+           indexes=(("campaign_name", "date"),)),
+    Rollup("public.mv_sp_ads_daily", ("date",), "public.mv_sp_ads_daily_campaign",
+           unique_key=("date",)),
+)
+
+DIMENSION_LIST = "public.mv_sp_ads_dim_campaign_asin"
+
+TRIGRAM_AVAILABLE_SQL = "SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm') AS trgm;"
+
+AVAILABLE_ROLLUPS_SQL = """
+SELECT schemaname || '.' || matviewname AS name
+FROM pg_matviews
+WHERE ispopulated AND schemaname || '.' || matviewname = ANY(:names);
+"""
+
+
+def create_sql(rollup: Rollup) -> list[str]:
+    dims = ", ".join(rollup.dimensions)
+    sums = ", ".join(f"SUM({c}) AS {c}" for c in METRIC_COLUMNS)
+    stmts = [
+        f"CREATE MATERIALIZED VIEW IF NOT EXISTS {rollup.name} AS "
+        f"SELECT {dims}, {sums} FROM {rollup.source} GROUP BY {dims} WITH NO DATA",
+        f"CREATE UNIQUE INDEX IF NOT EXISTS {rollup.short_name}_uq ON {rollup.name} ({', '.join(rollup.unique_key)})",
+    ]
+    for cols in rollup.indexes:
+        stmts.append(f"CREATE INDEX IF NOT EXISTS {rollup.short_name}_{'_'.join(cols)}_idx "
+                     f"ON {rollup.name} ({', '.join(cols)})")
+    for cols in rollup.statistics:
+        stmts.append(f"CREATE STATISTICS IF NOT EXISTS {rollup.short_name}_{'_'.join(cols)}_stx (ndistinct) "
+                     f"ON {', '.join(cols)} FROM {rollup.name}")
+    return stmts
+
+
+def dimension_list_sql(trigram: bool) -> list[str]:
+    short = DIMENSION_LIST.split(".", 1)[1]
+    stmts = [
+        f"CREATE MATERIALIZED VIEW IF NOT EXISTS {DIMENSION_LIST} AS "
+        f"SELECT campaign_name, advertised_asin, MIN(date) AS first_date, MAX(date) AS last_date, "
+        f"SUM(spend) AS spend FROM {ROLLUPS[0].name} GROUP BY campaign_name, advertised_asin WITH NO DATA",
+        f"CREATE UNIQUE INDEX IF NOT EXISTS {short}_uq ON {DIMENSION_LIST} (campaign_name, advertised_asin)",
+    ]
+    for col in ("campaign_name", "advertised_asin"):
+        # lower(col) LIKE 'abc%' can use a text_pattern_ops index under any collation
+        stmts.append(f"CREATE INDEX IF NOT EXISTS {short}_{col}_prefix_idx "
+                     f"ON {DIMENSION_LIST} (lower({col}) text_pattern_ops)")
+        if trigram:
+            # on lower(col) too: substring search filters on lower(col) LIKE '%abc%'
+            stmts.append(f"DROP INDEX IF EXISTS {short}_{col}_trgm_idx")
+            stmts.append(f"CREATE INDEX IF NOT EXISTS {short}_{col}_lower_trgm_idx "
+                         f"ON {DIMENSION_LIST} USING gin (lower({col}) gin_trgm_ops)")
+    return stmts
+
+
+def route(filters: AdsFilters, columns: set[str], available: set[str]) -> str:
+    """
+    Coarsest populated rollup that has every column the query filters on or
+    returns; the live view otherwise.
+    """
+    needed = set(columns) | filters.columns()
+    for rollup in reversed(ROLLUPS):
+        if rollup.name in available and needed <= set(rollup.dimensions):
+            return rollup.name
+    return ADS_VIEW
+
+
+def _create_rollups(conn):
+    for rollup in ROLLUPS:
+        for stmt in create_sql(rollup):
+            conn.execute(text(stmt))
+    # pg_trgm is used when installed, never installed here (it needs superuser on most hosts)
+    trigram = conn.execute(text(TRIGRAM_AVAILABLE_SQL)).scalar()
+    for stmt in dimension_list_sql(trigram):
+        conn.execute(text(stmt))
+
+
+def refresh_rollups(engine: Engine) -> bool:
+    """
+    Create any missing rollup, then refresh every rollup, finest first, and
+    the dimension list. The session-level refresh lock is held throughout,
+    but each view is refreshed and analyzed in its own transaction, so its
+    locks and snapshot last one view and a failure keeps the views already
+    refreshed. Returns False when another process holds the lock.
+    """
+    with engine.connect() as conn:
+        locked = conn.execute(text("SELECT pg_try_advisory_lock(:k)"), {"k": REFRESH_LOCK_KEY}).scalar()
+        conn.commit()
+        if not locked:
+            return False
+        try:
+            names = [r.name for r in ROLLUPS] + [DIMENSION_LIST]
+            with conn.begin():
+                _create_rollups(conn)
+                populated = set(conn.execute(text(AVAILABLE_ROLLUPS_SQL), {"names": names}).scalars())
+            for name in names:
+                # CONCURRENTLY needs an already populated view
+                mode = "CONCURRENTLY " if name in populated else ""
+                with conn.begin():
+                    conn.execute(text(f"REFRESH MATERIALIZED VIEW {mode}{name}"))
+                    # fresh statistics (extended ones included) for the queries routed here
+                    conn.execute(text(f"ANALYZE {name}"))
+        finally:
+            # a broken connection has lost the lock along with the session
+            if not conn.invalidated:
+                conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": REFRESH_LOCK_KEY})
+                conn.commit()
+    return True
+
+
+class RollupRefresher:
+    """
+    Daemon thread that creates the rollups once and refreshes them every
+    `interval` seconds.
+    """
+
+    def __init__(self, engine: Engine, interval: float):
+        self.engine = engine
+        self.interval = interval
+        self.last_refresh: float | None = None
+        self.last_duration: float | None = None
+        self.last_error: str | None = None
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="pgviewer-rollups", daemon=True)
+        self._thread.start()
+
+    def refresh_now(self):
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            t0 = time.monotonic()
+            try:
+                if refresh_rollups(self.engine):
+                    self.last_refresh = time.time()
+                    self.last_duration = time.monotonic() - t0
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+            self._wake.wait(self.interval)
+            self._wake.clear()
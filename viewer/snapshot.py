@@ -0,0 +1,436 @@
+"""
+Local Parquet snapshot of the heavy relations, queried with DuckDB.
+
+A daemon thread exports the Ads view, mv_unified_sales_daily and any
+configured tables to `<directory>/<schema>.<name>/<YYYY-MM>.parquet`, one
+file per month of their date column (tables without one go to a single
+`all.parquet`). After the first export only the months from the last
+exported date minus `restate_days` onwards are re-read, and a relation is
+skipped entirely while its data watermark has not moved. Each file is
+written to a temp name and renamed into place, so readers never see a
+partial month.
+
+SnapshotQuery runs free SQL against those files in an embedded DuckDB,
+with the same interface as viewer.adhoc.AdhocQuery, so heavy aggregations
+use local cores instead of the Postgres the sync services write to.
+
+duckdb is only imported when a snapshot is queried.
+"""
+import importlib.util
+import json
+import os
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from datetime import date, timedelta
+
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from viewer.cache import Watermarks, frame_nbytes
+from viewer.compact import compact_frame
+from viewer.export import EXPORT_DIR, EXPORT_FORMATS
+from viewer.queries import ADS_VIEW
+from viewer.sql import DUCKDB_ROW_RETURNING, qualified, quote_ident
+
+# Arbitrary constant for pg_try_advisory_xact_lock, so only one process exports at a time
+SNAPSHOT_LOCK_KEY = 7_311_002
+MANIFEST = "_manifest.json"
+WHOLE_FILE = "all"
+
+
+@dataclass(frozen=True)
+class SnapshotSource:
+    relation: str
+    # Partitioning column; None exports the relation whole
+    date_column: str | None = "date"
+
+
+DEFAULT_SOURCES = (
+    SnapshotSource(ADS_VIEW, "date"),
+    SnapshotSource("public.mv_unified_sales_daily", "sale_date"),
+)
+
+
+def parse_sources(spec: str) -> list[SnapshotSource]:
+    """
+    Extra sources from a comma-separated "schema.table[:date_column]" list
+    (an unqualified table is taken from public).
+    """
+    sources = []
+    for item in filter(None, (s.strip() for s in spec.split(","))):
+        relation, _, column = item.partition(":")
+        if "." not in relation:
+            relation = f"public.{relation}"
+        sources.append(SnapshotSource(relation, column.strip() or None))
+    return sources
+
+
+def _literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def duckdb_available() -> bool:
+    return importlib.util.find_spec("duckdb") is not None
+
+
+def month_start(d: date) -> date:
+    return d.replace(day=1)
+
+
+def next_month(d: date) -> date:
+    return (d.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+class SnapshotStore:
+    """
+    The snapshot directory: its manifest and the DuckDB views over it.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def relation_dir(self, relation: str) -> str:
+        return os.path.join(self.directory, relation)
+
+    def manifest(self) -> dict:
+        try:
+            with open(os.path.join(self.directory, MANIFEST)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save_manifest(self, manifest: dict):
+        path = os.path.join(self.directory, MANIFEST)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(manifest, f, indent=1, default=str)
+        os.replace(tmp, path)
+
+    def write_part(self, relation: str, part: str, data) -> int:
+        """
+        Replace one partition file with `data`, a pyarrow Table or a
+        RecordBatchReader (written batch by batch, never held whole); no
+        rows removes it. Returns rows written.
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        folder = self.relation_dir(relation)
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f"{part}.parquet")
+        tmp = os.path.join(folder, f".{part}.{os.getpid()}.tmp")
+        rows = 0
+        try:
+            with pq.ParquetWriter(tmp, data.schema, compression="zstd") as writer:
+                if isinstance(data, pa.Table):
+                    writer.write_table(data)
+                    rows = data.num_rows
+                else:
+                    for batch in data:
+                        writer.write_batch(batch)
+                        rows += batch.num_rows
+        except Exception:
+            os.remove(tmp)
+            raise
+        if rows == 0:
+            os.remove(tmp)
+            if os.path.exists(path):
+                os.remove(path)
+            return 0
+        os.replace(tmp, path)
+        return rows
+
+    def clear_relation(self, relation: str):
+        folder = self.relation_dir(relation)
+        if os.path.isdir(folder):
+            for name in os.listdir(folder):
+                if name.endswith(".parquet"):
+                    os.remove(os.path.join(folder, name))
+
+    def summary(self) -> pd.DataFrame:
+        rows = []
+        for relation, info in sorted(self.manifest().items()):
+            folder = self.relation_dir(relation)
+            files = [os.path.join(folder, f) for f in os.listdir(folder) if f.endswith(".parquet")] \
+                if os.path.isdir(folder) else []
+            rows.append({"relação": relation, "até": info.get("exported_through"), "arquivos": len(files),
+                         "mb": round(sum(os.path.getsize(f) for f in files) / 1e6, 2),
+                         "exportado": time.strftime("%d/%m %H:%M", time.localtime(info["exported_at"]))
+                         if info.get("exported_at") else None})
+        return pd.DataFrame(rows, columns=["relação", "até", "arquivos", "mb", "exportado"])
+
+    def connect(self, threads: int | None = None, export_dir: str | None = None):
+        """
+        In-memory DuckDB connection with one view per exported relation,
+        under its Postgres schema (which is also on the search path, so
+        unqualified names resolve as they would in Postgres).
+
+        The connection runs free SQL from viewer users, so once the views
+        exist it is locked down: files only under the snapshot directory
+        (and `export_dir`, for COPY ... TO), no extension installs or loads,
+        and the configuration cannot be changed back.
+        """
+        import duckdb
+
+        con = duckdb.connect(config={"threads": threads} if threads else {})
+        schemas = []
+        for relation in self.manifest():
+            folder = self.relation_dir(relation)
+            if not os.path.isdir(folder) or not any(f.endswith(".parquet") for f in os.listdir(folder)):
+                continue
+            schema, name = relation.split(".", 1)
+            if schema not in schemas:
+                con.execute(f"CREATE SCHEMA IF NOT EXISTS {quote_ident(schema)}")
+                schemas.append(schema)
+            con.execute(f"CREATE VIEW {qualified(schema, name)} AS SELECT * FROM "
+                        f"read_parquet({_literal(os.path.join(folder, '*.parquet'))}, union_by_name = true)")
+        if schemas:
+            con.execute(f"SET search_path = '{','.join(schemas + ['main'])}'")
+        allowed = [os.path.join(os.path.abspath(d), "") for d in (self.directory, export_dir) if d]
+        con.execute("SET allowed_directories = [" + ", ".join(_literal(d) for d in allowed) + "]")
+        for setting in ("enable_external_access", "autoinstall_known_extensions", "autoload_known_extensions"):
+            con.execute(f"SET {setting} = false")
+        con.execute("SET lock_configuration = true")
+        return con
+
+    def export(self, sql: str, fmt: str = "csv") -> str:
+        """
+        Write the full result of `sql` over the snapshot to a temp file (see
+        viewer.export) and return its path.
+        """
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Formato de exportação desconhecido: {fmt}")
+        os.makedirs(EXPORT_DIR, exist_ok=True)
+        fd, path = tempfile.mkstemp(suffix=EXPORT_FORMATS[fmt][1], dir=EXPORT_DIR)
+        os.close(fd)
+        options = {"csv": "FORMAT csv, HEADER true", "csv.gz": "FORMAT csv, HEADER true, COMPRESSION gzip",
+                   "parquet": "FORMAT parquet"}[fmt]
+        con = self.connect(export_dir=EXPORT_DIR)
+        try:
+            con.execute(f"COPY ({sql.strip().rstrip(';')}) TO {_literal(path)} ({options})")
+        except Exception:
+            os.remove(path)
+            raise
+        finally:
+            con.close()
+        return path
+
+
+# -- export --------------------------------------------------------------------
+def _bounds(engine: Engine, source: SnapshotSource, since: date | None) -> tuple:
+    column = quote_ident(source.date_column)
+    where = f" WHERE {column} >= :since" if since else ""
+    with engine.connect() as conn:
+        return conn.execute(text(f"SELECT MIN({column})::date, MAX({column})::date "
+                                 f"FROM {source.relation}{where}"), {"since": since}).one()
+
+
+def export_source(engine: Engine, store: SnapshotStore, source: SnapshotSource, previous: dict,
+                  restate_days: int) -> dict:
+    """
+    Export `source` into `store`, from scratch or from the months touched by
+    the restate window after `previous` (its manifest entry). Returns the
+    new manifest entry.
+    """
+    from viewer.fetch import arrow_batches
+
+    if source.date_column is None:
+        with arrow_batches(engine, f"SELECT * FROM {source.relation}") as reader:
+            rows = store.write_part(source.relation, WHOLE_FILE, reader)
+        return {"date_column": None, "rows": rows}
+
+    through = previous.get("exported_through")
+    since = None
+    if through and previous.get("date_column") == source.date_column:
+        since = month_start(date.fromisoformat(through) - timedelta(days=restate_days))
+    if since is None:
+        store.clear_relation(source.relation)
+    lo, hi = _bounds(engine, source, since)
+    if hi is None:
+        return {**previous, "date_column": source.date_column}
+    column = quote_ident(source.date_column)
+    month, written = month_start(since or lo), 0
+    while month <= hi:
+        upper = next_month(month)
+        with arrow_batches(engine, f"SELECT * FROM {source.relation} WHERE {column} >= :lo AND {column} < :hi",
+                           {"lo": month, "hi": upper}) as reader:
+            written += store.write_part(source.relation, f"{month:%Y-%m}", reader)
+        month = upper
+    return {"date_column": source.date_column, "exported_through": str(hi), "rows": written}
+
+
+class SnapshotExporter:
+    """
+    Daemon thread that exports `sources` (those that exist) into `store`
+    every `interval` seconds.
+    """
+
+    def __init__(self, engine: Engine, store: SnapshotStore, watermarks: Watermarks, interval: float,
+                 sources: tuple[SnapshotSource, ...] = DEFAULT_SOURCES, restate_days: int = 3):
+        self.engine = engine
+        self.store = store
+        self.watermarks = watermarks
+        self.interval = interval
+        self.sources = sources
+        self.restate_days = restate_days
+        self.last_export: float | None = None
+        self.last_duration: float | None = None
+        self.last_rows = 0
+        self.last_error: str | None = None
+        self._full = False
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="pgviewer-snapshot", daemon=True)
+        self._thread.start()
+
+    def export_now(self, full: bool = False):
+        self._full = self._full or full
+        self._wake.set()
+
+    def export_once(self, full: bool = False) -> int | None:
+        """
+        One pass; returns the rows written, or None when another process
+        holds the export lock.
+        """
+        # The lock is transaction-scoped and its transaction stays open for the
+        # whole pass, so it is held on one backend and released even under
+        # PgBouncer transaction pooling (pool.py keeps no session state).
+        with self.engine.begin() as lock:
+            if not lock.execute(text("SELECT pg_try_advisory_xact_lock(:k)"), {"k": SNAPSHOT_LOCK_KEY}).scalar():
+                return None
+            existing = set(lock.execute(text("SELECT r FROM unnest(CAST(:rels AS text[])) AS r "
+                                             "WHERE to_regclass(r) IS NOT NULL"),
+                                        {"rels": [s.relation for s in self.sources]}).scalars())
+            manifest = self.store.manifest()
+            written = 0
+            for source in self.sources:
+                if source.relation not in existing:
+                    continue
+                previous = {} if full else manifest.get(source.relation, {})
+                watermark = self.watermarks.get(self.engine, (source.relation,))
+                if previous.get("watermark") == watermark and previous.get("date_column") == source.date_column:
+                    continue
+                entry = export_source(self.engine, self.store, source, previous, self.restate_days)
+                written += entry.get("rows", 0)
+                manifest[source.relation] = {**entry, "watermark": watermark, "exported_at": time.time()}
+                self.store.save_manifest(manifest)
+        return written
+
+    def _run(self):
+        while True:
+            t0 = time.monotonic()
+            full, self._full = self._full, False
+            try:
+                written = self.export_once(full)
+                if written is not None:
+                    self.last_export = time.time()
+                    self.last_duration = time.monotonic() - t0
+                    self.last_rows = written
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+
+# -- queries -------------------------------------------------------------------
+class SnapshotQuery:
+    """
+    One free SQL statement over the snapshot, run in DuckDB on its own
+    thread. Same interface as viewer.adhoc.AdhocQuery: start(), then poll
+    `state`; cancel() and the timeout interrupt the DuckDB connection.
+    """
+
+    def __init__(self, store: SnapshotStore, sql: str, timeout_s: float = 30, preview_rows: int = 1000,
+                 explain: bool = False):
+        self.store = store
+        self.sql = sql.strip().rstrip(";")
+        self.timeout_s = timeout_s
+        self.preview_rows = preview_rows
+        self.explain = explain
+        self.state = "running"
+        self.preview: pd.DataFrame | None = None
+        self.plan: pd.DataFrame | None = None
+        self.plan_summary: dict = {}
+        self.rows: int | None = None
+        self.error: str | None = None
+        self.pid: int | None = None
+        self.started = time.monotonic()
+        self.finished: float | None = None
+        self._con = None
+        self._cancel_requested = False
+        self._timed_out = False
+        self._thread = threading.Thread(target=self._run, name="pgviewer-snapshot-query", daemon=True)
+
+    def start(self) -> "SnapshotQuery":
+        self._thread.start()
+        return self
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.monotonic()) - self.started
+
+    def cancel(self):
+        if self.state != "running" or self._con is None:
+            return
+        self._cancel_requested = True
+        self._con.interrupt()
+
+    def _timeout(self):
+        if self.state == "running" and self._con is not None:
+            self._timed_out = True
+            self._con.interrupt()
+
+    def _run(self):
+        timer = threading.Timer(self.timeout_s, self._timeout)
+        timer.daemon = True
+        try:
+            self._con = self.store.connect()
+            timer.start()
+            if self.explain:
+                self._run_explain()
+            elif DUCKDB_ROW_RETURNING.match(self.sql):
+                self._run_select()
+            else:
+                self._con.execute(self.sql)
+            self.state = "done"
+        except Exception as e:
+            self.error = f"tempo limite de {self.timeout_s:g}s excedido" if self._timed_out else str(e).strip()
+            self.state = "cancelled" if self._cancel_requested else "error"
+        finally:
+            timer.cancel()
+            self.finished = time.monotonic()
+            if self._con is not None:
+                self._con.close()
+
+    def nbytes(self) -> int:
+        return sum(frame_nbytes(df) for df in (self.preview, self.plan) if df is not None)
+
+    def _run_select(self):
+        reader = self._con.execute(self.sql).to_arrow_reader(min(self.preview_rows, 100_000))
+        batches, rows = [], 0
+        # Batches past the preview are only counted, never converted; the
+        # preview is published as soon as it is complete
+        for batch in reader:
+            if rows < self.preview_rows:
+                batches.append(batch)
+            rows += batch.num_rows
+            if self.preview is None and rows >= self.preview_rows:
+                self.preview = self._preview(batches, reader.schema)
+        if self.preview is None:
+            self.preview = self._preview(batches, reader.schema)
+        self.rows = rows
+
+    def _preview(self, batches, schema) -> pd.DataFrame:
+        import pyarrow as pa
+
+        return compact_frame(pa.Table.from_batches(batches, schema=schema).slice(0, self.preview_rows).to_pandas())
+
+    def _run_explain(self):
+        t0 = time.perf_counter()
+        out = self._con.execute(f"EXPLAIN ANALYZE {self.sql}").fetchall()
+        self.plan = pd.DataFrame({"plano": [line for _, text_plan in out for line in text_plan.splitlines()]})
+        self.plan_summary = {"Execution Time": (time.perf_counter() - t0) * 1000}
@@ -0,0 +1,28 @@
+"""
+Small helpers for composing SQL text safely.
+"""
+import re
+
+
+_ROW_RETURNING = r"^\s*(\(|select\b|with\b|values\b|table\b{})"
+# Statements that return rows, i.e. that can run behind a server-side cursor or Arrow reader
+ROW_RETURNING = re.compile(_ROW_RETURNING.format(""), re.IGNORECASE)
+# DuckDB also runs FROM-first queries (FROM t SELECT ...)
+DUCKDB_ROW_RETURNING = re.compile(_ROW_RETURNING.format(r"|from\b"), re.IGNORECASE)
+
+
+def quote_ident(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def qualified(schema: str, table: str) -> str:
+    return f"{quote_ident(schema)}.{quote_ident(table)}"
+
+
+PRIMARY_KEY_SQL = """
+SELECT a.attname AS column_name
+FROM pg_index i
+JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)
+WHERE i.indrelid = CAST(:rel AS regclass) AND i.indisprimary
+ORDER BY array_position(i.indkey::int2[], a.attnum);
+"""
@@ -0,0 +1,154 @@
+"""
+Background cache warming for the Ads tab.
+
+A daemon thread re-issues, ahead of any user, the statements the Ads tab
+runs for the filter sets most sessions open: the whole period (the tab's
+default) and the last 7, 30 and 90 days, unfiltered and for each of the
+top campaigns by spend over the last 30 days. Everything goes through
+cached_query and the incremental series store with the same SQL text the
+tab builds, so a pass is a round of cache hits unless the data watermark
+has moved; then the stale entries are recomputed here instead of on the
+next interactive request.
+"""
+import threading
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+
+import pandas as pd
+from sqlalchemy.engine import Engine
+
+from viewer.breakdown import BREAKDOWN_COLUMNS, breakdown_sql, split_levels
+from viewer.buckets import resolve_bucket
+from viewer.cache import ResultCache, Watermarks, cached_query, engine_ident
+from viewer.dimensions import options_sql
+from viewer.fetch import read_df
+from viewer.incremental import IncrementalSeries
+from viewer.metadata import boot_queries
+from viewer.queries import AdsFilters, series_sql
+from viewer.rollups import route
+
+# Trailing windows in days; None is the data's whole period
+WARM_WINDOWS = (None, 7, 30, 90)
+TOP_CAMPAIGNS = 5
+TOP_WINDOW_DAYS = 30
+
+
+@dataclass(frozen=True)
+class WarmTarget:
+    filters: AdsFilters
+    unit: str
+    days: int | None
+
+
+def warm_targets(min_date, max_date, campaigns: tuple[str, ...] = ()) -> list[WarmTarget]:
+    """
+    Every window unfiltered and for each campaign in `campaigns`, with the
+    bucket unit the tab picks automatically for it.
+    """
+    first, last = pd.Timestamp(min_date).date(), pd.Timestamp(max_date).date()
+    targets = []
+    for days in WARM_WINDOWS:
+        start = first if days is None else max(first, last - timedelta(days=days - 1))
+        unit, _ = resolve_bucket(start, last, "auto")
+        for selected in ((), *((c,) for c in campaigns)):
+            targets.append(WarmTarget(AdsFilters(str(start), str(last), selected, ()), unit, days))
+    return targets
+
+
+class CacheWarmer:
+    """
+    Daemon thread that warms `cache` (and `series`, when the incremental
+    store is in use) for `engine` every `interval` seconds, with the `how`
+    fetch engine the sessions default to.
+    """
+
+    def __init__(self, engine: Engine, cache: ResultCache, watermarks: Watermarks, how: str, interval: float,
+                 series: IncrementalSeries | None = None, restate_days: int = 3, top: int = TOP_CAMPAIGNS,
+                 metrics=None):
+        self.engine = engine
+        self.cache = cache
+        self.watermarks = watermarks
+        self.how = how
+        self.interval = interval
+        self.series = series
+        self.restate_days = restate_days
+        self.top = top
+        self.metrics = metrics
+        self.targets = 0
+        self.last_pass: float | None = None
+        self.last_duration: float | None = None
+        self.last_recomputed = 0
+        self.last_error: str | None = None
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="pgviewer-warmup", daemon=True)
+        self._thread.start()
+
+    def warm_now(self):
+        self._wake.set()
+
+    def _query(self, sql: str, params: dict | None, scope: tuple[str, ...] | None = None) -> pd.DataFrame:
+        return cached_query(self.cache, self.watermarks, self.engine, sql, params, self.how, scope,
+                            metrics=self.metrics)
+
+    def _warm_target(self, target: WarmTarget, available: set[str], trigram: bool) -> pd.DataFrame:
+        filters = target.filters
+        # Option lists as the tab scopes them: by the period and the other filter's selection
+        for column, scoped in (("campaign_name", AdsFilters(filters.dstart, filters.dend)),
+                               ("advertised_asin", AdsFilters(filters.dstart, filters.dend, filters.campaigns))):
+            sql, params, source = options_sql(column, scoped, "", available, trigram)
+            self._query(sql, params, (source,))
+
+        series_rel = route(filters, {"date"}, available)
+        if self.series is not None:
+            fetch = lambda sql, params=None: read_df(self.engine, sql, params, how=self.how)  # noqa: E731
+            self.series.get(engine_ident(self.engine), filters, fetch,
+                            self.watermarks.get(self.engine, (series_rel,)), self.restate_days, series_rel,
+                            target.unit)
+        else:
+            self._query(*series_sql(filters, series_rel, target.unit), (series_rel,))
+
+        breakdown_rel = route(filters, BREAKDOWN_COLUMNS, available)
+        return self._query(*breakdown_sql(filters, breakdown_rel), (breakdown_rel,))
+
+    def warm_once(self) -> int:
+        """
+        One pass over every target; returns the number of results that had
+        to be recomputed (as counted by the shared cache, so it includes
+        concurrent misses from sessions).
+        """
+        misses = self.cache.stats.misses
+        boot = {name: self._query(*query) for name, query in boot_queries().items()}
+        if not bool(boot["exists"].iloc[0]["exists_view"]) or boot["ads_meta"].empty:
+            return self.cache.stats.misses - misses
+        meta = boot["ads_meta"].iloc[0]
+        if pd.isna(meta["min_date"]) or pd.isna(meta["max_date"]):
+            return self.cache.stats.misses - misses
+        available = set(boot["rollups"]["name"])
+        trigram = bool(boot["trgm"].iloc[0]["trgm"])
+
+        unfiltered = warm_targets(meta["min_date"], meta["max_date"])
+        top = []
+        for target in unfiltered:
+            breakdown = self._warm_target(target, available, trigram)
+            if self.top and target.days == TOP_WINDOW_DAYS:
+                campaigns = split_levels(breakdown)["campaign"].dropna(subset=["campaign_name"])
+                top = campaigns.nlargest(self.top, "spend")["campaign_name"].astype(str).tolist()
+        targets = [t for t in warm_targets(meta["min_date"], meta["max_date"], tuple(top)) if t.filters.campaigns]
+        for target in targets:
+            self._warm_target(target, available, trigram)
+        self.targets = len(unfiltered) + len(targets)
+        return self.cache.stats.misses - misses
+
+    def _run(self):
+        while True:
+            t0 = time.monotonic()
+            try:
+                self.last_recomputed = self.warm_once()
+                self.last_pass = time.time()
+                self.last_duration = time.monotonic() - t0
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+            self._wake.wait(self.interval)
+            self._wake.clear()